@@ -1,18 +1,90 @@
+import os
 import numpy as np
 import torch
-import random
 from torch.utils.data.sampler import Sampler
 import torchvision.transforms
 from PIL import Image
 
+def compute_mean_std(data, axis=0, chunk_size=1024):
+    """
+    Mean and std of data over axis (which must include the first one), computed
+    in chunks along the first axis so memory mapped arrays are never fully loaded.
+    Chunks are merged with the pairwise update of Chan et al.
+    Args:
+        data: numpy array or memmap
+        axis: int or tuple of ints to reduce over
+        chunk_size (int): number of rows read at a time
+    """
+    axis = tuple(np.atleast_1d(axis))
+    assert 0 in axis
+
+    n = 0
+    mean = 0.0
+    m2 = 0.0
+
+    for start in range(0, data.shape[0], chunk_size):
+        chunk = np.asarray(data[start:start + chunk_size], dtype=np.float64)
+        chunk_n = np.prod([chunk.shape[a] for a in axis])
+        chunk_mean = np.mean(chunk, axis=axis, keepdims=True)
+        chunk_m2 = np.sum((chunk - chunk_mean) ** 2, axis=axis, keepdims=True)
+
+        delta = chunk_mean - mean
+        mean = mean + delta * chunk_n / (n + chunk_n)
+        m2 = m2 + chunk_m2 + delta ** 2 * n * chunk_n / (n + chunk_n)
+        n += chunk_n
+
+    mean = np.squeeze(mean, axis=axis)
+    std = np.sqrt(np.squeeze(m2, axis=axis) / n)
+
+    # Keep the precision of floating point data, so normalizing does not upcast it
+    if np.issubdtype(data.dtype, np.floating):
+        mean = mean.astype(data.dtype)
+        std = std.astype(data.dtype)
+
+    return mean, std
+
+
+def load_mean_std(file_name, axis=0):
+    """
+    Mean and std of the array stored in file_name over axis, cached in a sidecar
+    file next to it. The cache is keyed by the array's path, size and modification
+    time, so it is recomputed whenever the array file changes.
+    Args:
+        file_name (str): .npy file with the array
+        axis: int or tuple of ints to reduce over
+    """
+    stats_file_name = '{}.stats.npz'.format(os.path.splitext(file_name)[0])
+    file_stat = os.stat(file_name)
+    key = {
+        'path': os.path.abspath(file_name),
+        'size': file_stat.st_size,
+        'mtime': file_stat.st_mtime_ns,
+        'axis': np.atleast_1d(axis),
+    }
+
+    if os.path.exists(stats_file_name):
+        with np.load(stats_file_name) as stats:
+            if all(k in stats and np.array_equal(stats[k], v) for k, v in key.items()):
+                return stats['mean'], stats['std']
+
+    mean, std = compute_mean_std(np.load(file_name, mmap_mode='r'), axis=axis)
+
+    # Write and rename, so concurrent jobs never read a partial file
+    temp_file_name = '{}.{}.tmp'.format(stats_file_name, os.getpid())
+    with open(temp_file_name, 'wb') as f:
+        np.savez(f, mean=mean, std=std, **key)
+    os.replace(temp_file_name, stats_file_name)
+
+    return mean, std
+
+
 class ImageDataset():
     def __init__(self, file_name, mean=None, std=None):
-        self.pixels = np.load(file_name)
+        self.pixels = np.load(file_name, mmap_mode='r')
         self.use_different_targets = self.pixels.shape[1] == 2
 
         if mean is None:
-            mean = np.mean(self.pixels, axis=tuple(range(self.pixels.ndim-1)))
-            std = np.std(self.pixels, axis=tuple(range(self.pixels.ndim-1)))
+            mean, std = load_mean_std(file_name, axis=tuple(range(self.pixels.ndim-1)))
             std[np.nonzero(std == 0.0)] = 1.0  # nan is because of dividing by zero
         self.mean = mean
         self.std = std
@@ -21,7 +93,7 @@ class ImageDataset():
         
         self.transforms = torchvision.transforms.Compose([
             torchvision.transforms.ToPILImage(),
-            torchvision.transforms.Resize((128, 128), Image.LINEAR),
+            torchvision.transforms.Resize((128, 128), Image.BILINEAR),
             torchvision.transforms.ToTensor(),
             torchvision.transforms.Normalize(self.mean, self.std)
         ])
@@ -56,46 +128,213 @@ class ImageDataset():
         return self.pixels.shape[0]
 
 
+def resize_images(file_name, size=128):
+    """
+    Resizes every image in file_name once, as the Resize of ImageDataset's transforms does,
+    and caches them next to it as uint8 channels first arrays.
+    The cache is rebuilt if it is older than the images.
+    Args:
+        file_name (str): .npy file with N x [tuple_len x] height x width x channels images
+        size (int): height and width of the resized images
+    """
+    resized_file_name = '{}.{}.npy'.format(os.path.splitext(file_name)[0], size)
+    if os.path.exists(resized_file_name) and os.path.getmtime(resized_file_name) >= os.path.getmtime(file_name):
+        return resized_file_name
+
+    pixels = np.load(file_name, mmap_mode='r')
+    n_channels = pixels.shape[-1]
+
+    # Write and rename, so concurrent jobs never read a partial file
+    temp_file_name = '{}.{}.tmp'.format(resized_file_name, os.getpid())
+    resized = np.lib.format.open_memmap(temp_file_name, mode='w+', dtype=np.uint8,
+        shape=pixels.shape[:-3] + (n_channels, size, size))
+
+    for i in np.ndindex(pixels.shape[:-3]):
+        image = Image.fromarray(np.asarray(pixels[i])).resize((size, size), Image.BILINEAR)
+        resized[i] = np.asarray(image).transpose(2, 0, 1)
+
+    resized.flush()
+    del resized
+    os.replace(temp_file_name, resized_file_name)
+
+    return resized_file_name
+
+
+class ResizedImageDataset():
+    """
+    Same batches as ImageDataset, but read from the cache of resize_images,
+    so a batch is only indexed, scaled and normalized instead of going through PIL.
+    """
+    def __init__(self, file_name, mean=None, std=None, size=128):
+        self.pixels = np.load(resize_images(file_name, size), mmap_mode='r')
+        self.use_different_targets = self.pixels.shape[1] == 2
+
+        if mean is None:
+            # The resized images have as many dimensions as the original ones
+            mean, std = load_mean_std(file_name, axis=tuple(range(self.pixels.ndim-1)))
+            std[np.nonzero(std == 0.0)] = 1.0  # nan is because of dividing by zero
+        self.mean = mean
+        self.std = std
+
+        # ToTensor and Normalize folded into one scale and shift per channel, broadcast over height and width
+        self.scale = torch.tensor(1.0 / (255 * self.std), dtype=torch.float32).view(-1, 1, 1)
+        self.shift = torch.tensor(self.mean / self.std, dtype=torch.float32).view(-1, 1, 1)
+
+    def _to_tensor(self, pixels):
+        return torch.from_numpy(np.array(pixels)).float().mul_(self.scale).sub_(self.shift)
+
+    def __getitem__(self, indices):
+        target_idx = indices[0]
+        distractors_idxs = indices[1:]
+
+        distractors = [self._to_tensor(self.pixels[d_idx]) for d_idx in distractors_idxs]
+
+        return (self._to_tensor(self.pixels[target_idx]), distractors, indices)
+
+    def __getitems__(self, indices):
+        # Whole batch at once, indices is the batch_size x (K+1) matrix from ImagesSampler
+        indices = np.asarray(indices)
+        target = self._to_tensor(self.pixels[indices[:, 0]])
+        distractors = self._to_tensor(self.pixels[indices[:, 1:]]) # batch_size x K x [2 x] 3 x size x size
+
+        return (target, distractors, torch.from_numpy(indices))
+
+    def __len__(self):
+        return self.pixels.shape[0]
+
+
+class RawImageDataset():
+    """
+    Serves whole batches of the original uint8 images, for an ImageTransform to
+    resize and normalize them on the training device (see DeviceTransformLoader).
+    """
+    def __init__(self, file_name, mean=None, std=None):
+        self.pixels = np.load(file_name, mmap_mode='r')
+
+        if mean is None:
+            mean, std = load_mean_std(file_name, axis=tuple(range(self.pixels.ndim-1)))
+            std[np.nonzero(std == 0.0)] = 1.0  # nan is because of dividing by zero
+        self.mean = mean
+        self.std = std
+
+    def __getitems__(self, indices):
+        # Whole batch at once, indices is the batch_size x (K+1) matrix from ImagesSampler
+        indices = np.asarray(indices)
+        target = torch.from_numpy(self.pixels[indices[:, 0]])
+        distractors = torch.from_numpy(self.pixels[indices[:, 1:]]) # batch_size x K x [2 x] height x width x 3
+
+        return (target, distractors, torch.from_numpy(indices))
+
+    def __len__(self):
+        return self.pixels.shape[0]
+
+
+class DeviceTransformLoader():
+    """
+    Moves the uint8 batches of data to device and transforms them there,
+    yielding the same (target, distractors, indices) batches as ImageDataset.
+    """
+    def __init__(self, data, transform, device):
+        self.data = data
+        self.device = torch.device(device)
+        self.transform = transform.to(self.device)
+
+    def __iter__(self):
+        for target, distractors, indices in self.data:
+            yield (self.transform(target.to(self.device, non_blocking=True)),
+                self.transform(distractors.to(self.device, non_blocking=True)),
+                indices)
+
+    def __len__(self):
+        return len(self.data)
+
+
+def sample_distractors(rng, n, targets, k, exclude_targets=True):
+    """
+    Draws k distinct distractors for every target at once.
+    Rows that drew the same index twice are redrawn in bulk.
+    Args:
+        rng: numpy RandomState used for the draws
+        n (int): number of images to draw from
+        targets: array with the target index of every row
+        k (int): number of distractors per target
+        exclude_targets (bool): whether a target can be its own distractor
+    """
+    n_choices = n - 1 if exclude_targets else n
+    distractors = rng.randint(n_choices, size=(len(targets), k))
+
+    n_bulk_redraws = 10
+    for _ in range(n_bulk_redraws):
+        sorted_distractors = np.sort(distractors, axis=1)
+        has_repeated = np.any(sorted_distractors[:, 1:] == sorted_distractors[:, :-1], axis=1)
+        if not has_repeated.any():
+            break
+        distractors[has_repeated] = rng.randint(n_choices, size=(has_repeated.sum(), k))
+    else:
+        # Only happens when k is close to n
+        for i in np.nonzero(has_repeated)[0]:
+            distractors[i] = rng.choice(n_choices, k, replace=False)
+
+    if exclude_targets:
+        distractors += distractors >= targets[:, None] # skip the target
+
+    return distractors
+
+
 class ImagesSampler(Sampler):
-    def __init__(self, data_source, k, shuffle):
+    """
+    Yields whole batches of rows [target, distractor_1, ..., distractor_k],
+    so it is used as the batch_sampler of a DataLoader.
+    """
+    def __init__(self, data_source, k, shuffle, batch_size, drop_last=False, seed=None, exclude_targets=True):
         self.n = len(data_source)
         self.k = k
         self.shuffle = shuffle
+        self.batch_size = batch_size
+        self.drop_last = drop_last
+        self.exclude_targets = exclude_targets
+        self.rng = np.random.RandomState(seed)
         assert self.k < self.n
 
     def __iter__(self):
-        indices = []
-
         if self.shuffle:
-            targets = torch.randperm(self.n).tolist()
+            targets = self.rng.permutation(self.n)
         else:
-            targets = list(range(self.n))
+            targets = np.arange(self.n)
 
-        for t in targets:
-            arr = np.zeros(self.k + 1, dtype=int) # distractors + target
-            arr[0] = t
-            distractors = random.sample(range(self.n), self.k)
-            while t in distractors:
-                distractors = random.sample(range(self.n), self.k)
-            arr[1:] = np.array(distractors)
-            
-            indices.append(arr)
+        indices = np.zeros((self.n, self.k + 1), dtype=int) # distractors + target
+        indices[:, 0] = targets
+        indices[:, 1:] = sample_distractors(self.rng, self.n, targets, self.k, self.exclude_targets)
 
-        return iter(indices)
+        return iter([indices[i * self.batch_size:(i + 1) * self.batch_size] for i in range(len(self))])
 
     def __len__(self):
-        return self.n
+        if self.drop_last:
+            return self.n // self.batch_size
+        return (self.n + self.batch_size - 1) // self.batch_size
+
+
+def collate_batch(batch):
+    # Batches returned by __getitems__ are already collated
+    return batch
 
 
 class ImageFeaturesDataset():
-    def __init__(self, features, mean=None, std=None):
+    # features can be a memory mapped array, they are only normalized when a batch is read
+    # If file_name is given, their mean and std are cached next to it
+    def __init__(self, features, mean=None, std=None, file_name=None):
         if mean is None:
-            mean = np.mean(features, axis=0)
-            std = np.std(features, axis=0)
+            if file_name is not None:
+                mean, std = load_mean_std(file_name, axis=0)
+            else:
+                mean, std = compute_mean_std(features, axis=0)
             std[np.nonzero(std == 0.0)] = 1.0  # nan is because of dividing by zero
         self.mean = mean
         self.std = std
-        self.features = (features - self.mean) / (2 * self.std)
+        self.features = features
+
+    def normalize(self, features):
+        return (features - self.mean) / (2 * self.std)
 
     def __getitem__(self, indices):        
         target_idx = indices[0]
@@ -103,25 +342,46 @@ class ImageFeaturesDataset():
         
         distractors = []
         for d_idx in distractors_idxs:
-            distractors.append(self.features[d_idx])
+            distractors.append(self.normalize(self.features[d_idx]))
+
+        return (self.normalize(self.features[target_idx]), distractors, indices)
+
+    def __getitems__(self, indices):
+        # Whole batch at once, indices is the batch_size x (K+1) matrix from ImagesSampler
+        indices = np.asarray(indices)
+        target = torch.from_numpy(self.normalize(self.features[indices[:, 0]]))
+        distractors = torch.from_numpy(self.normalize(self.features[indices[:, 1:]])) # batch_size x K x n_features
 
-        return (self.features[target_idx], distractors, indices)
+        return (target, distractors, torch.from_numpy(indices))
 
     def __len__(self):
         return self.features.shape[0]
 
 
 class ImageFeaturesDatasetZeroShot():
-    def __init__(self, target_features, distractors_features, mean=None, std=None):
+    def __init__(self, target_features, distractors_features, mean=None, std=None, target_file_name=None, distractors_file_name=None):
         if mean is None:
-            mean = (np.mean(target_features, axis=0) + np.mean(distractors_features, axis=0)) / 2
-            std = (np.std(target_features, axis=0) + np.std(distractors_features, axis=0)) / 2
+            if target_file_name is not None:
+                target_mean, target_std = load_mean_std(target_file_name, axis=0)
+            else:
+                target_mean, target_std = compute_mean_std(target_features, axis=0)
+
+            if distractors_file_name is not None:
+                distractors_mean, distractors_std = load_mean_std(distractors_file_name, axis=0)
+            else:
+                distractors_mean, distractors_std = compute_mean_std(distractors_features, axis=0)
+
+            mean = (target_mean + distractors_mean) / 2
+            std = (target_std + distractors_std) / 2
             std[np.nonzero(std == 0.0)] = 1.0  # nan is because of dividing by zero
         self.mean = mean
         self.std = std
         
-        self.target_features = (target_features - self.mean) / (2 * self.std)
-        self.distractors_features = (distractors_features - self.mean) / (2 * self.std)
+        self.target_features = target_features
+        self.distractors_features = distractors_features
+
+    def normalize(self, features):
+        return (features - self.mean) / (2 * self.std)
 
     def __getitem__(self, indices):        
         target_idx = indices[0]
@@ -129,40 +389,50 @@ class ImageFeaturesDatasetZeroShot():
         
         distractors = []
         for d_idx in distractors_idxs:
-            distractors.append(self.distractors_features[d_idx])
+            distractors.append(self.normalize(self.distractors_features[d_idx]))
 
-        return (self.target_features[target_idx], distractors, indices)
+        return (self.normalize(self.target_features[target_idx]), distractors, indices)
+
+    def __getitems__(self, indices):
+        indices = np.asarray(indices)
+        target = torch.from_numpy(self.normalize(self.target_features[indices[:, 0]]))
+        distractors = torch.from_numpy(self.normalize(self.distractors_features[indices[:, 1:]]))
+
+        return (target, distractors, torch.from_numpy(indices))
 
     def __len__(self):
         return self.target_features.shape[0]
 
 
-class ImagesSamplerZeroShot(Sampler):
-    def __init__(self, data_source, k, shuffle):
-        self.n = len(data_source)
-        self.k = k
-        self.shuffle = shuffle
-        assert self.k < self.n
+class DeviceFeaturesLoader():
+    """
+    Serves batches of pretrained features that were moved to the training device once,
+    so there are no DataLoader workers, pinned memory or host to device copies.
+    Yields the same (target, distractors, indices) batches as the feature datasets.
+    """
+    def __init__(self, target_features, distractors_features, batch_sampler, device):
+        self.device = torch.device(device)
+        self.target_features = torch.as_tensor(target_features, device=self.device)
+        if distractors_features is target_features:
+            self.distractors_features = self.target_features
+        else:
+            self.distractors_features = torch.as_tensor(distractors_features, device=self.device)
+        self.batch_sampler = batch_sampler
 
     def __iter__(self):
-        indices = []
+        for indices in self.batch_sampler:
+            indices = torch.from_numpy(indices)
+            device_indices = indices.to(self.device)
 
-        if self.shuffle:
-            targets = torch.randperm(self.n).tolist()
-        else:
-            targets = list(range(self.n))
+            yield (self.target_features[device_indices[:, 0]],
+                self.distractors_features[device_indices[:, 1:]],
+                indices)
 
-        for t in targets:
-            arr = np.zeros(self.k + 1, dtype=int) # distractors + target
-            arr[0] = t
-            distractors = random.sample(range(self.n), self.k)
-            # while t in distractors:
-            #     distractors = random.sample(range(self.n), self.k)
-            arr[1:] = np.array(distractors)
-            
-            indices.append(arr)
+    def __len__(self):
+        return len(self.batch_sampler)
 
-        return iter(indices)
 
-    def __len__(self):
-        return self.n
\ No newline at end of file
+class ImagesSamplerZeroShot(ImagesSampler):
+    # Distractors are drawn from another dataset, so the target index is not excluded
+    def __init__(self, data_source, k, shuffle, batch_size, drop_last=False, seed=None):
+        super().__init__(data_source, k, shuffle, batch_size, drop_last, seed, exclude_targets=False)
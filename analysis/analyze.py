@@ -1,11 +1,13 @@
 import sys
 import os
+import json
 import numpy as np
 import pandas as pd
 
 from enum import Enum
 
 from stats_calculator import get_test_messages_stats, get_test_metrics, plot_rsa_topo_curves
+from utils import get_run_catalog
 
 debugging = False
 
@@ -18,12 +20,26 @@ if len(sys.argv) == 1:
 	#all_folders_names = os.listdir('../dumps')
 	#inputs = ['{} {}'.format(folder_name, folder_name[folder_name.find('_')+1:folder_name.rfind('_')]) for folder_name in all_folders_names]
 	print('Usage python analyze.py [analysis_id] [mode=normal/average] [model_id1 data_folder V L lambda alpha] [model_id2 data_folder V L lambda alpha] ...')
+	print('   or python analyze.py [analysis_id] [mode=normal/average] [model_id1] [model_id2] ...')
+	print('   or python analyze.py [analysis_id] [mode=normal/average] [attribute1=value1] [attribute2=value2] ... (e.g. vocab_size=10)')
 	assert False
 else:
 	analysis_id = sys.argv[1]
 	mode = sys.argv[2]
 	inputs = sys.argv[3:]
 
+def parse_value(value):
+	try:
+		return json.loads(value)
+	except ValueError:
+		return value
+
+# All the runs of the catalog with the given attributes
+if len(inputs) > 0 and all('=' in inp for inp in inputs):
+	attributes = {k: parse_value(v) for k, v in (inp.split('=', 1) for inp in inputs)}
+	inputs = sorted(get_run_catalog().runs(**attributes))
+	print('{} runs with {}'.format(len(inputs), attributes))
+
 if 'v' in mode:
 	mode = Mode.AVG
 else:
@@ -65,7 +81,14 @@ stats_dict = {
 
 # Read in the settings we want to analyze
 for inp in inputs:
-	model_id, dataset_id, vocab_size, L, vl_loss_weight, bound_weight = inp.split()
+	if len(inp.split()) == 1:
+		# Settings of the run from the catalog
+		model_id = inp
+		attributes = get_run_catalog().attributes(model_id)
+		dataset_id, vocab_size, L, vl_loss_weight, bound_weight = [str(attributes[k]) for k in
+			['shapes_dataset', 'vocab_size', 'max_sentence_length', 'vl_loss_weight', 'bound_weight']]
+	else:
+		model_id, dataset_id, vocab_size, L, vl_loss_weight, bound_weight = inp.split()
 
 	print('Processing model {}'.format(model_id))
 
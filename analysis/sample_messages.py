@@ -1,13 +1,15 @@
 import sys
 import numpy as np
 
-from utils import get_pickle_file, get_model_dir
+from utils import get_run_store, load_dictionaries
 
 n_samples = int(sys.argv[1])
 model_ids = sys.argv[2:]
 
 for model_id in model_ids:
-	m = get_pickle_file(get_model_dir(model_id), 'test_messages_w.p')
+	run_store = get_run_store(model_id)
+	_, idx_to_word, _ = load_dictionaries(run_store.attributes['vocab_folder'], run_store.attributes['vocab_size'])
+	m = run_store.words('test', idx_to_word)
 
 	idxs = np.random.choice(len(m), n_samples, replace=False)
 
@@ -6,33 +6,24 @@ import matplotlib.pyplot as plt
 from utils import *
 
 def get_test_metrics(model_id):
-	model_dir = get_model_dir(model_id)
-
-	acc_meter = get_pickle_file(model_dir, 'test_accuracy_meter.p')
-	entropy_meter = get_pickle_file(model_dir, 'test_entropy_meter.p')
-	distinctness_meter = get_pickle_file(model_dir, 'test_distinctness_meter.p')
-	rsa_sr_meter = get_pickle_file(model_dir, 'test_rsa_sr_meter.p')
-	rsa_si_meter = get_pickle_file(model_dir, 'test_rsa_si_meter.p')
-	rsa_ri_meter = get_pickle_file(model_dir, 'test_rsa_ri_meter.p')
-	topological_sim_meter = get_pickle_file(model_dir, 'test_topological_sim_meter.p')
-	lang_entropy_meter = get_pickle_file(model_dir, 'test_language_entropy_meter.p')
-
-	return (acc_meter.avg,
-			entropy_meter.avg,
-			distinctness_meter.avg,
-			rsa_sr_meter.avg,
-			rsa_si_meter.avg,
-			rsa_ri_meter.avg,
-			topological_sim_meter.avg,
-			lang_entropy_meter.avg)
+	run_store = get_run_store(model_id)
+
+	# A single epoch (the best one) was tested
+	return tuple(run_store.metric('test', name)[0] for name in [
+			'accuracy',
+			'entropy',
+			'distinctness',
+			'rsa_sr',
+			'rsa_si',
+			'rsa_ri',
+			'topological_sim',
+			'language_entropy'])
 
 def get_test_messages_stats(model_id, vocab_size, data_folder, plots_dir, should_plot=False):
 	_, idx_to_word, padding_idx = load_dictionaries('shapes' if '_' in data_folder else 'mscoco', vocab_size)
 
-	model_dir = get_model_dir(model_id)
-
 	# Load messages
-	messages = get_pickle_file(model_dir, 'test_messages.p')
+	messages = get_run_store(model_id).array('test', 'messages')
 
 	# Grab stats
 	min_len, max_len, avg_len, counter = compute_stats(messages, padding_idx, idx_to_word) # counter includes <S> (aka EOS)
@@ -104,30 +95,13 @@ def get_training_meters(model_id, debugging=False):
 			)
 
 def get_training_values(model_id, per_epoch, debugging=False):
-	model_dir = get_model_dir(model_id)
-
-	rsa_sr_meters = get_pickle_file(model_dir, 'rsa_sr_meters.p')
-	rsa_si_meters = get_pickle_file(model_dir, 'rsa_si_meters.p')
-	rsa_ri_meters = get_pickle_file(model_dir, 'rsa_ri_meters.p')
-	topological_sim_meters = get_pickle_file(model_dir, 'topological_sim_meters.p')
+	run_store = get_run_store(model_id)
+	names = ['rsa_sr', 'rsa_si', 'rsa_ri', 'topological_sim']
 
 	if per_epoch:
-		return ([m.avg for m in rsa_sr_meters],
-				[m.avg for m in rsa_si_meters],
-				[m.avg for m in rsa_ri_meters],
-				[m.avg for m in topological_sim_meters])
+		return tuple(list(run_store.metric('train', name)) for name in names)
 	else:
-		all_datapoints = []
-		for meters_list in [rsa_sr_meters, rsa_si_meters, rsa_ri_meters, topological_sim_meters]:
-			datapoints = []
-			for m in meters_list:
-				datapoints.extend(m.all_values)
-			all_datapoints.append(datapoints)
-
-		return (all_datapoints[0],
-				all_datapoints[1],
-				all_datapoints[2],
-				all_datapoints[3])
+		return tuple(list(np.concatenate(run_store.metric_values('train', name))) for name in names)
 
 def plot_rsa_topo_curves(model_dict, analysis_id, plots_dir, debugging=False):
 	output_dir = '{}/{}'.format(plots_dir, analysis_id)
@@ -2,13 +2,26 @@ from collections import Counter
 import matplotlib.pyplot as plt
 import pickle
 import os
+import sys
+from functools import lru_cache
 from mpl_toolkits.mplot3d import Axes3D
 from matplotlib.ticker import MaxNLocator
 
+sys.path.append('..')
+from run_catalog import RunCatalog
+
 def get_model_dir(model_id):
 	dumps_dir = '../dumps'
 	return '{}/{}'.format(dumps_dir, model_id)
 
+@lru_cache(maxsize=None)
+def get_run_catalog():
+	# Read once, the runs of an analysis are then looked up by model id
+	return RunCatalog('../dumps')
+
+def get_run_store(model_id):
+	return get_run_catalog().run_store(model_id)
+
 def get_pickle_file(model_dir, file_name_id):
 	file_names = ['{}/{}'.format(model_dir, f) for f in os.listdir(model_dir) if file_name_id in f]
 	
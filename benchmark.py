@@ -0,0 +1,243 @@
+import sys
+import time
+import torch
+import torch.nn as nn
+from torch.nn import functional as F
+from torch.distributions.categorical import Categorical
+from torch.distributions.relaxed_categorical import RelaxedOneHotCategorical
+
+from model import Model
+
+use_gpu = torch.cuda.is_available()
+
+BATCH_SIZE = 128
+EMBEDDING_DIM = 256
+HIDDEN_SIZE = 512
+n_image_features = 2048
+
+
+def get_model(vocab_size, max_sentence_length):
+	model = Model(n_image_features, vocab_size,
+		EMBEDDING_DIM, HIDDEN_SIZE,
+		vocab_size - 1, max_sentence_length,
+		0.0, 1.0,
+		False, 0,
+		use_gpu)
+
+	if use_gpu:
+		model = model.cuda()
+
+	return model
+
+def timeit(f, n_repeats):
+	f() # warm up
+
+	if use_gpu:
+		torch.cuda.synchronize()
+	start = time.time()
+
+	for _ in range(n_repeats):
+		f()
+
+	if use_gpu:
+		torch.cuda.synchronize()
+	return (time.time() - start) / n_repeats
+
+def loop_word_counts(m, vocab_size):
+	c = torch.zeros([vocab_size], device=m.device)
+	for w_idx in range(vocab_size):
+		c[w_idx] = (m == w_idx).sum()
+	return c
+
+
+def benchmark_word_counts(n_repeats=20):
+	print('Eval word counts (batches/sec)')
+	print('|V|\tloop\tbincount')
+
+	for vocab_size in [10, 100, 1000, 10000]:
+		model = get_model(vocab_size, 5)
+		model.eval()
+
+		m = torch.randint(vocab_size, (BATCH_SIZE, 6))
+		if use_gpu:
+			m = m.cuda()
+
+		t_loop = timeit(lambda: loop_word_counts(m, vocab_size), n_repeats)
+		t_bincount = timeit(lambda: model._get_word_counts(m), n_repeats)
+
+		print('{}\t{:.1f}\t{:.1f}'.format(vocab_size, 1 / t_loop, 1 / t_bincount))
+
+# Sender.forward before preallocating the outputs, kept as a reference
+def loop_sender_forward(sender, t, word_counts, tau=1.2):
+	batch_size = t.shape[0]
+	device = t.device
+
+	if sender.training:
+		message = [torch.zeros((batch_size, sender.vocab_size), dtype=torch.float32, device=device)]
+		message[0][:, sender.bound_token_idx] = 1.0
+	else:
+		message = [torch.full((batch_size, ), fill_value=sender.bound_token_idx, dtype=torch.int64, device=device)]
+
+	h = sender.aff_transform(t)
+	c = torch.zeros([batch_size, sender.hidden_size], device=device)
+
+	initial_length = sender.max_sentence_length + 1
+	seq_lengths = torch.ones([batch_size], dtype=torch.int64, device=device) * initial_length
+
+	ce_loss = nn.CrossEntropyLoss(reduction='none')
+
+	w_counts = word_counts.clone()
+	w_counts[sender.bound_token_idx] *= sender.bound_weight
+
+	denominator = w_counts.sum()
+	if denominator > 0:
+		normalized_word_counts = w_counts / denominator
+	else:
+		normalized_word_counts = w_counts
+
+	vl_loss = 0.0
+	entropy = 0.0
+
+	input_embed_rep = []
+
+	for i in range(sender.max_sentence_length):
+		emb = torch.matmul(message[-1], sender.embedding) if sender.training else sender.embedding[message[-1]]
+		h, c = sender.lstm_cell(emb, (h, c))
+
+		vocab_scores = sender.linear_probs(h)
+		p = F.softmax(vocab_scores, dim=1)
+		entropy += Categorical(p).entropy()
+
+		if sender.training:
+			rohc = RelaxedOneHotCategorical(tau, p)
+			token = rohc.rsample()
+
+			token_hard = torch.zeros_like(token)
+			token_hard.scatter_(-1, torch.argmax(token, dim=-1, keepdim=True), 1.0)
+			token = (token_hard - token).detach() + token
+		else:
+			if sender.greedy:
+				_, token = torch.max(p, -1)
+			else:
+				token = Categorical(p).sample()
+
+		message.append(token)
+		input_embed_rep.append(emb)
+
+		if sender.training:
+			max_predicted, vocab_index = torch.max(token, dim=1)
+			mask = (vocab_index == sender.bound_token_idx) * (max_predicted == 1.0)
+		else:
+			mask = token == sender.bound_token_idx
+		mask *= seq_lengths == initial_length
+		seq_lengths[mask.nonzero()] = i + 2
+
+		if sender.vl_loss_weight > 0.0:
+			vl_loss += ce_loss(vocab_scores - normalized_word_counts, sender._discretize_token(token))
+
+	return (torch.stack(message, dim=1),
+			seq_lengths,
+			vl_loss,
+			torch.mean(entropy) / sender.max_sentence_length,
+			torch.stack(input_embed_rep, dim=1))
+
+
+def benchmark_sender(n_repeats=20):
+	print('Sender decoding steps/sec')
+	print('L\ttrain loop\ttrain preallocated\teval loop\teval preallocated')
+
+	for max_sentence_length in [5, 10, 15, 20, 25]:
+		model = get_model(10, max_sentence_length)
+		sender = model.sender
+
+		t = torch.randn((BATCH_SIZE, n_image_features))
+		word_counts = torch.zeros([10])
+		if use_gpu:
+			t = t.cuda()
+			word_counts = word_counts.cuda()
+
+		# Training includes the backward pass
+		def train_step(f):
+			with torch.enable_grad():
+				m, _seq_lengths, _vl_loss, entropy, emb = f(t, word_counts)
+				(m.sum() + entropy + emb.sum()).backward()
+
+		sender.train()
+		t_train_loop = timeit(lambda: train_step(lambda *args: loop_sender_forward(sender, *args)), n_repeats)
+		t_train_fused = timeit(lambda: train_step(sender), n_repeats)
+
+		sender.eval()
+		t_eval_loop = timeit(lambda: loop_sender_forward(sender, t, word_counts), n_repeats)
+		t_eval_fused = timeit(lambda: sender(t, word_counts), n_repeats)
+
+		print('{}\t{:.1f}\t{:.1f}\t{:.1f}\t{:.1f}'.format(max_sentence_length,
+			max_sentence_length / t_train_loop, max_sentence_length / t_train_fused,
+			max_sentence_length / t_eval_loop, max_sentence_length / t_eval_fused))
+
+# Model scoring before batching the distractors, kept as a reference
+def loop_scores(target, distractors, r_transform):
+	batch_size = target.shape[0]
+	loss = 0
+
+	target = target.view(batch_size, 1, -1)
+	r_transform = r_transform.view(batch_size, -1, 1)
+
+	target_score = torch.bmm(target, r_transform).squeeze()
+
+	distractors_scores = []
+
+	for d in distractors:
+		d = d.view(batch_size, 1, -1)
+		d_score = torch.bmm(d, r_transform).squeeze()
+		distractors_scores.append(d_score)
+		zero_tensor = torch.tensor(0.0, device=target.device)
+
+		loss += torch.max(zero_tensor, 1.0 - target_score + d_score)
+
+	all_scores = torch.zeros((batch_size, 1 + len(distractors)))
+	all_scores[:,0] = target_score
+
+	for i, score in enumerate(distractors_scores):
+		all_scores[:,i+1] = score
+
+	all_scores = torch.exp(all_scores)
+
+	_, max_idx = torch.max(all_scores, 1)
+
+	accuracy = max_idx == 0
+	accuracy = accuracy.to(dtype=torch.float32)
+
+	return loss, accuracy
+
+
+def benchmark_scoring(n_repeats=50):
+	print('Receiver scoring batches/sec')
+	print('K\tloop\tbatched')
+
+	model = get_model(10, 5)
+	device = 'cuda' if use_gpu else 'cpu'
+
+	for k in [3, 10, 50, 100, 127]:
+		target = torch.randn((BATCH_SIZE, n_image_features), device=device)
+		distractors = [torch.randn((BATCH_SIZE, n_image_features), device=device) for _ in range(k)]
+		r_transform = torch.randn((1, BATCH_SIZE, n_image_features), device=device)
+
+		t_loop = timeit(lambda: loop_scores(target, distractors, r_transform), n_repeats)
+		t_batched = timeit(lambda: model._score(target, distractors, r_transform), n_repeats)
+
+		print('{}\t{:.1f}\t{:.1f}'.format(k, 1 / t_loop, 1 / t_batched))
+
+
+benchmarks = {
+	'word_counts': benchmark_word_counts,
+	'sender': benchmark_sender,
+	'scoring': benchmark_scoring,
+}
+
+if __name__ == '__main__':
+	names = sys.argv[1:] if len(sys.argv) > 1 else benchmarks.keys()
+
+	for name in names:
+		with torch.no_grad():
+			benchmarks[name]()
+		print()
@@ -0,0 +1,91 @@
+import os
+import math
+
+from dump_writer import DumpWriter, cpu_snapshot
+
+
+class CheckpointManager:
+	"""
+	Retention policy for the checkpoints of a training run. After each epoch step is given
+	the state_dict and the validation score of the model, and only the keep_best best
+	epochs, the latest one (keep_last) and every every_n-th epoch (if given) stay in
+	folder, as <prefix>_<epoch>_model. Superseded checkpoints are deleted through
+	dump_writer after the new one is written, so the folder always holds a complete
+	checkpoint. A CPU copy of the best state_dict is kept, see load_best.
+	With folder=None nothing is written and only the best state_dict is kept.
+	"""
+	def __init__(self, folder, prefix=None, mode='max', keep_best=1, keep_last=True, every_n=0, dump_writer=None):
+		assert mode in ['min', 'max']
+		assert keep_best >= 1
+
+		self.folder = folder
+		self.prefix = prefix
+		self.mode = mode
+		self.keep_best = keep_best
+		self.keep_last = keep_last
+		self.every_n = every_n
+		self.dump_writer = dump_writer if dump_writer is not None else DumpWriter(asynchronous=False)
+
+		self.scores = {}
+		self.saved_epochs = set()
+		self.best_epoch = None
+		self.best_state_dict = None
+
+	def file_name(self, epoch):
+		if self.prefix is None:
+			return '{}/{}_model'.format(self.folder, epoch)
+		return '{}/{}_{}_model'.format(self.folder, self.prefix, epoch)
+
+	def step(self, epoch, score, state_dict):
+		# A NaN score (e.g. after a NaN loss) is never among the best
+		if math.isnan(score):
+			score = -math.inf if self.mode == 'max' else math.inf
+		self.scores[epoch] = score
+
+		if self.best_epoch is None or self._is_better(score, self.scores[self.best_epoch]):
+			self.best_epoch = epoch
+			self.best_state_dict = cpu_snapshot(state_dict)
+
+		if self.folder is None:
+			return
+
+		kept_epochs = self.kept_epochs(epoch)
+
+		if epoch in kept_epochs:
+			self.dump_writer.save_state_dict(state_dict, self.file_name(epoch))
+			self.saved_epochs.add(epoch)
+
+		for superseded_epoch in sorted(self.saved_epochs - kept_epochs):
+			self.dump_writer.submit(remove_file, self.file_name(superseded_epoch))
+			self.saved_epochs.remove(superseded_epoch)
+
+	def kept_epochs(self, latest_epoch):
+		# Ties keep the earliest epoch, like np.argmax/np.argmin
+		sign = -1 if self.mode == 'max' else 1
+		ranked_epochs = sorted(self.scores, key=lambda e: (sign * self.scores[e], e))
+
+		kept_epochs = set(ranked_epochs[:self.keep_best])
+		if self.keep_last:
+			kept_epochs.add(latest_epoch)
+		if self.every_n > 0:
+			kept_epochs.update(e for e in self.scores if e % self.every_n == 0)
+		return kept_epochs
+
+	def load_best(self, model):
+		"""
+		Loads the best state_dict into model, without reading its checkpoint.
+		"""
+		model.load_state_dict(self.best_state_dict)
+		return model
+
+	@property
+	def best_file_name(self):
+		return self.file_name(self.best_epoch) if self.folder is not None else None
+
+	def _is_better(self, score, best_score):
+		return score > best_score if self.mode == 'max' else score < best_score
+
+
+def remove_file(file_name):
+	if os.path.exists(file_name):
+		os.remove(file_name)
@@ -1,9 +1,9 @@
 import pickle
 import numpy as np
 from torch.utils.data import DataLoader
-from torch.utils.data.sampler import BatchSampler
 
-from ImageDataset import ImageDataset, ImageFeaturesDataset, ImagesSampler, ImageFeaturesDatasetZeroShot, ImagesSamplerZeroShot
+from ImageDataset import ImageDataset, ResizedImageDataset, RawImageDataset, DeviceTransformLoader, ImageFeaturesDataset, ImagesSampler, ImageFeaturesDatasetZeroShot, ImagesSamplerZeroShot, collate_batch, DeviceFeaturesLoader
+from visual_module import ImageTransform
 
 def load_dictionaries(folder, vocab_size):
 	with open("data/{}/dict_{}.pckl".format(folder, vocab_size), "rb") as f:
@@ -14,83 +14,138 @@ def load_dictionaries(folder, vocab_size):
 
 	return word_to_idx, idx_to_word, bound_idx
 
-def load_images(folder, batch_size, k):
+# With use_resized_images the images are resized once and cached, instead of on every access
+# If transform_device is given, batches of images are instead resized and normalized there
+def load_images(folder, batch_size, k, seed=None, use_resized_images=False, transform_device=None):
 	train_filename = '{}/train.large.input.npy'.format(folder)
 	valid_filename = '{}/val.input.npy'.format(folder)
 	test_filename = '{}/test.input.npy'.format(folder)
 
-	train_dataset = ImageDataset(train_filename)
-	valid_dataset = ImageDataset(valid_filename, mean=train_dataset.mean, std=train_dataset.std) # All features are normalized with mean and std
-	test_dataset = ImageDataset(test_filename, mean=train_dataset.mean, std=train_dataset.std)
+	assert not use_resized_images or transform_device is None, 'Images are either cached resized or resized on the device'
 
-	train_data = DataLoader(train_dataset, num_workers=1, pin_memory=True, 
-		batch_sampler=BatchSampler(ImagesSampler(train_dataset, k, shuffle=True), batch_size=batch_size, drop_last=False))
+	if transform_device is not None:
+		dataset_class = RawImageDataset
+		collate_fn = collate_batch
+	elif use_resized_images:
+		dataset_class = ResizedImageDataset
+		collate_fn = collate_batch
+	else:
+		dataset_class = ImageDataset
+		collate_fn = None
+
+	train_dataset = dataset_class(train_filename)
+	valid_dataset = dataset_class(valid_filename, mean=train_dataset.mean, std=train_dataset.std) # All features are normalized with mean and std
+	test_dataset = dataset_class(test_filename, mean=train_dataset.mean, std=train_dataset.std)
+
+	train_data = DataLoader(train_dataset, num_workers=1, pin_memory=True, collate_fn=collate_fn,
+		batch_sampler=ImagesSampler(train_dataset, k, shuffle=True, batch_size=batch_size, seed=seed))
+
+	valid_data = DataLoader(valid_dataset, num_workers=1, pin_memory=True, collate_fn=collate_fn,
+		batch_sampler=ImagesSampler(valid_dataset, k, shuffle=False, batch_size=batch_size, seed=seed))
 
-	valid_data = DataLoader(valid_dataset, num_workers=1, pin_memory=True,
-		batch_sampler=BatchSampler(ImagesSampler(valid_dataset, k, shuffle=False), batch_size=batch_size, drop_last=False))
+	test_data = DataLoader(test_dataset, num_workers=1, pin_memory=True, collate_fn=collate_fn,
+		batch_sampler=ImagesSampler(test_dataset, k, shuffle=False, batch_size=batch_size, seed=seed))
 
-	test_data = DataLoader(test_dataset, num_workers=1, pin_memory=True,
-		batch_sampler=BatchSampler(ImagesSampler(test_dataset, k, shuffle=False), batch_size=batch_size, drop_last=False))
+	if transform_device is not None:
+		transform = ImageTransform((128, 128), train_dataset.mean, train_dataset.std)
+
+		train_data = DeviceTransformLoader(train_data, transform, transform_device)
+		valid_data = DeviceTransformLoader(valid_data, transform, transform_device)
+		test_data = DeviceTransformLoader(test_data, transform, transform_device)
 
 	return train_data, valid_data, test_data
 
 
 # This is for loading previously obtained features
-def load_pretrained_features(folder, batch_size, k, use_symbolic=False):
+# They fit in memory and whole batches are indexed at once, so worker processes are optional
+# If device is given, the features are kept on it and the DataLoader is bypassed
+def load_pretrained_features(folder, batch_size, k, use_symbolic=False, seed=None, num_workers=0, device=None):
 	if use_symbolic:
 		train_features = np.load('{}/train.large.onehot_metadata.p'.format(folder)).astype(np.float32)
 		valid_features = np.load('{}/val.onehot_metadata.p'.format(folder)).astype(np.float32)
 		test_features = np.load('{}/test.onehot_metadata.p'.format(folder)).astype(np.float32)
+		train_features_filename = None
 	else:
-		train_features = np.load('{}/train_features.npy'.format(folder))
-		valid_features = np.load('{}/valid_features.npy'.format(folder))
-		test_features = np.load('{}/test_features.npy'.format(folder))
+		train_features_filename = '{}/train_features.npy'.format(folder)
+		train_features = np.load(train_features_filename, mmap_mode='r')
+		valid_features = np.load('{}/valid_features.npy'.format(folder), mmap_mode='r')
+		test_features = np.load('{}/test_features.npy'.format(folder), mmap_mode='r')
 
 	n_image_features = valid_features.shape[-1] # 4096
 
-	train_dataset = ImageFeaturesDataset(train_features)
+	train_dataset = ImageFeaturesDataset(train_features, file_name=train_features_filename)
 	valid_dataset = ImageFeaturesDataset(valid_features, mean=train_dataset.mean, std=train_dataset.std) # All features are normalized with mean and std
 	test_dataset = ImageFeaturesDataset(test_features, mean=train_dataset.mean, std=train_dataset.std)
 
-	train_data = DataLoader(train_dataset, num_workers=8, pin_memory=True, 
-		batch_sampler=BatchSampler(ImagesSampler(train_dataset, k, shuffle=True), batch_size=batch_size, drop_last=False))
+	if device is not None:
+		train_features = train_dataset.normalize(train_features)
+		valid_features = valid_dataset.normalize(valid_features)
+		test_features = test_dataset.normalize(test_features)
+
+		train_data = DeviceFeaturesLoader(train_features, train_features,
+			ImagesSampler(train_dataset, k, shuffle=True, batch_size=batch_size, seed=seed), device)
+
+		valid_data = DeviceFeaturesLoader(valid_features, valid_features,
+			ImagesSampler(valid_dataset, k, shuffle=False, batch_size=batch_size, seed=seed), device)
 
-	valid_data = DataLoader(valid_dataset, num_workers=8, pin_memory=True,
-		batch_sampler=BatchSampler(ImagesSampler(valid_dataset, k, shuffle=False), batch_size=batch_size, drop_last=False))
+		test_data = DeviceFeaturesLoader(test_features, test_features,
+			ImagesSampler(test_dataset, k, shuffle=False, batch_size=batch_size, seed=seed), device)
 
-	test_data = DataLoader(test_dataset, num_workers=8, pin_memory=True,
-		batch_sampler=BatchSampler(ImagesSampler(test_dataset, k, shuffle=False), batch_size=batch_size, drop_last=False))
+		return n_image_features, train_data, valid_data, test_data
+
+	train_data = DataLoader(train_dataset, num_workers=num_workers, pin_memory=True, collate_fn=collate_batch,
+		batch_sampler=ImagesSampler(train_dataset, k, shuffle=True, batch_size=batch_size, seed=seed))
+
+	valid_data = DataLoader(valid_dataset, num_workers=num_workers, pin_memory=True, collate_fn=collate_batch,
+		batch_sampler=ImagesSampler(valid_dataset, k, shuffle=False, batch_size=batch_size, seed=seed))
+
+	test_data = DataLoader(test_dataset, num_workers=num_workers, pin_memory=True, collate_fn=collate_batch,
+		batch_sampler=ImagesSampler(test_dataset, k, shuffle=False, batch_size=batch_size, seed=seed))
 
 	return n_image_features, train_data, valid_data, test_data
 
 
 # This is for loading previously obtained features
 # This needs to grab targets from the unseen dataset and distractors from unseen + seen grabbed uniformly
-def load_pretrained_features_zero_shot(target_folder, distractors_folder, batch_size, k):
-	target_train_features = np.load('{}/train_features.npy'.format(target_folder))
-	target_valid_features = np.load('{}/valid_features.npy'.format(target_folder))
-	target_test_features = np.load('{}/test_features.npy'.format(target_folder))
+def load_pretrained_features_zero_shot(target_folder, distractors_folder, batch_size, k, seed=None, num_workers=0, device=None):
+	target_train_features = np.load('{}/train_features.npy'.format(target_folder), mmap_mode='r')
+	target_valid_features = np.load('{}/valid_features.npy'.format(target_folder), mmap_mode='r')
+	target_test_features = np.load('{}/test_features.npy'.format(target_folder), mmap_mode='r')
 
-	distractors_train_features = np.load('{}/train_features.npy'.format(distractors_folder))
-	distractors_valid_features = np.load('{}/valid_features.npy'.format(distractors_folder))
-	distractors_test_features = np.load('{}/test_features.npy'.format(distractors_folder))
+	distractors_train_features = np.load('{}/train_features.npy'.format(distractors_folder), mmap_mode='r')
+	distractors_valid_features = np.load('{}/valid_features.npy'.format(distractors_folder), mmap_mode='r')
+	distractors_test_features = np.load('{}/test_features.npy'.format(distractors_folder), mmap_mode='r')
 
 	n_image_features = target_valid_features.shape[-1]
 
 	assert target_valid_features.shape[-1] == distractors_valid_features.shape[-1]
 
 
-	train_dataset = ImageFeaturesDatasetZeroShot(target_train_features, distractors_train_features)
+	train_dataset = ImageFeaturesDatasetZeroShot(target_train_features, distractors_train_features,
+		target_file_name='{}/train_features.npy'.format(target_folder),
+		distractors_file_name='{}/train_features.npy'.format(distractors_folder))
 	valid_dataset = ImageFeaturesDatasetZeroShot(target_valid_features, distractors_valid_features, mean=train_dataset.mean, std=train_dataset.std) # All features are normalized with mean and std
 	test_dataset = ImageFeaturesDatasetZeroShot(target_test_features, distractors_test_features, mean=train_dataset.mean, std=train_dataset.std)
 
-	train_data = DataLoader(train_dataset, num_workers=8, pin_memory=True, 
-		batch_sampler=BatchSampler(ImagesSamplerZeroShot(train_dataset, k, shuffle=True), batch_size=batch_size, drop_last=False))
+	if device is not None:
+		train_data = DeviceFeaturesLoader(train_dataset.normalize(target_train_features), train_dataset.normalize(distractors_train_features),
+			ImagesSamplerZeroShot(train_dataset, k, shuffle=True, batch_size=batch_size, seed=seed), device)
+
+		valid_data = DeviceFeaturesLoader(valid_dataset.normalize(target_valid_features), valid_dataset.normalize(distractors_valid_features),
+			ImagesSamplerZeroShot(valid_dataset, k, shuffle=False, batch_size=batch_size, seed=seed), device)
+
+		test_data = DeviceFeaturesLoader(test_dataset.normalize(target_test_features), test_dataset.normalize(distractors_test_features),
+			ImagesSamplerZeroShot(test_dataset, k, shuffle=False, batch_size=batch_size, seed=seed), device)
+
+		return n_image_features, train_data, valid_data, test_data
+
+	train_data = DataLoader(train_dataset, num_workers=num_workers, pin_memory=True, collate_fn=collate_batch,
+		batch_sampler=ImagesSamplerZeroShot(train_dataset, k, shuffle=True, batch_size=batch_size, seed=seed))
 
-	valid_data = DataLoader(valid_dataset, num_workers=8, pin_memory=True,
-		batch_sampler=BatchSampler(ImagesSamplerZeroShot(valid_dataset, k, shuffle=False), batch_size=batch_size, drop_last=False))
+	valid_data = DataLoader(valid_dataset, num_workers=num_workers, pin_memory=True, collate_fn=collate_batch,
+		batch_sampler=ImagesSamplerZeroShot(valid_dataset, k, shuffle=False, batch_size=batch_size, seed=seed))
 
-	test_data = DataLoader(test_dataset, num_workers=8, pin_memory=True,
-		batch_sampler=BatchSampler(ImagesSamplerZeroShot(test_dataset, k, shuffle=False), batch_size=batch_size, drop_last=False))
+	test_data = DataLoader(test_dataset, num_workers=num_workers, pin_memory=True, collate_fn=collate_batch,
+		batch_sampler=ImagesSamplerZeroShot(test_dataset, k, shuffle=False, batch_size=batch_size, seed=seed))
 
 	return n_image_features, train_data, valid_data, test_data
\ No newline at end of file
@@ -1,48 +1,19 @@
-import pickle
-import torch
-import os
 import sys
 
 from dataloader import load_dictionaries
+from run_store import RunStore
 
+# Messages are dumped as token ids (see RunStore.save_messages) and only decoded into words when read
+# e.g. python decode.py dumps/<model_id> test [epoch]
 
-def dump_words(current_model_dir, test_messages, idx_to_word, save_filename):
-	# Decode test messages
-	words = []
+if __name__ == '__main__':
+	assert len(sys.argv) > 2, 'Need the dump folder of a run and a split (train, eval or test)'
 
-	for m in test_messages:
-		words.append([idx_to_word[t] for t in m])
+	run_store = RunStore(sys.argv[1])
+	split = sys.argv[2]
+	epoch = int(sys.argv[3]) if len(sys.argv) > 3 else None
 
-	res_filename = '{}/{}_w.p'.format(current_model_dir, save_filename)
+	_word_to_idx, idx_to_word, _bound_idx = load_dictionaries(run_store.attributes['vocab_folder'], run_store.attributes['vocab_size'])
 
-	pickle.dump(words, open(res_filename, 'wb'))
-
-	return res_filename
-
-
-# use_gpu = torch.cuda.is_available()
-
-# assert len(sys.argv) == 2, 'Need dumped messages path'
-
-# messages_path = sys.argv[1]
-
-# model_id, vocab_size, l = messages_path.split('_')
-
-# # Load vocab
-# _word_to_idx, idx_to_word, _bound_idx = load_dictionaries('shapes', vocab_size)
-
-
-# # Settings
-# dumps_dir = './dumps'
-
-# current_model_dir = '{}/{}_{}_{}'.format(dumps_dir, model_id, vocab_size, l)
-
-# test_messages_filename = [f for f in os.listdir(current_model_dir) if 'test_messages.p' in f]
-# assert len(test_messages_filename) == 1, 'More than one file?'
-# test_messages_filename = test_messages_filename[0]
-
-# test_messages = pickle.load(open('{}/{}'.format(current_model_dir, test_messages_filename), 'rb'))
-
-# res_filename = dump_words(current_model_dir, test_messages, idx_to_word, test_messages_filename[:-2])
-
-# print('File dumped to {}'.format(res_filename))
+	for words in run_store.words(split, idx_to_word, epoch):
+		print(' '.join(words))
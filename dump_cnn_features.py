@@ -1,53 +1,41 @@
 import numpy as np
 import torch
 import torchvision.models as models
-import torchvision.transforms
-from PIL import Image
 import torch.utils.data as data
-from torch.utils.data import DataLoader
 import os
+import json
+
+from ImageDataset import load_mean_std
+from visual_module import ImageTransform
 
 
 use_gpu = torch.cuda.is_available()
 
+IMAGE_SIZE = (128, 128) # The images are resized to it before the CNN
+
 
 class ShapesDataset(data.Dataset):
+	# Serves the uint8 images, they are resized and normalized in batches by self.transform
 	def __init__(self, images_filename, mean=None, std=None):
 		super().__init__()
 
-		self.data = np.load(images_filename)
+		self.data = np.load(images_filename, mmap_mode='r')
 
 		self.n_tuples = 0 if len(self.data.shape) < 5 else self.data.shape[1]
 
 		if mean is None:
-			mean = np.mean(self.data, axis=tuple(range(self.data.ndim-1)))#np.mean(features, axis=0)
-			std = np.std(self.data, axis=tuple(range(self.data.ndim-1)))#np.std(features, axis=0)
+			mean, std = load_mean_std(images_filename, axis=tuple(range(self.data.ndim-1)))
 			std[np.nonzero(std == 0.0)] = 1.0  # nan is because of dividing by zero
 		self.mean = mean
 		self.std = std
 
-		self.transforms = torchvision.transforms.Compose([
-			torchvision.transforms.ToPILImage(),
-			torchvision.transforms.Resize((128, 128), Image.LINEAR),
-			torchvision.transforms.ToTensor(),
-			torchvision.transforms.Normalize(self.mean, self.std)
-			])
+		self.transform = ImageTransform(IMAGE_SIZE, self.mean, self.std)
 
 	def __getitem__(self, index):
-		if self.n_tuples == 0:
-			image = self.data[index, :, :, :]
-			image = self.transforms(image)
-		else:
-			imgs = []
-			for i in range(self.n_tuples):
-				img = self.data[index, i, :, :, :]
-				img = self.transforms(img)
-
-				imgs.append(img)
-
-			image = torch.stack(imgs) # 2 x 3 x 128 x 128
+		return torch.from_numpy(np.array(self.data[index]))
 
-		return image
+	def __getitems__(self, indices):
+		return torch.from_numpy(self.data[indices])
 
 	def __len__(self):
 		return self.data.shape[0]
@@ -61,90 +49,106 @@ def cnn_fwd(model, x):
 
 	return y.numpy()
 
-def get_features(model, dataloader, output_data_folder, file_id):
-	for i, x in enumerate(dataloader):
-		if use_gpu:
-			x = x.cuda()
+def get_features(model, dataset, output_file_name, batch_size, chunk_size=8192):
+	"""
+	Extracts the features of dataset in chunks of chunk_size images, streamed into a .npy file
+	preallocated for the whole dataset. Completed chunks are recorded in a manifest next to it,
+	so an interrupted extraction resumes after them. The file gets its final name once all are done.
+	"""
+	temp_file_name = '{}.tmp'.format(output_file_name)
+	manifest_file_name = '{}.manifest.json'.format(output_file_name)
+
+	n_rows = len(dataset) if use_gpu else min(len(dataset), 6 * batch_size) # Only a few batches when debugging on cpu
+	chunks = [(start, min(start + chunk_size, n_rows)) for start in range(0, n_rows, chunk_size)]
+
+	features = None
+	completed_chunks = []
+
+	if os.path.exists(manifest_file_name) and os.path.exists(temp_file_name):
+		with open(manifest_file_name) as f:
+			manifest = json.load(f)
+
+		# Only resume an extraction of the same size and chunks
+		if manifest['n_rows'] == n_rows and manifest['chunk_size'] == chunk_size:
+			features = np.lib.format.open_memmap(temp_file_name, mode='r+')
+			completed_chunks = [tuple(c) for c in manifest['completed_chunks']]
+			print('Resuming {} after {}/{} chunks'.format(output_file_name, len(completed_chunks), len(chunks)))
 
-		if i == 0:
-			if len(x.shape) == 5:
-				n_tuples = x.shape[1]
-			else:
-				n_tuples = 0
-		
+	transform = dataset.transform
+	if use_gpu:
+		transform = transform.cuda()
+
+	with torch.no_grad():
+		for start, end in chunks:
+			if (start, end) in completed_chunks:
+				continue
+
+			for batch_start in range(start, end, batch_size):
+				x = dataset.__getitems__(np.arange(batch_start, min(batch_start + batch_size, end)))
+
+				if use_gpu:
+					x = x.cuda()
 
-		if n_tuples == 0:
-			y = cnn_fwd(model, x)
+				x = transform(x)
 
-		else:
-			ys = []
-			for j in range(n_tuples):
-				x_t = x[:,j,:,:,:]
-				y_t = cnn_fwd(model, x_t)
-				ys.append(y_t)
-			
-			# Here we need to combine 1st elem with 1st elem, etc in the batch
+				if len(x.shape) == 5:
+					# Tuples of images: the j-th image of every tuple goes through the CNN together
+					y = np.stack([cnn_fwd(model, x[:, j, :, :, :]) for j in range(x.shape[1])], axis=1)
+				else:
+					y = cnn_fwd(model, x)
 
-			y = np.asarray(ys)
-			y = np.moveaxis(y, 0, 1)
+				if features is None:
+					features = np.lib.format.open_memmap(temp_file_name, mode='w+', dtype=y.dtype, shape=(n_rows,) + y.shape[1:])
 
+				features[batch_start:batch_start + y.shape[0]] = y
 
-		np.save('{}/{}_{}_features.npy'.format(output_data_folder, file_id, i), y)
+			# The chunk is only recorded once it is on disk
+			features.flush()
+			completed_chunks.append((start, end))
+			save_manifest(manifest_file_name, {
+				'n_rows': n_rows,
+				'chunk_size': chunk_size,
+				'completed_chunks': completed_chunks,
+			})
 
-		if not use_gpu and i == 5:
-			break
+	del features
+	os.replace(temp_file_name, output_file_name)
+	os.remove(manifest_file_name)
 
 
-def stitch_files(temp_folder, output_data_folder, file_id):
-	file_names = ['{}/{}'.format(temp_folder, f) for f in os.listdir(temp_folder) if file_id in f]
-	file_names.sort(key=os.path.getctime)
+def save_manifest(manifest_file_name, manifest):
+	# Write and rename, so an interruption never leaves a partial manifest
+	with open('{}.tmp'.format(manifest_file_name), 'w') as f:
+		json.dump(manifest, f)
+	os.replace('{}.tmp'.format(manifest_file_name), manifest_file_name)
 
-	for i, f in enumerate(file_names):
-		arr = np.load(f)
-		if i == 0:
-			features = arr
-		else:
-			features = np.concatenate((features, arr))
 
-	np.save('{}/{}_features.npy'.format(output_data_folder, file_id), features)
+def do_features_exist(features_folder_name):
+	# The folder alone can be left by an interrupted extraction
+	return all(os.path.exists('{}/{}_features.npy'.format(features_folder_name, split)) for split in ['train', 'valid', 'test'])
 
 
-def save_features(cnn, folder, folder_id):
+def save_features(cnn, folder, folder_id, output_features_folder=None):
 	batch_size = 128 if use_gpu else 4
 
 	train_dataset = ShapesDataset('shapes/{}/train.large.input.npy'.format(folder))
 	val_dataset = ShapesDataset('shapes/{}/val.input.npy'.format(folder), mean=train_dataset.mean, std=train_dataset.std)
 	test_dataset = ShapesDataset('shapes/{}/test.input.npy'.format(folder), mean=train_dataset.mean, std=train_dataset.std)
 
-	train_dataloader = DataLoader(train_dataset, num_workers=8, batch_size=batch_size)
-	val_dataloader = DataLoader(val_dataset, num_workers=8, batch_size=batch_size)
-	test_dataloader = DataLoader(test_dataset, num_workers=8, batch_size=batch_size)
-
-	output_features_folder = 'data/shapes/{}_{}'.format(folder, folder_id)
-	temp_features_folder = 'data/temp{}'.format(folder_id)
+	if output_features_folder is None:
+		output_features_folder = 'data/shapes/{}_{}'.format(folder, folder_id)
 
 	if not os.path.exists(output_features_folder):
 		os.mkdir(output_features_folder)
 
-	if not os.path.exists(temp_features_folder):
-		os.mkdir(temp_features_folder)
-
 	# Make a pass of the datasets through the trained CNN layers
 	cnn.eval()
 
-	get_features(cnn, train_dataloader, temp_features_folder, 'train')
-	get_features(cnn, val_dataloader, temp_features_folder, 'valid')
-	get_features(cnn, test_dataloader, temp_features_folder, 'test')
-
-	# Stitch into one file
-	stitch_files(temp_features_folder, output_features_folder, 'train')
-	stitch_files(temp_features_folder, output_features_folder, 'valid')
-	stitch_files(temp_features_folder, output_features_folder, 'test')
-
-	# Remove temp folder
-	for f in os.listdir(temp_features_folder):
-		os.remove('{}/{}'.format(temp_features_folder, f))
-	os.rmdir(temp_features_folder)
+	# Splits that were already extracted by an interrupted run are skipped
+	for dataset, split in [(train_dataset, 'train'), (val_dataset, 'valid'), (test_dataset, 'test')]:
+		output_file_name = '{}/{}_features.npy'.format(output_features_folder, split)
+		if not os.path.exists(output_file_name):
+			get_features(cnn, dataset, output_file_name, batch_size)
 
 	print('Visual features saved in folder {}'.format(output_features_folder))
 	print()
@@ -0,0 +1,88 @@
+import os
+import queue
+import atexit
+import threading
+import torch
+
+
+def cpu_snapshot(x):
+	# Copies tensors (also those of dicts, e.g. a state_dict) to the CPU, so later in-place updates don't change them
+	if isinstance(x, torch.Tensor):
+		return x.detach().to('cpu', copy=True)
+	if isinstance(x, dict):
+		return type(x)((k, cpu_snapshot(v)) for k, v in x.items())
+	if isinstance(x, (list, tuple)):
+		return type(x)(cpu_snapshot(v) for v in x)
+	return x
+
+def save_state_dict(state_dict, file_name):
+	temp_file_name = '{}.tmp'.format(file_name)
+	torch.save(state_dict, temp_file_name)
+	os.replace(temp_file_name, file_name)
+
+
+class DumpWriter:
+	"""
+	Writes the dumps of the training loop (checkpoints, RunStore artifacts) in a background
+	thread, so the next epoch trains while they are persisted. The arguments of every job
+	are snapshotted on the CPU when submitted, and jobs run in submission order. At most
+	max_pending jobs wait in the queue, submit blocks beyond that so snapshots never pile up
+	in memory. Pending jobs are also written when the script exits, e.g. on an exception.
+	With asynchronous=False jobs simply run when submitted.
+	"""
+	def __init__(self, asynchronous=True, max_pending=8):
+		self.asynchronous = asynchronous
+		self.error = None
+
+		if self.asynchronous:
+			self.queue = queue.Queue(maxsize=max_pending)
+			self.thread = threading.Thread(target=self._run, daemon=True)
+			self.thread.start()
+			atexit.register(self.shutdown)
+
+	def submit(self, f, *args, **kwargs):
+		if not self.asynchronous:
+			f(*args, **kwargs)
+			return
+
+		self._raise_error()
+		self.queue.put((f, cpu_snapshot(args), cpu_snapshot(kwargs)))
+
+	def save_state_dict(self, state_dict, file_name):
+		self.submit(save_state_dict, state_dict, file_name)
+
+	def flush(self):
+		"""
+		Waits until all the submitted jobs are written.
+		"""
+		if self.asynchronous:
+			self.queue.join()
+			self._raise_error()
+
+	def shutdown(self):
+		if self.asynchronous and self.thread.is_alive():
+			self.queue.put(None)
+			self.thread.join()
+			self._raise_error()
+
+	def _run(self):
+		while True:
+			job = self.queue.get()
+
+			try:
+				if job is None:
+					break
+
+				# Once a job failed the later ones are skipped, the error is raised in the training loop
+				if self.error is None:
+					f, args, kwargs = job
+					f(*args, **kwargs)
+			except Exception as e:
+				self.error = e
+			finally:
+				self.queue.task_done()
+
+	def _raise_error(self):
+		if self.error is not None:
+			error, self.error = self.error, None
+			raise RuntimeError('Writing dumps failed') from error
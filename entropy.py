@@ -1,5 +1,5 @@
 import numpy as np
-import scipy.stats
+import torch
 
 
 def language_entropy(generated_messages):
@@ -7,20 +7,26 @@ def language_entropy(generated_messages):
     Pads messages with 0 after a eos and ignores sos (start token)
     Then runs entropy on the full sequence
     Args:
-        generated_messages: generated messages output from eval on test
+        generated_messages: generated messages output from eval on test,
+            as a numpy array or a torch tensor on any device
     """
-    eos_token = generated_messages.max()
-    padded_messages = np.zeros(
-        (generated_messages.shape[0], generated_messages.shape[1] - 1)
-    )
-    for m in range(generated_messages.shape[0]):
-        run_entropy_on_full = True
-        for t in range(1, generated_messages.shape[1]):
-            if generated_messages[m][t] == eos_token:
-                padded_messages[m, : t - 1] = generated_messages[m, 1:t]
-                run_entropy_on_full = False
-        if run_entropy_on_full:
-            padded_messages[m] = generated_messages[m, 1:]
+    if isinstance(generated_messages, torch.Tensor):
+        messages = generated_messages.detach()
+    else:
+        messages = torch.from_numpy(np.asarray(generated_messages))
+    messages = messages.to(dtype=torch.int64)
 
-    y = np.bincount(padded_messages.flatten().astype(np.int))
-    return scipy.stats.entropy(y)
\ No newline at end of file
+    eos_token = messages.max()
+    messages = messages[:, 1:]
+
+    # Position (1-based, after sos) of the last eos of every message, 0 if there is none
+    positions = torch.arange(1, messages.shape[1] + 1, device=messages.device)
+    last_eos = ((messages == eos_token) * positions).max(dim=1, keepdim=True)[0]
+
+    # Keep everything before the last eos, or the full message if there is no eos
+    keep = (positions < last_eos) | (last_eos == 0)
+    padded_messages = messages.masked_fill(~keep, 0)
+
+    y = torch.bincount(padded_messages.flatten()).to(dtype=torch.float64)
+    p = y[y > 0] / y.sum()
+    return -torch.sum(p * torch.log(p)).item()
@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+
+from dump_cnn_features import save_features, do_features_exist, IMAGE_SIZE, use_gpu
+
+CACHE_FOLDER = 'data/shapes/cache'
+MAX_CACHE_BYTES = 100 * 2**30
+EVICTION_GRACE_SECONDS = 60 * 60 # recently returned features may not be loaded yet
+
+
+def hash_state_dict(state_dict):
+	h = hashlib.sha1()
+	for name, tensor in sorted(state_dict.items()):
+		h.update(name.encode())
+		h.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+	return h.hexdigest()
+
+def file_fingerprint(file_name):
+	file_stat = os.stat(file_name)
+	return [os.path.abspath(file_name), file_stat.st_size, file_stat.st_mtime_ns]
+
+def features_key(cnn, shapes_dataset):
+	key = {
+		'cnn': hash_state_dict(cnn.state_dict()),
+		'images': [file_fingerprint('shapes/{}/{}'.format(shapes_dataset, f))
+			for f in ['train.large.input.npy', 'val.input.npy', 'test.input.npy']],
+		'image_size': IMAGE_SIZE,
+		# get_features only extracts a few batches when debugging on cpu
+		'truncated': not use_gpu,
+	}
+	return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+def folder_size(folder_name):
+	return sum(os.path.getsize(os.path.join(folder_name, f)) for f in os.listdir(folder_name))
+
+
+class CacheIndex:
+	"""
+	index.json of the cache, mapping keys to the dataset, size and last use of their features.
+	Used as a context manager that holds an exclusive lock on the index while it is open.
+	"""
+	def __init__(self, cache_folder):
+		self.file_name = os.path.join(cache_folder, 'index.json')
+		self.lock_file_name = os.path.join(cache_folder, 'index.lock')
+
+	def __enter__(self):
+		self.lock_file = open(self.lock_file_name, 'w')
+		fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+
+		if os.path.exists(self.file_name):
+			with open(self.file_name) as f:
+				self.entries = json.load(f)
+		else:
+			self.entries = {}
+
+		return self
+
+	def __exit__(self, *args):
+		temp_file_name = '{}.tmp'.format(self.file_name)
+		with open(temp_file_name, 'w') as f:
+			json.dump(self.entries, f, indent=1)
+		os.replace(temp_file_name, self.file_name)
+
+		fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+		self.lock_file.close()
+
+
+def load_cached_features(cnn, shapes_dataset, cache_folder=CACHE_FOLDER, max_bytes=MAX_CACHE_BYTES):
+	"""
+	Returns the folder with the features of shapes_dataset extracted by cnn.
+	Folders are named by a hash of the CNN weights, the dataset files and the transform,
+	so a retrained CNN never reuses stale features. Only one of the jobs that need the same
+	features extracts them, the others wait for it. Least recently used features are
+	evicted once the cache grows over max_bytes, except those used in the last
+	EVICTION_GRACE_SECONDS.
+	"""
+	if not os.path.exists(cache_folder):
+		os.makedirs(cache_folder, exist_ok=True)
+
+	key = features_key(cnn, shapes_dataset)
+	features_folder_name = os.path.join(cache_folder, key)
+	partial_folder_name = '{}.partial'.format(features_folder_name)
+	lock_file_name = '{}.lock'.format(features_folder_name)
+
+	while True:
+		if not do_features_exist(features_folder_name):
+			# The lock is released when the extracting job exits, also if it is killed
+			with open(lock_file_name, 'w') as lock_file:
+				fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+				# Unless another job extracted them while this one waited
+				if not do_features_exist(features_folder_name):
+					# Resumes the extraction of an interrupted job, if any
+					save_features(cnn, shapes_dataset, key, output_features_folder=partial_folder_name)
+					os.rename(partial_folder_name, features_folder_name)
+
+				fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+		with CacheIndex(cache_folder) as index:
+			# Another job may have evicted them since they were checked, then they are extracted again
+			if not do_features_exist(features_folder_name):
+				continue
+
+			index.entries[key] = {
+				'dataset': shapes_dataset,
+				'size': folder_size(features_folder_name),
+				'last_used': time.time(),
+			}
+
+			total_size = sum(entry['size'] for entry in index.entries.values())
+			for evicted_key in sorted(index.entries, key=lambda k: index.entries[k]['last_used']):
+				if total_size <= max_bytes:
+					break
+				# Other jobs may still be about to load the features they were just given
+				if time.time() - index.entries[evicted_key]['last_used'] < EVICTION_GRACE_SECONDS:
+					break
+
+				shutil.rmtree(os.path.join(cache_folder, evicted_key), ignore_errors=True)
+				total_size -= index.entries.pop(evicted_key)['size']
+
+			return features_folder_name
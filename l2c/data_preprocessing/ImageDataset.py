@@ -1,6 +1,5 @@
 import numpy as np
 import torch
-import random
 from torch.utils.data.sampler import Sampler
 
 class ImageDataset():
@@ -23,11 +22,21 @@ class ImageDataset():
 
         return (self.features[target_idx], distractors)
 
+    def __getitems__(self, indices):
+        # Whole batch at once, indices is the batch_size x (K+1) matrix from ImagesSampler
+        indices = np.asarray(indices)
+        return (torch.from_numpy(self.features[indices[:, 0]]), torch.from_numpy(self.features[indices[:, 1:]]))
+
     def __len__(self):
         return self.features.shape[0]
 
 
 
+def collate_batch(batch):
+    # Batches returned by __getitems__ are already collated
+    return batch
+
+
 # class ImageDataset(object):
 #     def __init__(self, features, mean=None, std=None):
 #         if mean is None:
@@ -45,32 +54,66 @@ class ImageDataset():
 #         return self.features.shape[0]
 
 
+def sample_distractors(rng, n, targets, k, exclude_targets=True):
+    """
+    Draws k distinct distractors for every target at once.
+    Rows that drew the same index twice are redrawn in bulk.
+    Args:
+        rng: numpy RandomState used for the draws
+        n (int): number of images to draw from
+        targets: array with the target index of every row
+        k (int): number of distractors per target
+        exclude_targets (bool): whether a target can be its own distractor
+    """
+    n_choices = n - 1 if exclude_targets else n
+    distractors = rng.randint(n_choices, size=(len(targets), k))
+
+    n_bulk_redraws = 10
+    for _ in range(n_bulk_redraws):
+        sorted_distractors = np.sort(distractors, axis=1)
+        has_repeated = np.any(sorted_distractors[:, 1:] == sorted_distractors[:, :-1], axis=1)
+        if not has_repeated.any():
+            break
+        distractors[has_repeated] = rng.randint(n_choices, size=(has_repeated.sum(), k))
+    else:
+        # Only happens when k is close to n
+        for i in np.nonzero(has_repeated)[0]:
+            distractors[i] = rng.choice(n_choices, k, replace=False)
+
+    if exclude_targets:
+        distractors += distractors >= targets[:, None] # skip the target
+
+    return distractors
+
+
 class ImagesSampler(Sampler):
-    def __init__(self, data_source, k, shuffle):
+    """
+    Yields whole batches of rows [target, distractor_1, ..., distractor_k],
+    so it is used as the batch_sampler of a DataLoader.
+    """
+    def __init__(self, data_source, k, shuffle, batch_size, drop_last=False, seed=None, exclude_targets=True):
         self.n = len(data_source)
         self.k = k
         self.shuffle = shuffle
+        self.batch_size = batch_size
+        self.drop_last = drop_last
+        self.exclude_targets = exclude_targets
+        self.rng = np.random.RandomState(seed)
         assert self.k < self.n
 
     def __iter__(self):
-        indices = []
-
         if self.shuffle:
-            targets = torch.randperm(self.n).tolist()
+            targets = self.rng.permutation(self.n)
         else:
-            targets = list(range(self.n))
+            targets = np.arange(self.n)
 
-        for t in targets:
-            arr = np.zeros(self.k + 1, dtype=int) # distractors + target
-            arr[0] = t
-            distractors = random.sample(range(self.n), self.k)
-            while t in distractors:
-                distractors = random.sample(range(self.n), self.k)
-            arr[1:] = np.array(distractors)
-            
-            indices.append(arr)
+        indices = np.zeros((self.n, self.k + 1), dtype=int) # distractors + target
+        indices[:, 0] = targets
+        indices[:, 1:] = sample_distractors(self.rng, self.n, targets, self.k, self.exclude_targets)
 
-        return iter(indices)
+        return iter([indices[i * self.batch_size:(i + 1) * self.batch_size] for i in range(len(self))])
 
     def __len__(self):
-        return self.n
\ No newline at end of file
+        if self.drop_last:
+            return self.n // self.batch_size
+        return (self.n + self.batch_size - 1) // self.batch_size
@@ -1 +1 @@
-from data_preprocessing.ImageDataset import ImageDataset, ImagesSampler
\ No newline at end of file
+from data_preprocessing.ImageDataset import ImageDataset, ImagesSampler, collate_batch
\ No newline at end of file
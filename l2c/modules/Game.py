@@ -22,13 +22,14 @@ class Game(nn.Module):
 
         target_score = T.bmm(image_f, predicted_f).squeeze()
         
-        distractors_scores = []
+        if isinstance(distractors, T.Tensor):
+            # batch_size x K x image_dim, scored in one bmm
+            distractors_scores = T.bmm(distractors.view(batch_size, distractors.shape[1], -1), predicted_f).view(batch_size, -1).unbind(dim=1)
+        else:
+            distractors_scores = [T.bmm(d.view(batch_size, 1, -1), predicted_f).squeeze() for d in distractors]
 
         reward = 0
-        for d in distractors:
-            d = d.view(batch_size, 1, -1)#.to(device=device)
-            d_score = T.bmm(d, predicted_f).squeeze()
-            distractors_scores.append(d_score)
+        for d_score in distractors_scores:
             zero_tensor = T.tensor(0.0, device=device)
 
             reward += T.max(zero_tensor, margin - target_score + d_score)
@@ -10,8 +10,7 @@ from utils import AverageMeter
 from utils import EarlyStopping
 from utils import get_lr_scheduler
 from torch.utils.data import DataLoader
-from data_preprocessing import ImageDataset, ImagesSampler
-from torch.utils.data.sampler import BatchSampler
+from data_preprocessing import ImageDataset, ImagesSampler, collate_batch
 
 
 use_gpu = T.cuda.is_available()
@@ -33,7 +32,7 @@ def validate(valid_data, model, epoch, args, logger):
             image_f, distractors = d
             if use_gpu:
                 image_f = image_f.to(device=device)
-                distractors = [d.to(device=device) for d in distractors]
+                distractors = distractors.to(device=device)
                 
             hinge_loss, accuracy, entropy = model(image_f, distractors, args.margin)
 
@@ -63,7 +62,7 @@ def train(train_data, model, optimizer, epoch, args, logger):
     for image_f, distractors in train_data:
         if use_gpu:
             image_f = image_f.to(device=device)
-            distractors = [d.to(device=device) for d in distractors]
+            distractors = distractors.to(device=device)
 
         hinge_loss, accuracy, entropy = model(image_f, distractors, args.margin)
         optimizer.zero_grad()
@@ -126,11 +125,11 @@ def main(args):
     # train_data = DataLoader(train_dataset, batch_size=args.batch_size, shuffle=True, num_workers=8, pin_memory=True)
     # valid_data = DataLoader(valid_dataset, batch_size=args.batch_size, num_workers=8, pin_memory=True)
 
-    train_data = DataLoader(train_dataset, num_workers=8, pin_memory=True, 
-        batch_sampler=BatchSampler(ImagesSampler(train_dataset, K, shuffle=True), batch_size=args.batch_size, drop_last=True))
+    train_data = DataLoader(train_dataset, num_workers=8, pin_memory=True, collate_fn=collate_batch,
+        batch_sampler=ImagesSampler(train_dataset, K, shuffle=True, batch_size=args.batch_size, drop_last=True, seed=seed))
 
-    valid_data = DataLoader(valid_dataset, num_workers=8, pin_memory=True,
-        batch_sampler=BatchSampler(ImagesSampler(valid_dataset, K, shuffle=False), batch_size=args.batch_size, drop_last=True))
+    valid_data = DataLoader(valid_dataset, num_workers=8, pin_memory=True, collate_fn=collate_batch,
+        batch_sampler=ImagesSampler(valid_dataset, K, shuffle=False, batch_size=args.batch_size, drop_last=True, seed=seed))
 
 
     model = Game(vocab_size=args.vocab_size, image_dim=args.image_dim,
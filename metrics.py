@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import torch
+
+from rsa import representation_similarity_analysis
+from entropy import language_entropy
+
+def to_host(x):
+	# Device tensors are copied into pinned memory without blocking, only the calling thread waits for the copy
+	if not isinstance(x, torch.Tensor) or not x.is_cuda:
+		return x
+
+	host_x = torch.empty(x.shape, dtype=x.dtype, pin_memory=True)
+	host_x.copy_(x, non_blocking=True)
+	copied = torch.cuda.Event()
+	copied.record()
+	copied.synchronize()
+	return host_x
+
+def calculate_metrics(snapshot, n_rsa_samples):
+	target, onehot_metadata, messages, input_embed_rep_sender, input_embed_rep_receiver = [to_host(x) for x in snapshot]
+	messages = messages.numpy()
+
+	if n_rsa_samples > 0:
+		rsa_sr, rsa_si, rsa_ri, topological_sim = representation_similarity_analysis(
+				target,
+				onehot_metadata,
+				messages,
+				input_embed_rep_sender,
+				input_embed_rep_receiver,
+				samples=n_rsa_samples
+			)
+	else:
+		rsa_sr = 0
+		rsa_si = 0
+		rsa_ri = 0
+		topological_sim = 0
+
+	return rsa_sr, rsa_si, rsa_ri, topological_sim, language_entropy(messages)
+
+
+class MetricsWorker:
+	"""
+	Computes the analysis metrics (RSA, topological similarity and language entropy)
+	of every batch in background threads, so that training does not wait for them.
+	The snapshots of the batches are copied from the device in the threads too.
+	Results are handed to the meters in submission order when collect is called.
+	At most max_pending batches are in flight, submit waits beyond that, so the
+	snapshots kept on the device stay bounded when the metrics are slower than training.
+	"""
+	def __init__(self, n_rsa_samples, n_workers=2, max_pending=8):
+		self.n_rsa_samples = n_rsa_samples
+		self.max_pending = max_pending
+		self.executor = ThreadPoolExecutor(max_workers=n_workers)
+		self.futures = []
+		self.pending = set()
+
+	def submit(self, snapshot):
+		while len(self.pending) >= self.max_pending:
+			_done, self.pending = wait(self.pending, return_when=FIRST_COMPLETED)
+
+		future = self.executor.submit(calculate_metrics, snapshot, self.n_rsa_samples)
+		self.futures.append(future)
+		self.pending.add(future)
+
+	def collect(self, rsa_sr_meter, rsa_si_meter, rsa_ri_meter, topological_sim_meter, language_entropy_meter):
+		for f in self.futures:
+			rsa_sr, rsa_si, rsa_ri, topological_sim, lang_entropy = f.result()
+
+			rsa_sr_meter.update(rsa_sr)
+			rsa_si_meter.update(rsa_si)
+			rsa_ri_meter.update(rsa_ri)
+			topological_sim_meter.update(topological_sim)
+			language_entropy_meter.update(lang_entropy)
+
+		self.futures = []
+		self.pending = set()
+
+	def shutdown(self):
+		self.executor.shutdown(wait=True)
+		self.futures = []
+		self.pending = set()
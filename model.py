@@ -1,13 +1,9 @@
 import torch
 import torch.nn as nn
 from torch.nn import functional as F
-from torch.distributions.categorical import Categorical
-from torch.distributions.relaxed_categorical import RelaxedOneHotCategorical
 
 from visual_module import CNN
-from rsa import representation_similarity_analysis
 from utils import discretize_messages
-from entropy import language_entropy
 
 class Sender(nn.Module):
 	def __init__(self, n_image_features, vocab_size, 
@@ -24,6 +20,7 @@ class Sender(nn.Module):
 		self.bound_weight = bound_weight
 		self.greedy = greedy
 		self.use_gpu = use_gpu
+		self.eps = torch.finfo(torch.float32).eps
 
 		self.lstm_cell = nn.LSTMCell(embedding_dim, hidden_size)
 		self.aff_transform = nn.Linear(n_image_features, hidden_size)
@@ -49,15 +46,15 @@ class Sender(nn.Module):
 		nn.init.constant_(self.lstm_cell.bias_hh, val=0)
 		nn.init.constant_(self.lstm_cell.bias_hh[self.hidden_size:2 * self.hidden_size], val=1)
 
-	def _calculate_seq_len(self, seq_lengths, token, initial_length, seq_pos):	
+	def _calculate_seq_len(self, seq_lengths, token, initial_length: int, seq_pos: int):
 		if self.training:
 			max_predicted, vocab_index = torch.max(token, dim=1)
-			mask = (vocab_index == self.bound_token_idx) * (max_predicted == 1.0)
+			mask = (vocab_index == self.bound_token_idx) & (max_predicted == 1.0)
 		else:
 			mask = token == self.bound_token_idx
 
-		mask *= seq_lengths == initial_length
-		seq_lengths[mask.nonzero()] = seq_pos + 1 # start symbol always appended
+		mask = mask & (seq_lengths == initial_length)
+		seq_lengths.masked_fill_(mask, seq_pos + 1) # start symbol always appended
 
 	def _discretize_token(self, token):
 		if self.training:
@@ -66,83 +63,84 @@ class Sender(nn.Module):
 		else:
 			return token
 
-	def forward(self, t, word_counts, tau=1.2):
+	def _gumbel_softmax_st(self, log_p, tau: float):
+		# Same sampling as RelaxedOneHotCategorical(tau, p).rsample(), without the distribution objects
+		uniforms = torch.rand_like(log_p).clamp(min=self.eps, max=1 - self.eps)
+		gumbels = -torch.log(-torch.log(uniforms))
+		token = F.softmax((log_p + gumbels) / tau, dim=1)
+
+		# Straight-through part
+		token_hard = torch.zeros_like(token)
+		token_hard.scatter_(-1, torch.argmax(token, dim=-1, keepdim=True), 1.0)
+		return (token_hard - token).detach() + token
+
+	def forward(self, t, word_counts, tau: float = 1.2):
 		batch_size = t.shape[0]
+		device = t.device
 
+		# Preallocated outputs, the start symbol is at position 0
 		if self.training:
-			message = [torch.zeros((batch_size, self.vocab_size), dtype=torch.float32)]
-			if self.use_gpu:
-				message[0] = message[0].cuda()
-			message[0][:, self.bound_token_idx] = 1.0
+			message = torch.zeros((batch_size, self.max_sentence_length + 1, self.vocab_size), dtype=torch.float32, device=device)
+			message[:, 0, self.bound_token_idx] = 1.0
 		else:
-			message = [torch.full((batch_size, ), fill_value=self.bound_token_idx, dtype=torch.int64)]
-			if self.use_gpu:
-				message[0] = message[0].cuda()
+			message = torch.full((batch_size, self.max_sentence_length + 1), fill_value=self.bound_token_idx, dtype=torch.int64, device=device)
+
+		input_embed_rep = torch.empty((batch_size, self.max_sentence_length, self.embedding.shape[1]), dtype=torch.float32, device=device)
 
 		# h0, c0
 		h = self.aff_transform(t) # batch_size, hidden_size
-		c = torch.zeros([batch_size, self.hidden_size])
+		c = torch.zeros([batch_size, self.hidden_size], device=device)
 
 		initial_length = self.max_sentence_length + 1
-		seq_lengths = torch.ones([batch_size], dtype=torch.int64) * initial_length
-
-		ce_loss = nn.CrossEntropyLoss(reduction='none')
+		seq_lengths = torch.full([batch_size], fill_value=initial_length, dtype=torch.int64, device=device)
 
 		# Handle alpha by giving weight to the padding token
 		w_counts = word_counts.clone() # Tensor is passed by ref
 		w_counts[self.bound_token_idx] *= self.bound_weight
 
 		denominator = w_counts.sum()
-		if denominator > 0:
+		if bool(denominator > 0):
 			normalized_word_counts = w_counts / denominator
 		else:
 			normalized_word_counts = w_counts
 
-		vl_loss = 0.0
-		entropy = 0.0
-		
-		if self.use_gpu:
-			c = c.cuda()
-			seq_lengths = seq_lengths.cuda()
+		vl_loss = torch.zeros([batch_size], device=device)
+		entropy = torch.zeros([batch_size], device=device)
 
-		input_embed_rep = []
+		# Previous token is kept apart from the output buffer, which is written in place
+		token = message[:, 0].clone()
 
 		for i in range(self.max_sentence_length): # or sampled <EOS>, but this is batched
-			emb = torch.matmul(message[-1], self.embedding) if self.training else self.embedding[message[-1]]
+			emb = torch.matmul(token, self.embedding) if self.training else self.embedding[token]
 			h, c = self.lstm_cell(emb, (h, c))
 
 			vocab_scores = self.linear_probs(h)
-			p = F.softmax(vocab_scores, dim=1)
-			entropy += Categorical(p).entropy()
+			log_p = F.log_softmax(vocab_scores, dim=1)
+			p = torch.exp(log_p)
+			entropy = entropy - torch.sum(p * log_p, dim=1)
 
-			if self.training:	
-				rohc = RelaxedOneHotCategorical(tau, p)
-				token = rohc.rsample()
-
-				# Straight-through part
-				token_hard = torch.zeros_like(token)
-				token_hard.scatter_(-1, torch.argmax(token, dim=-1, keepdim=True), 1.0)
-				token = (token_hard - token).detach() + token
+			if self.training:
+				token = self._gumbel_softmax_st(log_p, tau)
 			else:
 				if self.greedy:
 					_, token = torch.max(p, -1)
 				else:
-					token = Categorical(p).sample()
+					token = torch.multinomial(p, 1, True).squeeze(1)
 
-			message.append(token)
-			input_embed_rep.append(emb)
+			message[:, i + 1] = token
+			input_embed_rep[:, i] = emb
 
 			self._calculate_seq_len(seq_lengths, token, 
 				initial_length, seq_pos=i+1)
 
 			if self.vl_loss_weight > 0.0:
-				vl_loss += ce_loss(vocab_scores - normalized_word_counts, self._discretize_token(token))
+				vl_loss = vl_loss + F.cross_entropy(vocab_scores - normalized_word_counts, self._discretize_token(token), reduction='none')
 
-		return (torch.stack(message, dim=1), 
+		return (message, 
 				seq_lengths, 
 				vl_loss, 
 				torch.mean(entropy) / self.max_sentence_length,
-				torch.stack(input_embed_rep, dim=1))
+				input_embed_rep)
 
 
 class Receiver(nn.Module):
@@ -177,15 +175,11 @@ class Receiver(nn.Module):
 		batch_size = m.shape[0]
 
 		# h0, c0
-		h = torch.zeros([batch_size, self.hidden_size])
-		c = torch.zeros([batch_size, self.hidden_size])
-
-		if self.use_gpu:
-			h = h.cuda()
-			c = c.cuda()		
+		h = torch.zeros([1, batch_size, self.hidden_size], device=m.device)
+		c = torch.zeros([1, batch_size, self.hidden_size], device=m.device)
 
 		emb = torch.matmul(m, self.embedding) if self.training else self.embedding[m]
-		_, (h, c) = self.lstm(emb, (h[None, ...], c[None, ...]))
+		_, (h, c) = self.lstm(emb, (h, c))
 
 		return self.aff_transform(h), emb
 
@@ -216,12 +210,16 @@ class Model(nn.Module):
 		self.receiver = Receiver(n_image_features, vocab_size,
 			embedding_dim, hidden_size, use_gpu)
 
+	def compile_agents(self):
+		# Compiles the sender and receiver with TorchScript, which removes most of the
+		# Python overhead of the decoding loop (mostly noticeable when training on CPU)
+		self.sender = torch.jit.script(self.sender)
+		self.receiver = torch.jit.script(self.receiver)
+
 	def _pad(self, m, seq_lengths):
 		max_len = m.shape[1]
 
-		mask = torch.arange(max_len)
-		if self.use_gpu:
-			mask = mask.cuda()
+		mask = torch.arange(max_len, device=m.device)
 
 		mask = mask.expand(
 			len(seq_lengths), max_len
@@ -238,25 +236,66 @@ class Model(nn.Module):
 
 	def _get_word_counts(self, m):
 		if self.training:
-			c = m.sum(dim=1).sum(dim=0).detach() # ToDo: are we sure about this???? Yeah, we are
+			c = m.detach().sum(dim=(0, 1)) # Soft one hot tokens, so summing gives the counts
 		else:
-			c = torch.zeros([self.vocab_size])
-			if self.use_gpu:
-				c = c.cuda()
-
-			for w_idx in range(self.vocab_size):
-				c[w_idx] = (m == w_idx).sum()
+			c = torch.bincount(m.flatten(), minlength=self.vocab_size).to(dtype=torch.float32)
 		return c
 
 	def _count_unique_messages(self, m):
 		return len(torch.unique(m, dim=0))
 
-	def forward(self, target, distractors, word_counts, target_onehot_metadata):
+	def _score(self, target, distractors, r_transform):
+		# distractors is batch_size x K x n_features, or a list of K batch_size x n_features (older callers)
+		batch_size = target.shape[0]
+		if not isinstance(distractors, torch.Tensor):
+			distractors = torch.stack(list(distractors), dim=1)
+
+		# Target goes first, then the K distractors: batch_size x (K+1)
+		r = r_transform.view(batch_size, -1, 1)
+		target_scores = torch.bmm(target.view(batch_size, 1, -1), r)
+		distractors_scores = torch.bmm(distractors.reshape(batch_size, distractors.shape[1], -1), r)
+		scores = torch.cat([target_scores, distractors_scores], dim=1).squeeze(2)
+
+		# Hinge loss summed over the distractors
+		loss = torch.clamp(1.0 - scores[:, :1] + scores[:, 1:], min=0.0).sum(dim=1)
+
+		accuracy = torch.argmax(scores, dim=1) == 0 # target is the first element
+		accuracy = accuracy.to(dtype=torch.float32)
+
+		return loss, accuracy
+
+	def _score_in_batch(self, target, r_transform):
+		# Every other target in the batch is a distractor: scores[i, j] = r_i . t_j
+		batch_size = target.shape[0]
+		scores = torch.matmul(r_transform.view(batch_size, -1), target.view(batch_size, -1).t())
+
+		# The same image can be the target of several rows (e.g. symbolic inputs), those are not negatives
+		flat_target = target.view(batch_size, -1)
+		is_target = (flat_target.unsqueeze(1) == flat_target.unsqueeze(0)).all(dim=2)
+
+		# Hinge loss summed over the other targets of the batch
+		loss = torch.clamp(1.0 - scores.diagonal().unsqueeze(1) + scores, min=0.0)
+		loss = loss.masked_fill(is_target, 0.0).sum(dim=1)
+
+		# Duplicates of the target are left out, so they don't tie with it
+		is_duplicate = is_target & ~torch.eye(batch_size, dtype=torch.bool, device=scores.device)
+		accuracy = torch.argmax(scores.masked_fill(is_duplicate, float('-inf')), dim=1) == torch.arange(batch_size, device=scores.device)
+		accuracy = accuracy.to(dtype=torch.float32)
+
+		return loss, accuracy
+
+	def forward(self, target, distractors, word_counts, target_onehot_metadata, use_in_batch_negatives=False):
 		batch_size = target.shape[0]
 
+		# batch_size x K x ... from the batched feature datasets, a list of K batches from older callers
+		is_distractors_tensor = isinstance(distractors, torch.Tensor)
+		# In-batch negatives never read the distractors, which are then empty (K=0)
+		use_distractors = not use_in_batch_negatives
+
 		if self.use_gpu:
 			target = target.cuda()
-			distractors = [d.cuda() for d in distractors]
+			if use_distractors:
+				distractors = distractors.cuda() if is_distractors_tensor else [d.cuda() for d in distractors]
 
 		n_dim = 5 if self.should_train_cnn else 3
 		use_different_targets = len(target.shape) == n_dim
@@ -266,7 +305,12 @@ class Model(nn.Module):
 			if not use_different_targets:
 				# Extract features
 				target = self.cnn(target)
-				distractors = [self.cnn(d) for d in distractors]
+				if not use_distractors:
+					pass
+				elif is_distractors_tensor:
+					distractors = self.cnn(distractors.flatten(0, 1)).view(batch_size, distractors.shape[1], -1)
+				else:
+					distractors = [self.cnn(d) for d in distractors]
 
 				target_sender = target
 				target_receiver = target
@@ -276,7 +320,12 @@ class Model(nn.Module):
 				target_receiver = self.cnn(target[:, 1, :, :, :])
 
 				# Just use the first distractor
-				distractors = [self.cnn(d[:, 0, :, :, :]) for d in distractors]
+				if not use_distractors:
+					pass
+				elif is_distractors_tensor:
+					distractors = self.cnn(distractors[:, :, 0].flatten(0, 1)).view(batch_size, distractors.shape[1], -1)
+				else:
+					distractors = [self.cnn(d[:, 0, :, :, :]) for d in distractors]
 		else:
 			if not use_different_targets:
 				target_sender = target
@@ -286,7 +335,8 @@ class Model(nn.Module):
 				target_receiver = target[:, 1, :]
 
 				# Just use the first distractor
-				distractors = [d[:, 0, :] for d in distractors]
+				if use_distractors:
+					distractors = distractors[:, :, 0] if is_distractors_tensor else [d[:, 0, :] for d in distractors]
 
 		# Forward pass on Sender with its target
 		m, seq_lengths, vl_loss, entropy, input_embed_rep_sender = self.sender(target_sender, word_counts)
@@ -299,58 +349,26 @@ class Model(nn.Module):
 		# Forward pass on Receiver with the message
 		r_transform, input_embed_rep_receiver = self.receiver(m) # g(.)
 
-		# Loss calculation
-		loss = 0
-
-		target_receiver = target_receiver.view(batch_size, 1, -1)
-		r_transform = r_transform.view(batch_size, -1, 1)
-
-		target_score = torch.bmm(target_receiver, r_transform).squeeze() #scalar
-
-		distractors_scores = []
-
-		for d in distractors:			
-			d = d.view(batch_size, 1, -1)
-			d_score = torch.bmm(d, r_transform).squeeze()
-			distractors_scores.append(d_score)
-			zero_tensor = torch.tensor(0.0)
-			if self.use_gpu:
-				zero_tensor = zero_tensor.cuda()
-
-			loss += torch.max(zero_tensor, 1.0 - target_score + d_score)
-
-		# Calculate accuracy
-		all_scores = torch.zeros((batch_size, 1 + len(distractors)))
-		all_scores[:,0] = target_score
-
-		for i, score in enumerate(distractors_scores):
-			all_scores[:,i+1] = score
-
-		all_scores = torch.exp(all_scores)
-
-		_, max_idx = torch.max(all_scores, 1)
-
-		accuracy = max_idx == 0 # target is the first element
-		accuracy = accuracy.to(dtype=torch.float32)
+		if use_in_batch_negatives:
+			loss, accuracy = self._score_in_batch(target_receiver, r_transform)
+		else:
+			loss, accuracy = self._score(target_receiver, distractors, r_transform)
 
 		loss = loss + self.vl_loss_weight * vl_loss
 
-		messages_for_metrics = discretize_messages(m).detach().cpu().numpy() if self.training else m.cpu().numpy()
+		messages_for_metrics = discretize_messages(m) if self.training else m
 
+		# Detached tensors of everything the analysis metrics need, still on the device:
+		# calculate_metrics copies them to the host, in the MetricsWorker if there is one
 		if self.n_rsa_samples > 0:
-			rsa_sr, rsa_si, rsa_ri, topological_sim = representation_similarity_analysis(
-					target_sender.cpu(),
-					target_onehot_metadata,
-					messages_for_metrics,
-					input_embed_rep_sender.detach().cpu(),
-					input_embed_rep_receiver.detach().cpu(),
-					samples=self.n_rsa_samples
-				)
+			metrics_snapshot = (
+				target_sender.detach(),
+				target_onehot_metadata,
+				messages_for_metrics.detach(),
+				input_embed_rep_sender.detach(),
+				input_embed_rep_receiver.detach())
 		else:
-			rsa_sr = 0
-			rsa_si = 0
-			rsa_ri = 0
-			topological_sim = 0
+			metrics_snapshot = (None, None, messages_for_metrics.detach(), None, None)
 
 		return (torch.mean(loss), 
 			torch.mean(accuracy), 
@@ -358,8 +376,4 @@ class Model(nn.Module):
 			w_counts, 
 			torch.mean(entropy),
 			self._count_unique_messages(m) / batch_size,
-			rsa_sr,
-			rsa_si,
-			rsa_ri,
-			topological_sim,
-			language_entropy(messages_for_metrics))
+			metrics_snapshot)
@@ -0,0 +1,31 @@
+import argparse
+import time
+import numpy as np
+
+from ImageDataset import load_mean_std, resize_images
+
+# Caches the normalization statistics (and optionally the resized images) of datasets before launching jobs that use them
+# e.g. python precompute_stats.py shapes/balanced_3_3/train.large.input.npy --features data/mscoco/train_features.npy
+
+cmd_parser = argparse.ArgumentParser()
+cmd_parser.add_argument('pixels', nargs='*', help='shapes pixels files, reduced over all but the channels axis')
+cmd_parser.add_argument('--resize', action='store_true', help='also cache the pixels resized for --use_resized_images')
+cmd_parser.add_argument('--features', nargs='*', default=[], help='pretrained features files, reduced over the first axis')
+
+cmd_args = cmd_parser.parse_args()
+
+for file_name in cmd_args.pixels:
+	start = time.time()
+	ndim = np.load(file_name, mmap_mode='r').ndim
+	mean, std = load_mean_std(file_name, axis=tuple(range(ndim-1)))
+	print('{}: stats of shape {} in {:.1f}s'.format(file_name, mean.shape, time.time() - start))
+
+	if cmd_args.resize:
+		start = time.time()
+		resized_file_name = resize_images(file_name)
+		print('{}: resized into {} in {:.1f}s'.format(file_name, resized_file_name, time.time() - start))
+
+for file_name in cmd_args.features:
+	start = time.time()
+	mean, std = load_mean_std(file_name, axis=0)
+	print('{}: stats of shape {} in {:.1f}s'.format(file_name, mean.shape, time.time() - start))
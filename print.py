@@ -1,6 +1,7 @@
 #import matplotlib.pyplot as plt
 import sys
-import pickle
+
+from run_store import RunStore
 
 assert len(sys.argv) > 1, 'Input dumps dir, model id, train file id, epoch'
 dir = '{}/{}'.format(sys.argv[1], sys.argv[2])
@@ -8,23 +9,19 @@ model_id = sys.argv[2]
 file_id = sys.argv[3]
 epoch = sys.argv[4]
 
-#01_25_08_07_2_losses_meters.p
-
-train_file_name = '{}/{}_{}_{}.p'.format(dir, model_id, epoch, file_id)
-val_file_name = '{}/{}_{}_eval_{}.p'.format(dir, model_id, epoch, file_id)
+# e.g. messages, indices, losses_meters, accuracy_meters
+run_store = RunStore(dir)
 
-train_data = pickle.load(open(train_file_name,'rb'))
-val_data = pickle.load(open(val_file_name,'rb'))
-
-if 'messages' in file_id:
+if 'messages' in file_id or 'indices' in file_id:
+    name = 'messages' if 'messages' in file_id else 'indices'
     print('Train')
-    print(train_data)
+    print(run_store.array('train', name, epoch))
     print('Val')
-    print(val_data)
+    print(run_store.array('eval', name, epoch))
 else:
-    print('Train', [p.avg for p in train_data])
-    print('Val', [p.avg for p in val_data])
-
+    metric = 'loss' if 'loss' in file_id else file_id.replace('_meters', '')
+    print('Train', list(run_store.metric('train', metric)))
+    print('Val', list(run_store.metric('eval', metric)))
 
 
 #iterations = list(range(len(train_losses)))
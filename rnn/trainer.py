@@ -10,12 +10,15 @@ from feature_rnn import FeatureRNN
 from utils import EarlyStopping, AverageMeter
 from data_loader import load_messages_data, Property
 
+sys.path.append('..')
+from checkpoint_manager import CheckpointManager
+
 use_gpu=torch.cuda.is_available()
 
 EPOCHS = 1000 if use_gpu else 2
 BATCH_SIZE = 128
 
-def train(model, data, property, current_model_dir):
+def train(model, data, property, current_model_dir, checkpoints):
 	optimizer = torch.optim.Adam(model.parameters(), lr=0.001) # Check lr and adam
 	es = EarlyStopping(mode="min", patience=30, threshold=0.005, threshold_mode="rel") # Check threshold
 
@@ -54,15 +57,8 @@ def train(model, data, property, current_model_dir):
 		
 		print('Epoch {}, loss {}'.format(e, loss_meter.avg))
 
-		# Save only the best model
-		if e == 0 or loss_meter.avg < np.min([m.avg for m in loss_meters]):
-			# First delete the old model
-			if e > 0:
-				old_model_files = ['{}/{}'.format(current_model_dir, f) for f in os.listdir(current_model_dir) if f.endswith('_model')]
-				if len(old_model_files) > 0:
-					os.remove(old_model_files[0])
-
-			torch.save(model.state_dict(), '{}/{}_{}_model'.format(current_model_dir, model_prop, e))
+		# Only the checkpoint of the best epoch is kept
+		checkpoints.step(e, loss_meter.avg, model.state_dict())
 
 		loss_meters.append(loss_meter)
 		es.step(loss_meter.avg)
@@ -157,13 +153,11 @@ for rnn, prop in [(color_rnn, Property.COLOR),
 				   (row_rnn, Property.ROW),
 				   (column_rnn, Property.COLUMN)]:
 
-	loss_meters = train(rnn, train_data, prop, current_model_dir)
-	best_epoch = np.argmin([m.avg for m in loss_meters])
-	best_model = FeatureRNN(2 if prop == Property.SIZE else 3)
-	best_model_name = '{}/{}_{}_model'.format(current_model_dir, str(prop).split('.')[-1].lower(), best_epoch)
-	print('Loading best model for evaluation: {}'.format(best_model_name))
-	state = torch.load(best_model_name, map_location= lambda storage, location: storage)
-	best_model.load_state_dict(state)
+	checkpoints = CheckpointManager(current_model_dir, str(prop).split('.')[-1].lower(), mode='min', keep_last=False)
+	loss_meters = train(rnn, train_data, prop, current_model_dir, checkpoints)
+	best_epoch = checkpoints.best_epoch
+	best_model = checkpoints.load_best(FeatureRNN(2 if prop == Property.SIZE else 3))
+	print('Best model for evaluation: {}'.format(checkpoints.best_file_name))
 
 	if use_gpu:
 		best_model = best_model.cuda()
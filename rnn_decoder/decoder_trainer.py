@@ -11,12 +11,15 @@ from rnn_decoder import Autoencoder
 from utils import EarlyStopping, AverageMeter, to_img
 from data_loader import load_message_image_data
 
+sys.path.append('..')
+from checkpoint_manager import CheckpointManager
+
 use_gpu=torch.cuda.is_available()
 
 EPOCHS = 1000 if use_gpu else 2
 BATCH_SIZE = 128
 
-def train(model, data, current_model_dir):
+def train(model, data, current_model_dir, checkpoints):
 	optimizer = torch.optim.Adam(model.parameters(), lr=1e-3, weight_decay=1e-5) # Check lr and adam
 	es = EarlyStopping(mode="min", patience=30, threshold=0.005, threshold_mode="rel") # Check threshold
 
@@ -45,15 +48,8 @@ def train(model, data, current_model_dir):
 		
 		print('Epoch {}, loss {}'.format(e, loss_meter.avg))
 
-		# Save only the best model
-		if e == 0 or loss_meter.avg < np.min([m.avg for m in loss_meters]):
-			# First delete the old model
-			if e > 0:
-				old_model_files = ['{}/{}'.format(current_model_dir, f) for f in os.listdir(current_model_dir) if f.endswith('_model')]
-				if len(old_model_files) > 0:
-					os.remove(old_model_files[0])
-
-			torch.save(model.state_dict(), '{}/{}_model'.format(current_model_dir, e))
+		# Only the checkpoint of the best epoch is kept
+		checkpoints.step(e, loss_meter.avg, model.state_dict())
 
 		loss_meters.append(loss_meter)
 		es.step(loss_meter.avg)
@@ -130,14 +126,12 @@ if use_gpu:
 # Load training data
 train_data, _val_data, test_data = load_message_image_data(data_folder_id, shapes_dataset, BATCH_SIZE)
 
-loss_meters = train(model, train_data, current_model_dir)
+checkpoints = CheckpointManager(current_model_dir, mode='min', keep_last=False)
+loss_meters = train(model, train_data, current_model_dir, checkpoints)
 
-best_epoch = np.argmin([m.avg for m in loss_meters])
-best_model = Autoencoder()
-best_model_name = '{}/{}_model'.format(current_model_dir, best_epoch)
-print('Loading best model for evaluation: {}'.format(best_model_name))
-state = torch.load(best_model_name, map_location= lambda storage, location: storage)
-best_model.load_state_dict(state)
+best_epoch = checkpoints.best_epoch
+best_model = checkpoints.load_best(Autoencoder())
+print('Best model for evaluation: {}'.format(checkpoints.best_file_name))
 
 if use_gpu:
 	best_model = best_model.cuda()
@@ -12,6 +12,62 @@ def one_hot(a):
     return out
 
 
+def sample_pairs(n, samples):
+    """
+    Draws the pairs of distinct indices RSA is computed over.
+    If the number of distinct pairs in the batch is not larger than
+    the requested number of samples, all pairs (the upper triangle) are used.
+    Args:
+        n (int): number of elements to draw pairs from
+        samples (int): number of pairs to sample
+    Returns:
+        two int arrays with the first and second index of every pair
+    """
+    if n * (n - 1) // 2 <= samples:
+        return np.triu_indices(n, k=1)
+
+    s1 = np.random.randint(n, size=samples)
+    s2 = np.random.randint(n - 1, size=samples)
+    s2 += s2 >= s1  # skip s1 so that both elements of a pair are distinct
+    return s1, s2
+
+
+def _to_2d_array(x):
+    if isinstance(x, torch.Tensor):
+        x = x.detach().cpu().numpy()
+    x = np.asarray(x, dtype=np.float64)
+    return x.reshape(x.shape[0], -1)
+
+
+def cosine_distances(x, s1, s2):
+    """
+    Cosine distance between x[s1[i]] and x[s2[i]] for every pair i,
+    equivalent to scipy.spatial.distance.cosine on the flattened rows.
+    """
+    x = _to_2d_array(x)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = x / np.linalg.norm(x, axis=1, keepdims=True)
+
+    if len(s1) > x.shape[0]:
+        # Cheaper to compute all similarities once than to gather every pair
+        sim = np.dot(x, x.T)[s1, s2]
+    else:
+        sim = np.einsum("ij,ij->i", x[s1], x[s2])
+
+    return 1.0 - sim
+
+
+def message_cosine_distances(messages, s1, s2):
+    """
+    Cosine distance between the one hot encodings of the message pairs.
+    Every position of a one hot message holds exactly one 1, so the distance
+    reduces to the fraction of positions in which the two messages differ.
+    """
+    messages = np.asarray(messages).reshape(len(messages), -1)
+    return 1.0 - np.mean(messages[s1] == messages[s2], axis=1)
+
+
 def representation_similarity_analysis(
     test_images,
     test_metadata,
@@ -35,37 +91,15 @@ def representation_similarity_analysis(
         tre (bool, optional): default False - whether to also calculate pseudo-TRE
     @TODO move to metrics repo
     """
-    # one hot encode messages by taking padding into account and transforming to one hot
-    messages = one_hot(generated_messages)
-
-    assert test_metadata.shape[0] == messages.shape[0]
-
-    sim_image_features = np.zeros(samples)
-    sim_metadata = np.zeros(samples)
-    sim_messages = np.zeros(samples)
-    sim_hidden_sender = np.zeros(samples)
-    sim_hidden_receiver = np.zeros(samples)
-
-    for i in range(samples):
-        rnd = np.random.choice(len(test_metadata), 2, replace=False)
-        s1, s2 = rnd[0], rnd[1]
-
-        sim_image_features[i] = scipy.spatial.distance.cosine(
-            test_images[s1], test_images[s2]
-        )
-        sim_metadata[i] = scipy.spatial.distance.cosine(
-            test_metadata[s1], test_metadata[s2]
-        )
-
-        sim_messages[i] = scipy.spatial.distance.cosine(
-            messages[s1].flatten(), messages[s2].flatten()
-        )
-        sim_hidden_sender[i] = scipy.spatial.distance.cosine(
-            hidden_sender[s1].flatten(), hidden_sender[s2].flatten()
-        )
-        sim_hidden_receiver[i] = scipy.spatial.distance.cosine(
-            hidden_receiver[s1].flatten(), hidden_receiver[s2].flatten()
-        )
+    assert test_metadata.shape[0] == generated_messages.shape[0]
+
+    s1, s2 = sample_pairs(len(test_metadata), samples)
+
+    sim_image_features = cosine_distances(test_images, s1, s2)
+    sim_metadata = cosine_distances(test_metadata, s1, s2)
+    sim_messages = message_cosine_distances(generated_messages, s1, s2)
+    sim_hidden_sender = cosine_distances(hidden_sender, s1, s2)
+    sim_hidden_receiver = cosine_distances(hidden_receiver, s1, s2)
 
     rsa_sr = scipy.stats.pearsonr(sim_hidden_sender, sim_hidden_receiver)[0]
     rsa_si = scipy.stats.pearsonr(sim_hidden_sender, sim_image_features)[0]
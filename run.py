@@ -1,8 +1,9 @@
 from utils import AverageMeter, discretize_messages
+from metrics import calculate_metrics
 import torch
 import torch.nn as nn
 
-def run_epoch(model, data, word_counts, optimizer, onehot_metadata, debugging):
+def run_epoch(model, data, word_counts, optimizer, onehot_metadata, debugging, metrics_worker=None, use_in_batch_negatives=False):
 	is_training_mode = not optimizer is None
 
 	loss_meter = AverageMeter()
@@ -32,24 +33,28 @@ def run_epoch(model, data, word_counts, optimizer, onehot_metadata, debugging):
 		batch_w_counts, 
 		entropy, 
 		distinctness,
-		rsa_sr,
-		rsa_si,
-		rsa_ri,
-		topological_sim,
-		lang_entropy) = model(target, 
+		metrics_snapshot) = model(target, 
 								distractors, 
 								w_counts, 
-								onehot_metadata[idxs[:,0]] if onehot_metadata is not None else None)
+								onehot_metadata[idxs[:,0]] if onehot_metadata is not None else None,
+								use_in_batch_negatives)
 
 		loss_meter.update(loss.item())
 		acc_meter.update(acc.item())
 		entropy_meter.update(entropy.item())
 		distinctness_meter.update(distinctness)
-		rsa_sr_meter.update(rsa_sr)
-		rsa_si_meter.update(rsa_si)
-		rsa_ri_meter.update(rsa_ri)
-		topological_sim_meter.update(topological_sim)
-		language_entropy_meter.update(lang_entropy)
+
+		if metrics_worker is not None:
+			metrics_worker.submit(metrics_snapshot)
+		else:
+			rsa_sr, rsa_si, rsa_ri, topological_sim, lang_entropy = calculate_metrics(
+				metrics_snapshot, model.n_rsa_samples)
+
+			rsa_sr_meter.update(rsa_sr)
+			rsa_si_meter.update(rsa_si)
+			rsa_ri_meter.update(rsa_ri)
+			topological_sim_meter.update(topological_sim)
+			language_entropy_meter.update(lang_entropy)
 
 		messages.append(discretize_messages(m) if is_training_mode else m)
 		indices.append(idxs)
@@ -64,6 +69,9 @@ def run_epoch(model, data, word_counts, optimizer, onehot_metadata, debugging):
 		if debugging and debugging_counter == 5:
 			break
 
+	if metrics_worker is not None:
+		metrics_worker.collect(rsa_sr_meter, rsa_si_meter, rsa_ri_meter, topological_sim_meter, language_entropy_meter)
+
 	return (loss_meter, 
 		acc_meter, 
 		torch.cat(messages, 0), 
@@ -78,10 +86,10 @@ def run_epoch(model, data, word_counts, optimizer, onehot_metadata, debugging):
 		language_entropy_meter)
 
 
-def train_one_epoch(model, data, optimizer, word_counts, onehot_metadata, debugging=False):
+def train_one_epoch(model, data, optimizer, word_counts, onehot_metadata, debugging=False, metrics_worker=None, use_in_batch_negatives=False):
 	model.train()
-	return run_epoch(model, data, word_counts, optimizer, onehot_metadata, debugging)
+	return run_epoch(model, data, word_counts, optimizer, onehot_metadata, debugging, metrics_worker, use_in_batch_negatives)
 
-def evaluate(model, data, word_counts, onehot_metadata, debugging=False):
+def evaluate(model, data, word_counts, onehot_metadata, debugging=False, metrics_worker=None, use_in_batch_negatives=False):
 	model.eval()
-	return run_epoch(model, data, word_counts, None, onehot_metadata, debugging)
\ No newline at end of file
+	return run_epoch(model, data, word_counts, None, onehot_metadata, debugging, metrics_worker, use_in_batch_negatives)
\ No newline at end of file
@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import fcntl
+
+from run_store import RunStore, MANIFEST_FILE_NAME
+
+CATALOG_FILE_NAME = 'catalog.json'
+
+
+class RunCatalog:
+	"""
+	catalog.json of a dumps folder, indexing its runs by model id: the folder, the attributes
+	(hyperparameters, best_epoch) and the array files per split and epoch of each run, copied
+	from its RunStore manifest when the run is added. Runs are looked up with one json read
+	instead of listing the dumps folder, e.g. runs(vocab_size=10, shapes_dataset='balanced').
+	Jobs of a sweep add their runs concurrently, the writes hold an exclusive lock on the catalog.
+	"""
+	def __init__(self, dumps_dir):
+		self.dumps_dir = dumps_dir
+		self.file_name = os.path.join(dumps_dir, CATALOG_FILE_NAME)
+		self.lock_file_name = os.path.join(dumps_dir, 'catalog.lock')
+		self.entries = self._load()
+
+	# Writing
+
+	def add(self, *run_stores):
+		"""
+		Adds the runs (or updates their entries) with the current manifest of their RunStore.
+		"""
+		with open(self.lock_file_name, 'w') as lock_file:
+			fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+			# Other jobs may have added runs since the catalog was read
+			self.entries = self._load()
+			for run_store in run_stores:
+				self.entries[run_store.attributes['model_id']] = {
+					'folder': os.path.relpath(run_store.folder, self.dumps_dir),
+					'attributes': dict(run_store.attributes),
+					'arrays': run_store.manifest['arrays'],
+				}
+
+			temp_file_name = '{}.tmp'.format(self.file_name)
+			with open(temp_file_name, 'w') as f:
+				json.dump(self.entries, f, indent=1)
+			os.replace(temp_file_name, self.file_name)
+
+	def add_existing_runs(self):
+		"""
+		Adds all the runs of the dumps folder, e.g. those dumped before it had a catalog.
+		"""
+		folders = [os.path.join(self.dumps_dir, f) for f in sorted(os.listdir(self.dumps_dir))]
+		self.add(*[RunStore(f) for f in folders if os.path.exists(os.path.join(f, MANIFEST_FILE_NAME))])
+
+	# Reading
+
+	def get(self, model_id):
+		if model_id not in self.entries:
+			raise KeyError('Run {} is not in the catalog of {}, add it with python run_catalog.py {}'.format(
+				model_id, self.dumps_dir, self.dumps_dir))
+		return self.entries[model_id]
+
+	def runs(self, **attributes):
+		"""
+		Model ids of the runs whose attributes have the given values.
+		"""
+		return [model_id for model_id, entry in self.entries.items()
+			if all(entry['attributes'].get(k) == v for k, v in attributes.items())]
+
+	def attributes(self, model_id):
+		return self.get(model_id)['attributes']
+
+	def folder(self, model_id):
+		return os.path.join(self.dumps_dir, self.get(model_id)['folder'])
+
+	def run_store(self, model_id):
+		return RunStore(self.folder(model_id))
+
+	def array_file_name(self, model_id, split, name, epoch=None):
+		"""
+		File of an array of the run at epoch, defaults to the best epoch of the run.
+		"""
+		entry = self.get(model_id)
+		if epoch is None:
+			epoch = entry['attributes']['best_epoch']
+		return os.path.join(self.folder(model_id), entry['arrays'][split][name][str(epoch)])
+
+	def _load(self):
+		if not os.path.exists(self.file_name):
+			return {}
+		with open(self.file_name) as f:
+			return json.load(f)
+
+
+if __name__ == '__main__':
+	# Indexes the runs of a dumps folder, e.g. python run_catalog.py dumps
+	catalog = RunCatalog(sys.argv[1] if len(sys.argv) > 1 else 'dumps')
+	catalog.add_existing_runs()
+	print('{} runs in {}'.format(len(catalog.entries), catalog.file_name))
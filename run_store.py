@@ -0,0 +1,187 @@
+import os
+import json
+import numpy as np
+import torch
+
+MANIFEST_FILE_NAME = 'run.json'
+
+
+def to_numpy(x):
+	if isinstance(x, torch.Tensor):
+		return x.detach().cpu().numpy()
+	return np.asarray(x)
+
+def get_compact_dtype(array):
+	# Smallest integer type that holds the values of array, e.g. int8 for the messages of small vocabularies
+	if array.size == 0:
+		return np.int8
+	for dtype in [np.int8, np.int16, np.int32]:
+		info = np.iinfo(dtype)
+		if array.min() >= info.min and array.max() <= info.max:
+			return dtype
+	return np.int64
+
+def get_token_dtype(vocab_size):
+	return np.uint8 if vocab_size <= 2**8 else np.uint16
+
+def get_message_lengths(messages, bound_idx):
+	# Tokens of each message after its start token and before its end token (the padding is also the bound token)
+	is_bound = messages[:, 1:] == bound_idx
+	return np.where(is_bound.any(axis=1), is_bound.argmax(axis=1), is_bound.shape[1])
+
+
+class RunStore:
+	"""
+	All the artifacts of a training run in its dump folder, instead of a pickle per artifact
+	and epoch. run.json is the manifest: the attributes of the run (e.g. best_epoch), one
+	column per split and metric with its average per epoch, and the arrays of each split and
+	epoch. Arrays (messages, image indices) are .npy files with compact integer types, and
+	the per batch values of the metrics are appended to raw float64 files, so a run is
+	loaded with one json read and memory mapped slices. Messages are only decoded into
+	words when read, see words.
+	"""
+	def __init__(self, folder):
+		self.folder = folder
+		self.manifest_file_name = os.path.join(folder, MANIFEST_FILE_NAME)
+
+		if os.path.exists(self.manifest_file_name):
+			with open(self.manifest_file_name) as f:
+				self.manifest = json.load(f)
+		else:
+			self.manifest = {'attributes': {}, 'metrics': {}, 'arrays': {}}
+
+	def save(self):
+		if not os.path.exists(self.folder):
+			os.makedirs(self.folder, exist_ok=True)
+
+		temp_file_name = '{}.tmp'.format(self.manifest_file_name)
+		with open(temp_file_name, 'w') as f:
+			json.dump(self.manifest, f)
+		os.replace(temp_file_name, self.manifest_file_name)
+
+	# Writing
+
+	def set_attributes(self, **attributes):
+		self.manifest['attributes'].update(attributes)
+		self.save()
+
+	def append_metrics(self, split, epoch, **meters):
+		"""
+		Appends the AverageMeter of each metric for split at epoch.
+		"""
+		split_metrics = self.manifest['metrics'].setdefault(split, {})
+
+		for name, meter in meters.items():
+			column = split_metrics.setdefault(name, {'epochs': [], 'avg': [], 'count': []})
+			values = np.asarray(meter.all_values, dtype=np.float64)
+
+			column['epochs'].append(int(epoch))
+			column['avg'].append(float(meter.avg))
+			column['count'].append(len(values))
+
+			with open(self._values_file_name(split, name), 'ab') as f:
+				f.write(values.tobytes())
+
+		self.save()
+
+	def set_metric(self, split, name, meters):
+		"""
+		Replaces the whole column of a metric for split, with meters a dict from epoch to AverageMeter.
+		"""
+		column = {'epochs': [], 'avg': [], 'count': []}
+		self.manifest['metrics'].setdefault(split, {})[name] = column
+
+		with open(self._values_file_name(split, name), 'wb') as f:
+			for epoch in sorted(meters):
+				values = np.asarray(meters[epoch].all_values, dtype=np.float64)
+
+				column['epochs'].append(int(epoch))
+				column['avg'].append(float(meters[epoch].avg))
+				column['count'].append(len(values))
+
+				f.write(values.tobytes())
+
+		self.save()
+
+	def save_arrays(self, split, epoch, **arrays):
+		"""
+		Saves each array (tensor or numpy) of split at epoch, signed integers with their compact type.
+		"""
+		split_arrays = self.manifest['arrays'].setdefault(split, {})
+
+		for name, array in arrays.items():
+			array = to_numpy(array)
+			if np.issubdtype(array.dtype, np.signedinteger):
+				array = array.astype(get_compact_dtype(array))
+
+			file_name = '{}.{}.{}.npy'.format(split, name, epoch)
+			temp_file_name = os.path.join(self.folder, '{}.tmp'.format(file_name))
+			with open(temp_file_name, 'wb') as f:
+				np.save(f, array)
+			os.replace(temp_file_name, os.path.join(self.folder, file_name))
+			split_arrays.setdefault(name, {})[str(epoch)] = file_name
+
+		self.save()
+
+	def save_messages(self, split, epoch, messages):
+		"""
+		Saves messages as uint8 or uint16 depending on the vocab_size of the run, and their
+		lengths (see get_message_lengths) next to them. Needs the vocab_size and bound_idx attributes.
+		"""
+		messages = to_numpy(messages).astype(get_token_dtype(self.attributes['vocab_size']))
+		lengths = get_message_lengths(messages, self.attributes['bound_idx'])
+
+		self.save_arrays(split, epoch, messages=messages, lengths=lengths)
+
+	# Reading
+
+	@property
+	def attributes(self):
+		return self.manifest['attributes']
+
+	def metric_names(self, split):
+		return list(self.manifest['metrics'].get(split, {}))
+
+	def metric_epochs(self, split, name):
+		return self.manifest['metrics'][split][name]['epochs']
+
+	def metric(self, split, name):
+		"""
+		Average of the metric per epoch.
+		"""
+		return np.array(self.manifest['metrics'][split][name]['avg'])
+
+	def metric_values(self, split, name):
+		"""
+		Per batch values of the metric, one (memory mapped) array per epoch.
+		"""
+		counts = self.manifest['metrics'][split][name]['count']
+		if sum(counts) == 0:
+			return [np.zeros(0) for _ in counts]
+
+		values = np.memmap(self._values_file_name(split, name), dtype=np.float64, mode='r', shape=(sum(counts),))
+		offsets = np.cumsum([0] + counts)
+		return [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+	def array_epochs(self, split, name):
+		return sorted(int(e) for e in self.manifest['arrays'].get(split, {}).get(name, {}))
+
+	def array(self, split, name, epoch=None):
+		"""
+		Array of split at epoch, memory mapped. Defaults to the best epoch of the run.
+		"""
+		if epoch is None:
+			epoch = self.attributes['best_epoch']
+		file_name = self.manifest['arrays'][split][name][str(epoch)]
+		return np.load(os.path.join(self.folder, file_name), mmap_mode='r')
+
+	def words(self, split, idx_to_word, epoch=None):
+		"""
+		Messages of split at epoch decoded with idx_to_word, without their start and end tokens.
+		"""
+		messages = self.array(split, 'messages', epoch).tolist()
+		lengths = self.array(split, 'lengths', epoch).tolist()
+		return [[idx_to_word[t] for t in m[1:1 + l]] for m, l in zip(messages, lengths)]
+
+	def _values_file_name(self, split, name):
+		return os.path.join(self.folder, '{}.{}.values'.format(split, name))
@@ -1,17 +1,21 @@
 import numpy as np
 import torch
 import torchvision.models as models
-import torchvision.transforms
-from PIL import Image
 import torch.utils.data as data
 from torch.utils.data import DataLoader
 import os
+import sys
+
+sys.path.append('..') # Run from the shapes folder, like the data paths below
+from visual_module import ImageTransform
+from ImageDataset import collate_batch
 
 
 use_gpu = torch.cuda.is_available()
 
 
 class ShapesDataset(data.Dataset):
+	# Serves the uint8 images, they are resized and normalized in batches by self.transform
 	def __init__(self, images):
 		super().__init__()
 
@@ -19,28 +23,13 @@ class ShapesDataset(data.Dataset):
 
 		self.n_tuples = 0 if len(images.shape) < 5 else images.shape[1]
 
-		self.transforms = torchvision.transforms.Compose([
-			torchvision.transforms.ToPILImage(),
-			torchvision.transforms.Resize((250, 250), Image.LINEAR),
-			torchvision.transforms.ToTensor(),
-			torchvision.transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]) # Needed for pretrained models
-		])
+		self.transform = ImageTransform((250, 250), [0.485, 0.456, 0.406], [0.229, 0.224, 0.225]) # Needed for pretrained models
 
 	def __getitem__(self, index):
-		if self.n_tuples == 0:
-			image = self.data[index, :, :, :]
-			image = self.transforms(image)
-		else:
-			imgs = []
-			for i in range(self.n_tuples):
-				img = self.data[index, i, :, :, :]
-				img = self.transforms(img)
-
-				imgs.append(img)
-
-			image = torch.stack(imgs) # 2 x 3 x 250 x 250
+		return torch.from_numpy(np.array(self.data[index]))
 
-		return image
+	def __getitems__(self, indices):
+		return torch.from_numpy(self.data[indices])
 
 	def __len__(self):
 		return self.data.shape[0]
@@ -58,69 +47,71 @@ def cnn_fwd(model, x):
 
 	return y.numpy()
 
-def get_features(model, dataloader, output_data_folder, file_id):
-	for i, x in enumerate(dataloader):
-		if use_gpu:
-			x = x.cuda()
+def get_features(model, dataloader, output_file_name):
+	"""
+	Streams the features of every batch into a .npy file preallocated for the whole dataset,
+	written under a temporary name and renamed once complete
+	"""
+	transform = dataloader.dataset.transform
+	if use_gpu:
+		transform = transform.cuda()
 
-		if i == 0:
-			if len(x.shape) == 5:
-				n_tuples = x.shape[1]
-			else:
-				n_tuples = 0
-		
+	n_batches = len(dataloader) if use_gpu else min(len(dataloader), 6) # Only a few batches when debugging on cpu
+	n_rows = min(len(dataloader.dataset), n_batches * dataloader.batch_size)
 
-		if n_tuples == 0:
-			y = cnn_fwd(model, x)
+	temp_file_name = '{}.tmp'.format(output_file_name)
+	features = None
+	start = 0
 
-		else:
-			ys = []
-			for j in range(n_tuples):
-				x_t = x[:,j,:,:,:]
-				y_t = cnn_fwd(model, x_t)
-				ys.append(y_t)
-			
-			# Here we need to combine 1st elem with 1st elem, etc in the batch
+	with torch.no_grad():
+		for i, x in enumerate(dataloader):
+			if i == n_batches:
+				break
 
-			y = np.asarray(ys)
-			y = np.moveaxis(y, 0, 1)
+			if use_gpu:
+				x = x.cuda()
 
+			x = transform(x)
 
-		np.save('{}/{}_{}_features.npy'.format(output_data_folder, file_id, i), y)
+			if len(x.shape) == 5:
+				# Tuples of images: the j-th image of every tuple goes through the CNN together
+				y = np.stack([cnn_fwd(model, x[:, j, :, :, :]) for j in range(x.shape[1])], axis=1)
+			else:
+				y = cnn_fwd(model, x)
 
-		if not use_gpu and i == 5:
-			break
+			if features is None:
+				features = np.lib.format.open_memmap(temp_file_name, mode='w+', dtype=y.dtype, shape=(n_rows,) + y.shape[1:])
 
+			features[start:start + y.shape[0]] = y
+			start += y.shape[0]
 
-def stitch_files(output_data_folder, file_id):
-	file_names = ['{}/{}'.format(output_data_folder, f) for f in os.listdir(output_data_folder) if file_id in f]
-	file_names.sort(key=os.path.getctime)
+	if features is None:
+		# No images, nothing was preallocated
+		np.save(output_file_name, np.zeros((0,), dtype=np.float32))
+		return
 
-	for i, f in enumerate(file_names):
-		arr = np.load(f)
-		if i == 0:
-			features = arr
-		else:
-			features = np.concatenate((features, arr))
+	features.flush()
+	del features
+	os.replace(temp_file_name, output_file_name)
 
-	np.save('{}/{}_features.npy'.format(output_data_folder, file_id), features)
 
 
 
 batch_size = 128 if use_gpu else 4
 
 folder = 'different_targets'
-train_images = np.load('{}/train.large.input.npy'.format(folder))
-val_images = np.load('{}/val.input.npy'.format(folder))
-test_images = np.load('{}/test.input.npy'.format(folder))
+train_images = np.load('{}/train.large.input.npy'.format(folder), mmap_mode='r')
+val_images = np.load('{}/val.input.npy'.format(folder), mmap_mode='r')
+test_images = np.load('{}/test.input.npy'.format(folder), mmap_mode='r')
 
 train_dataset = ShapesDataset(train_images)
 val_dataset = ShapesDataset(val_images)
 test_dataset = ShapesDataset(test_images)
 
-train_dataloader = DataLoader(train_dataset, num_workers=8, batch_size=batch_size)
-val_dataloader = DataLoader(val_dataset, num_workers=8, batch_size=batch_size)
-test_dataloader = DataLoader(test_dataset, num_workers=8, batch_size=batch_size)
+# Batches are only sliced from the images, so no worker processes are needed
+train_dataloader = DataLoader(train_dataset, batch_size=batch_size, collate_fn=collate_batch)
+val_dataloader = DataLoader(val_dataset, batch_size=batch_size, collate_fn=collate_batch)
+test_dataloader = DataLoader(test_dataset, batch_size=batch_size, collate_fn=collate_batch)
 
 vgg16 = models.vgg16(pretrained=True)
 if use_gpu:
@@ -139,12 +130,6 @@ output_data_folder = '../data/shapes/{}'.format(folder)
 if not os.path.exists(output_data_folder):
 	os.mkdir(output_data_folder)
 
-train_features = get_features(vgg16, train_dataloader, output_data_folder, 'train')
-valid_features = get_features(vgg16, val_dataloader, output_data_folder, 'valid')
-test_features = get_features(vgg16, test_dataloader, output_data_folder, 'test')
-
-
-# Stitch into one file
-stitch_files(output_data_folder, 'train')
-stitch_files(output_data_folder, 'valid')
-stitch_files(output_data_folder, 'test')
+get_features(vgg16, train_dataloader, '{}/train_features.npy'.format(output_data_folder))
+get_features(vgg16, val_dataloader, '{}/valid_features.npy'.format(output_data_folder))
+get_features(vgg16, test_dataloader, '{}/test_features.npy'.format(output_data_folder))
@@ -3,6 +3,7 @@
 import numpy as np
 import os
 import pickle
+from multiprocessing import Pool
 
 from generate_dataset import *
 from image_utils import *
@@ -13,6 +14,8 @@ N_TRAIN_MED     = 100
 N_TRAIN_LARGE = 1000
 N_TRAIN_ALL     = N_TRAIN_MED
 
+N_PROCESSES = os.cpu_count()
+RENDERER = 'cairo' # 'numpy' is faster but its antialiasing differs from cairo's, see render_images
 
 
 if __name__ == "__main__":
@@ -27,8 +30,8 @@ if __name__ == "__main__":
     #get_dataset_balanced_zero_shot
     #get_dataset_uneven_incomplete#get_dataset_different_targets_incomplete#get_dataset_uneven_different_targets #get_dataset_balanced_incomplete #get_dataset_uneven #get_dataset_different_targets_three_figures#get_dataset_different_targets
 
-    # seed = 42
-    # np.random.seed(seed)
+    seed = 42
+    np.random.seed(seed)
 
     # From Serhii's original experiment
     train_size = 74504 if not debugging else 10
@@ -42,49 +45,34 @@ if __name__ == "__main__":
                 or f_generate_dataset is get_dataset_uneven_different_targets_size
                 or f_generate_dataset is get_dataset_uneven_different_targets_row_incomplete)
     if is_uneven:
-        train_data, val_data, test_data, shapes_probs, colors_probs = get_datasets(train_size, val_size, test_size, f_generate_dataset, is_uneven)
-    else:    
-        train_data, val_data, test_data = get_datasets(train_size, val_size, test_size, f_generate_dataset, is_uneven)
+        shapes_probs, colors_probs = get_uneven_probs(f_generate_dataset)
+        f_args = (shapes_probs, colors_probs)
+    else:
+        f_args = ()
 
-    has_tuples = type(train_data[0]) is tuple
-
-
-    train_data_tiny = train_data[:N_TRAIN_TINY]
-    train_data_small = train_data[:N_TRAIN_SMALL]
-    train_data_med = train_data[:N_TRAIN_MED]
-    train_data_large = train_data
+    assert not os.path.exists(folder_name), 'Trying to overwrite?'
+    os.mkdir(folder_name)
 
-    sets = {
-        "train.tiny": train_data_tiny,
-        "train.small": train_data_small,
-        "train.med": train_data_med,
-        "train.large": train_data_large,
-        "val": val_data,
-        "test": test_data
+    sizes = {
+        "train.large": train_size,
+        "val": val_size,
+        "test": test_size
     }
+    split_seeds = get_split_seeds(seed, list(sizes))
 
-    assert not os.path.exists(folder_name), 'Trying to overwrite?'
-    os.mkdir(folder_name)
+    with Pool(N_PROCESSES) as pool:
+        for set_name, set_size in sizes.items():
+            file_name = "{}/{}.input.npy".format(folder_name, set_name)
+            set_metadata = generate_dataset(file_name, set_size, f_generate_dataset, f_args, split_seeds[set_name], pool, RENDERER)
+            pickle.dump(set_metadata, open('{}/{}.metadata.p'.format(folder_name, set_name), 'wb'))
+
+    # The smaller training sets are prefixes of the large one
+    train_inputs = np.load("{}/train.large.input.npy".format(folder_name), mmap_mode='r')
+    train_metadata = pickle.load(open('{}/train.large.metadata.p'.format(folder_name), 'rb'))
 
-    for set_name, set_data in sets.items():
-        if not has_tuples:
-            set_inputs = np.asarray([image.data[:,:,0:3] for image in set_data])
-        else:
-            tuple_len = len(set_data[0]) # 2
-            n_rows = len(set_data)
-            set_inputs = np.zeros((n_rows, tuple_len, WIDTH, HEIGHT, N_CHANNELS), dtype=np.uint8)
-            for i in range(n_rows):
-                for j in range(tuple_len):
-                    set_inputs[i][j] = set_data[i][j].data[:,:,0:3]
-
-        np.save("{}/{}.input".format(folder_name, set_name), set_inputs)
-
-        if not has_tuples:
-            set_metadata = [image.metadata for image in set_data]
-        else:
-            set_metadata = [(image[0].metadata, image[1].metadata) for image in set_data]
-
-        pickle.dump(set_metadata, open('{}/{}.metadata.p'.format(folder_name, set_name), 'wb'))
+    for set_name, set_size in [("train.tiny", N_TRAIN_TINY), ("train.small", N_TRAIN_SMALL), ("train.med", N_TRAIN_MED)]:
+        np.save("{}/{}.input".format(folder_name, set_name), train_inputs[:set_size])
+        pickle.dump(train_metadata[:set_size], open('{}/{}.metadata.p'.format(folder_name, set_name), 'wb'))
 
     if is_uneven:
         with open('{}/probs.txt'.format(folder_name), 'w') as f:
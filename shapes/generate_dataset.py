@@ -1,7 +1,10 @@
 from image_utils import *
 import numpy as np
+import random
 from random import shuffle
 
+SHARD_SIZE = 2048 # images generated by each task of the pool, independent of the number of processes
+
 def get_shape_probs():
 	assert N_SHAPES == 3
 
@@ -44,13 +47,18 @@ def get_color_given_shape_probs(n_colors=3):
 
 	return probs
 
+def get_uneven_probs(f_get_dataset):
+	shapes_probs = get_shape_probs()
+	if f_get_dataset is get_dataset_uneven_incomplete or f_get_dataset is get_dataset_uneven_different_targets_row_incomplete:
+		color_given_shape_probs = get_color_given_shape_probs(n_colors=2)
+	else:
+		color_given_shape_probs = get_color_given_shape_probs()
+
+	return shapes_probs, color_given_shape_probs
+
 def get_datasets(train_size, val_size, test_size, f_get_dataset, is_uneven):
 	if is_uneven:
-		shapes_probs = get_shape_probs()
-		if f_get_dataset is get_dataset_uneven_incomplete or f_get_dataset is get_dataset_uneven_different_targets_row_incomplete:
-			color_given_shape_probs = get_color_given_shape_probs(n_colors=2)
-		else:
-			color_given_shape_probs = get_color_given_shape_probs()
+		shapes_probs, color_given_shape_probs = get_uneven_probs(f_get_dataset)
 
 		train_data = f_get_dataset(train_size, shapes_probs, color_given_shape_probs)
 		val_data = f_get_dataset(val_size, shapes_probs, color_given_shape_probs)
@@ -64,6 +72,68 @@ def get_datasets(train_size, val_size, test_size, f_get_dataset, is_uneven):
 
 		return train_data, val_data, test_data
 
+def get_images_inputs(images, renderer='cairo'):
+	if type(images[0]) is tuple:
+		tuple_len = len(images[0])
+		inputs = render_images([image for pair in images for image in pair], renderer)
+		return inputs.reshape((len(images), tuple_len) + inputs.shape[1:])
+	else:
+		return render_images(images, renderer)
+
+def get_images_metadata(images):
+	if type(images[0]) is tuple:
+		return [tuple(image.metadata for image in pair) for pair in images]
+	else:
+		return [image.metadata for image in images]
+
+def generate_shard(args):
+	f_get_dataset, f_args, file_name, start, end, seed, renderer = args
+
+	# The dataset functions draw from both the numpy and the python generators (shuffle)
+	np.random.seed(seed)
+	random.seed(seed)
+	images = f_get_dataset(end - start, *f_args)
+
+	inputs = np.load(file_name, mmap_mode='r+')
+	inputs[start:end] = get_images_inputs(images, renderer)
+	inputs.flush()
+
+	return get_images_metadata(images)
+
+def get_split_seeds(seed, set_names):
+	# One seed per split, the shards of each split derive theirs from it
+	seeds = np.random.SeedSequence(seed).generate_state(len(set_names))
+	return {set_name: int(split_seed) for set_name, split_seed in zip(set_names, seeds)}
+
+def generate_dataset(file_name, dataset_size, f_get_dataset, f_args, seed, pool, renderer='cairo'):
+	"""
+	Generates dataset_size images with f_get_dataset(size, *f_args) into the .npy file_name,
+	drawn by renderer (see render_images), in shards of SHARD_SIZE images that the processes of pool write directly into the file.
+	Each shard has its own seed derived from seed, so the images only depend on seed and
+	not on the number of processes. Returns the metadata of the images, in order.
+	"""
+	# random.seed only takes python integers
+	seed = int(seed)
+
+	# One image to know the shape of the inputs, from a generator that doesn't affect the shards
+	np.random.seed(seed)
+	random.seed(seed)
+	image_shape = get_images_inputs(f_get_dataset(1, *f_args), 'numpy').shape[1:]
+
+	inputs = np.lib.format.open_memmap(file_name, mode='w+', dtype=np.uint8, shape=(dataset_size,) + image_shape)
+	del inputs
+
+	starts = range(0, dataset_size, SHARD_SIZE)
+	seeds = np.random.SeedSequence(seed).generate_state(len(starts))
+	shards = [(f_get_dataset, f_args, file_name, start, min(start + SHARD_SIZE, dataset_size), int(shard_seed), renderer)
+		for start, shard_seed in zip(starts, seeds)]
+
+	metadata = []
+	for shard_metadata in pool.imap(generate_shard, shards):
+		metadata.extend(shard_metadata)
+
+	return metadata
+
 def get_dataset_balanced(dataset_size):
 	images = []
 
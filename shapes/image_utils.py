@@ -1,5 +1,4 @@
 import numpy as np
-import cairo
 
 N_CELLS = 3
 
@@ -28,10 +27,12 @@ COLOR_BLUE = 2
 N_COLORS = COLOR_BLUE + 1
 
 
-def draw(shape, color, size, left, top, ctx):
-    center_x = (left + .5) * CELL_WIDTH
-    center_y = (top + .5) * CELL_HEIGHT
+RENDERERS = ['cairo', 'numpy']
+SUBSAMPLES = 4 # per pixel side, antialiasing of the numpy renderer
+RENDER_CHUNK_SIZE = 4096 # figures rasterized at once by the numpy renderer
+
 
+def get_stroke(shape, color, size, left, top):
     radius = SMALL_RADIUS if size == SIZE_SMALL else BIG_RADIUS
     radius *= (.9 + np.random.random() * .2)
 
@@ -46,6 +47,13 @@ def draw(shape, color, size, left, top, ctx):
 
     #rgb = np.asarray([1., 1., 1.])
 
+    return (shape, top, left, radius, rgb)
+
+def draw(stroke, ctx):
+    shape, top, left, radius, rgb = stroke
+    center_x = (left + .5) * CELL_WIDTH
+    center_y = (top + .5) * CELL_HEIGHT
+
     if shape == SHAPE_CIRCLE:
         ctx.arc(center_x, center_y, radius, 0, 2*np.pi)
     elif shape == SHAPE_SQUARE:
@@ -62,12 +70,79 @@ def draw(shape, color, size, left, top, ctx):
     ctx.set_source_rgb(*rgb)
     ctx.fill()
 
+def render_cairo(images):
+    import cairo
+
+    inputs = np.zeros((len(images), WIDTH, HEIGHT, N_CHANNELS), dtype=np.uint8)
+    for i, image in enumerate(images):
+        data = np.zeros((WIDTH, HEIGHT, 4), dtype=np.uint8)
+        surf = cairo.ImageSurface.create_for_data(data, cairo.FORMAT_ARGB32, WIDTH, HEIGHT)
+        ctx = cairo.Context(surf)
+        ctx.set_source_rgb(0., 0., 0.)
+        ctx.paint()
+
+        for stroke in image.strokes:
+            draw(stroke, ctx)
+
+        inputs[i] = data[:,:,0:3]
+
+    return inputs
+
+def get_cell_grid():
+    # Coordinates of the subsamples of a cell relative to its center, where the figures are centered
+    cell_size = int(CELL_WIDTH)
+    offsets = (np.arange(cell_size * SUBSAMPLES) + .5) / SUBSAMPLES - cell_size / 2
+    dy, dx = np.meshgrid(offsets, offsets, indexing='ij')
+    return dx, dy
+
+def render_numpy(images):
+    """
+    Same images as render_cairo, up to antialiasing. Figures never leave their cell,
+    so every figure is rasterized as a cell sized patch, all of a chunk at once, and the
+    patches are then scattered into the cells of their images.
+    """
+    cell_size = int(CELL_WIDTH)
+    dx, dy = get_cell_grid()
+
+    strokes = [(i,) + stroke for i, image in enumerate(images) for stroke in image.strokes]
+    inputs = np.zeros((len(images), N_CELLS, cell_size, N_CELLS, cell_size, N_CHANNELS), dtype=np.uint8)
+
+    for start in range(0, len(strokes), RENDER_CHUNK_SIZE):
+        chunk = strokes[start:start + RENDER_CHUNK_SIZE]
+        index, shape, top, left = (np.array([stroke[j] for stroke in chunk]) for j in range(4))
+        radius = np.array([stroke[4] for stroke in chunk])[:, None, None]
+        rgb = np.array([stroke[5] for stroke in chunk])
+
+        masks = np.where((shape == SHAPE_CIRCLE)[:, None, None], dx**2 + dy**2 <= radius**2,
+            np.where((shape == SHAPE_SQUARE)[:, None, None], (np.abs(dx) <= radius) & (np.abs(dy) <= radius),
+                (dy <= radius) & (np.abs(dx) * 2 <= dy + radius)))
+        coverage = masks.reshape(-1, cell_size, SUBSAMPLES, cell_size, SUBSAMPLES).mean(axis=(2, 4))
+
+        # Cairo stores ARGB32 pixels as BGRA bytes
+        patches = np.round(coverage[..., None] * rgb[:, None, None, ::-1] * 255)
+        inputs[index, top, :, left] = patches.astype(np.uint8)
+
+    return inputs.reshape(len(images), HEIGHT, WIDTH, N_CHANNELS)
+
+def render_images(images, renderer='cairo'):
+    """
+    Pixels of images, (n_images, WIDTH, HEIGHT, N_CHANNELS) uint8 in the BGR order of cairo.
+    The numpy renderer supersamples each pixel instead of using cairo's antialiasing, so
+    edge pixels can differ from cairo's and it is only used when asked for.
+    """
+    assert renderer in RENDERERS, 'Unknown renderer {}'.format(renderer)
+
+    if renderer == 'cairo':
+        return render_cairo(images)
+    else:
+        return render_numpy(images)
+
 class Image:
-    def __init__(self, shapes, colors, sizes, data, metadata):
+    def __init__(self, shapes, colors, sizes, strokes, metadata):
         self.shapes = shapes
         self.colors = colors
         self.sizes = sizes
-        self.data = data
+        self.strokes = strokes
         self.metadata = metadata
 
 class Figure:
@@ -89,12 +164,9 @@ class Figure:
 # def get_image(shape=-1, color=-1, size=-1):
 #     return get_image([Figure(shape, color, size, r=-1, c=-1)])
 
+# The figures are only placed here, the images are drawn from their strokes by render_images
 def get_image(figures):
-    data = np.zeros((WIDTH, HEIGHT, 4), dtype=np.uint8)
-    surf = cairo.ImageSurface.create_for_data(data, cairo.FORMAT_ARGB32, WIDTH, HEIGHT)
-    ctx = cairo.Context(surf)
-    ctx.set_source_rgb(0., 0., 0.)
-    ctx.paint()
+    strokes = []
 
     shapes = [[None for c in range(N_CELLS)] for r in range(N_CELLS)]
     colors = [[None for c in range(N_CELLS)] for r in range(N_CELLS)]
@@ -126,16 +198,15 @@ def get_image(figures):
         colors[r][c] = color
         sizes[r][c] = size
 
-        draw(shapes[r][c],
+        strokes.append(get_stroke(shapes[r][c],
             colors[r][c],
             sizes[r][c],
             c,
-            r,
-            ctx)
+            r))
 
     metadata = {'shapes':shapes, 'colors':colors, 'sizes':sizes}
 
     flat_shapes = [item for sublist in metadata['shapes'] for item in sublist]
     assert len(list(filter(lambda x: not x is None, flat_shapes))) == len(figures)
 
-    return Image(shapes, colors, sizes, data, metadata)
\ No newline at end of file
+    return Image(shapes, colors, sizes, strokes, metadata)
\ No newline at end of file
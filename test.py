@@ -1,4 +1,3 @@
-import pickle
 import numpy as np
 import random
 from datetime import datetime
@@ -11,18 +10,21 @@ import torch
 from model import Model
 from run import train_one_epoch, evaluate
 from utils import EarlyStopping
+from metrics import MetricsWorker
 from dataloader import load_dictionaries, load_images, load_pretrained_features
 from build_shapes_dictionaries import *
 from metadata import does_shapes_onehot_metadata_exist, create_shapes_onehot_metadata, load_shapes_onehot_metadata
-from decode import dump_words
 from visual_module import CNN
-from dump_cnn_features import save_features
+from feature_cache import load_cached_features
+from run_store import RunStore
+from run_catalog import RunCatalog
+from dump_writer import DumpWriter
+from checkpoint_manager import CheckpointManager
 import argparse
 
 use_gpu = torch.cuda.is_available()
 debugging = not use_gpu
 should_dump = True#not debugging
-should_covert_to_words = True#not debugging
 should_dump_indices = True#not debugging
 
 
@@ -44,6 +46,15 @@ cnn_model_file_name = None
 rsa_sampling = 50
 seed = 42
 use_symbolic_input = False
+use_async_metrics = False
+should_compile_agents = False
+use_in_batch_negatives = False
+use_device_features = False
+use_resized_images = False
+use_device_transforms = False
+use_async_dumps = False
+keep_best_checkpoints = 1
+checkpoint_every = 0
 
 
 cmd_parser = argparse.ArgumentParser()
@@ -54,6 +65,15 @@ cmd_parser.add_argument('vl_loss_weight', type=float)
 cmd_parser.add_argument('bound_weight', type=float)
 cmd_parser.add_argument('--shapes_dataset')
 cmd_parser.add_argument('--use_symbolic_input', action='store_true')
+cmd_parser.add_argument('--use_async_metrics', action='store_true')
+cmd_parser.add_argument('--should_compile_agents', action='store_true')
+cmd_parser.add_argument('--use_in_batch_negatives', action='store_true')
+cmd_parser.add_argument('--use_device_features', action='store_true')
+cmd_parser.add_argument('--use_resized_images', action='store_true')
+cmd_parser.add_argument('--use_device_transforms', action='store_true')
+cmd_parser.add_argument('--use_async_dumps', action='store_true')
+cmd_parser.add_argument('--keep_best_checkpoints', type=int, default=1)
+cmd_parser.add_argument('--checkpoint_every', type=int, default=0)
 
 excl_group = cmd_parser.add_mutually_exclusive_group()
 excl_group.add_argument('--should_train_visual', action='store_true')
@@ -75,6 +95,19 @@ if len(sys.argv) > 1:
 	should_train_visual = cmd_args.should_train_visual
 	cnn_model_file_name = cmd_args.cnn_model_file_name
 	rsa_sampling = cmd_args.rsa_sampling
+	use_async_metrics = cmd_args.use_async_metrics
+	should_compile_agents = cmd_args.should_compile_agents
+	use_in_batch_negatives = cmd_args.use_in_batch_negatives
+	use_device_features = cmd_args.use_device_features
+	use_resized_images = cmd_args.use_resized_images
+	use_device_transforms = cmd_args.use_device_transforms
+	use_async_dumps = cmd_args.use_async_dumps
+	keep_best_checkpoints = cmd_args.keep_best_checkpoints
+	checkpoint_every = cmd_args.checkpoint_every
+
+# The other targets of the batch are the distractors, so none are sampled
+if use_in_batch_negatives:
+	K = 0
 
 # Symbolic input or mscoco never need to train visual features
 if not use_symbolic_input and not shapes_dataset is None:
@@ -105,6 +138,13 @@ if not use_symbolic_input and not shapes_dataset is None:
 	print('N image features: {}'.format(n_image_features))
 if rsa_sampling >= 0:
 	print('N samples for RSA: {}'.format(rsa_sampling))
+print('Async metrics: {}'.format(use_async_metrics))
+print('Compiled agents: {}'.format(should_compile_agents))
+print('In-batch negatives: {}'.format(use_in_batch_negatives))
+print('Device features: {}'.format(use_device_features))
+print('Resized images: {}'.format(use_resized_images))
+print('Device transforms: {}'.format(use_device_transforms))
+print('Async dumps: {}'.format(use_async_dumps))
 print()
 #################################################
 
@@ -120,26 +160,19 @@ word_to_idx, idx_to_word, bound_idx = load_dictionaries(
 
 # Load pretrained CNN if necessary
 if not should_train_visual and not use_symbolic_input and not shapes_dataset is None:
-	cnn_model_id = cnn_model_file_name.split('/')[-1]
+	# Load CNN from dumped model
+	state = torch.load(cnn_model_file_name, map_location= lambda storage, location: storage)
+	cnn_state = {k[4:]:v for k,v in state.items() if 'cnn' in k}
+	trained_cnn = CNN(n_image_features)
+	trained_cnn.load_state_dict(cnn_state)
 
-	features_folder_name = 'data/shapes/{}_{}'.format(shapes_dataset, cnn_model_id)
-
-	# Check if the features were already extracted with this CNN
-	if not os.path.exists(features_folder_name):
-		# Load CNN from dumped model
-		state = torch.load(cnn_model_file_name, map_location= lambda storage, location: storage)
-		cnn_state = {k[4:]:v for k,v in state.items() if 'cnn' in k}
-		trained_cnn = CNN(n_image_features)
-		trained_cnn.load_state_dict(cnn_state)
-
-		if use_gpu:
-			trained_cnn = trained_cnn.cuda()
+	if use_gpu:
+		trained_cnn = trained_cnn.cuda()
 
-		print("=CNN state loaded=")
-		print("Extracting features...")
+	print("=CNN state loaded=")
 
-		# Dump the features to then load them
-		features_folder_name = save_features(trained_cnn, shapes_dataset, cnn_model_id)
+	# Features are cached by a hash of the CNN weights, they are only extracted if no job did it yet
+	features_folder_name = load_cached_features(trained_cnn, shapes_dataset)
 
 
 if not shapes_dataset is None:
@@ -156,20 +189,26 @@ else:
 
 
 # Load data
+# Pretrained features can be kept on the training device for the whole run
+features_device = ('cuda' if use_gpu else 'cpu') if use_device_features else None
+# Images can be resized and normalized in batches on the training device
+transform_device = ('cuda' if use_gpu else 'cpu') if use_device_transforms else None
+
 if not shapes_dataset is None:
 	if not use_symbolic_input:
 		if should_train_visual:
-			train_data, valid_data, test_data = load_images('shapes/{}'.format(shapes_dataset), BATCH_SIZE, K)
+			train_data, valid_data, test_data = load_images('shapes/{}'.format(shapes_dataset), BATCH_SIZE, K, seed=seed,
+				use_resized_images=use_resized_images, transform_device=transform_device)
 		else:
 			n_pretrained_image_features, train_data, valid_data, test_data = load_pretrained_features(
-				features_folder_name, BATCH_SIZE, K)
+				features_folder_name, BATCH_SIZE, K, seed=seed, device=features_device)
 			assert n_pretrained_image_features == n_image_features
 	else:
 		n_image_features, train_data, valid_data, test_data = load_pretrained_features(
-			'shapes/{}'.format(shapes_dataset), BATCH_SIZE, K, use_symbolic=True)
+			'shapes/{}'.format(shapes_dataset), BATCH_SIZE, K, use_symbolic=True, seed=seed, device=features_device)
 else:
 	n_image_features, train_data, valid_data, test_data = load_pretrained_features(
-			'data/mscoco', BATCH_SIZE, K)
+			'data/mscoco', BATCH_SIZE, K, seed=seed, device=features_device)
 	print('\nUsing {} image features\n'.format(n_image_features))
 
 
@@ -184,6 +223,15 @@ current_model_dir = '{}/{}'.format(dumps_dir, model_id)
 if should_dump and not os.path.exists(current_model_dir):
 	os.mkdir(current_model_dir)
 
+if should_dump:
+	run_store = RunStore(current_model_dir)
+	run_store.set_attributes(model_id=model_id, vocab_size=vocab_size, bound_idx=bound_idx,
+		vocab_folder='shapes' if not shapes_dataset is None else 'mscoco',
+		max_sentence_length=max_sentence_length, vl_loss_weight=vl_loss_weight, bound_weight=bound_weight,
+		shapes_dataset=shapes_dataset, seed=seed)
+	run_catalog = RunCatalog(dumps_dir)
+	run_catalog.add(run_store)
+
 
 model = Model(n_image_features, vocab_size,
 	EMBEDDING_DIM, HIDDEN_SIZE, 
@@ -192,12 +240,22 @@ model = Model(n_image_features, vocab_size,
 	should_train_visual, rsa_sampling,
 	use_gpu)
 
+if should_compile_agents:
+	model.compile_agents()
+
 if use_gpu:
 	model = model.cuda()
 	
 optimizer = torch.optim.Adam(model.parameters(), lr=0.0001)
 es = EarlyStopping(mode="max", patience=10, threshold=0.005, threshold_mode="rel") # Not 30 patience
 
+metrics_worker = MetricsWorker(rsa_sampling) if use_async_metrics else None
+# Checkpoints and dumps of an epoch can be written while the next one trains
+dump_writer = DumpWriter(asynchronous=use_async_dumps)
+# Only the best checkpoints by eval accuracy and the latest one are kept on disk
+checkpoints = CheckpointManager(current_model_dir if should_dump else None, model_id, mode='max',
+	keep_best=keep_best_checkpoints, every_n=checkpoint_every, dump_writer=dump_writer)
+
 # Init metric trackers
 losses_meters = []
 eval_losses_meters = []
@@ -257,7 +315,7 @@ for epoch in range(EPOCHS):
 	epoch_rsa_si_meter,
 	epoch_rsa_ri_meter,
 	epoch_topological_sim_meter,
-	epoch_lang_entropy_meter) = train_one_epoch(model, train_data, optimizer, word_counts, train_metadata, debugging)
+	epoch_lang_entropy_meter) = train_one_epoch(model, train_data, optimizer, word_counts, train_metadata, debugging, metrics_worker, use_in_batch_negatives)
 
 	if math.isnan(epoch_loss_meter.avg):
 		print("The train loss in NaN. Stop training")
@@ -286,7 +344,7 @@ for epoch in range(EPOCHS):
 	eval_rsa_si_meter,
 	eval_rsa_ri_meter,
 	eval_topological_sim_meter,
-	eval_lang_entropy_meter) = evaluate(model, valid_data, eval_word_counts, valid_metadata, debugging)
+	eval_lang_entropy_meter) = evaluate(model, valid_data, eval_word_counts, valid_metadata, debugging, metrics_worker, use_in_batch_negatives)
 
 	eval_losses_meters.append(eval_loss_meter)
 	eval_accuracy_meters.append(eval_acc_meter)
@@ -310,22 +368,44 @@ for epoch in range(EPOCHS):
 
 	es.step(eval_acc_meter.avg)
 
+	checkpoints.step(e, eval_acc_meter.avg, model.state_dict())
+
 	if should_dump:
-		# Save model every epoch
-		torch.save(model.state_dict(), '{}/{}_{}_model'.format(current_model_dir, model_id, e))
+		# Stats of the epoch
+		dump_writer.submit(run_store.append_metrics, 'train', e,
+			loss=epoch_loss_meter,
+			accuracy=epoch_acc_meter,
+			entropy=epoch_entropy_meter,
+			distinctness=epoch_distinctness_meter,
+			rsa_sr=epoch_rsa_sr_meter,
+			rsa_si=epoch_rsa_si_meter,
+			rsa_ri=epoch_rsa_ri_meter,
+			topological_sim=epoch_topological_sim_meter,
+			language_entropy=epoch_lang_entropy_meter)
+		dump_writer.submit(run_store.append_metrics, 'eval', e,
+			loss=eval_loss_meter,
+			accuracy=eval_acc_meter,
+			entropy=eval_entropy_meter,
+			distinctness=eval_distinctness_meter,
+			rsa_sr=eval_rsa_sr_meter,
+			rsa_si=eval_rsa_si_meter,
+			rsa_ri=eval_rsa_ri_meter,
+			topological_sim=eval_topological_sim_meter,
+			language_entropy=eval_lang_entropy_meter)
 
 		# Dump messages every epoch
-		pickle.dump(messages, open('{}/{}_{}_messages.p'.format(current_model_dir, model_id, e), 'wb'))
-		pickle.dump(eval_messages, open('{}/{}_{}_eval_messages.p'.format(current_model_dir, model_id, e), 'wb'))
+		dump_writer.submit(run_store.save_messages, 'train', e, messages)
+		dump_writer.submit(run_store.save_messages, 'eval', e, eval_messages)
 
 		# Dump indices as often as messages
 		if should_dump_indices:
-			pickle.dump(indices, open('{}/{}_{}_imageIndices.p'.format(current_model_dir, model_id, e), 'wb'))
-			pickle.dump(eval_indices, open('{}/{}_{}_eval_imageIndices.p'.format(current_model_dir, model_id, e), 'wb'))
+			dump_writer.submit(run_store.save_arrays, 'train', e, indices=indices)
+			dump_writer.submit(run_store.save_arrays, 'eval', e, indices=eval_indices)
 
-		if should_covert_to_words:
-			dump_words(current_model_dir, messages, idx_to_word, '{}_{}_messages'.format(model_id, e))
-			dump_words(current_model_dir, eval_messages, idx_to_word, '{}_{}_eval_messages'.format(model_id, e))
+		# The catalog follows every checkpoint, so runs killed later are still found with their dumps
+		dump_writer.submit(run_store.set_attributes, last_epoch=e,
+			checkpoint_epochs=sorted(checkpoints.saved_epochs))
+		dump_writer.submit(run_catalog.add, run_store)
 
 	if es.is_converged:
 		print("Converged in epoch {}".format(e))
@@ -338,32 +418,18 @@ for epoch in range(EPOCHS):
 print()
 print('Training took {} seconds'.format(time.time() - train_start_time))
 
+# Runs stopped by a NaN loss are not tested, their catalog entry is final here
+if should_dump:
+	dump_writer.submit(run_store.set_attributes, is_loss_nan=is_loss_nan, best_epoch=checkpoints.best_epoch)
+	dump_writer.submit(run_catalog.add, run_store)
+
+# Also after a NaN loss, the dumps of the previous epochs are complete
+dump_writer.flush()
+
 if is_loss_nan:
 	should_dump = False
 	should_evaluate_best = False
 
-if should_dump:
-	# Dump latest stats
-	pickle.dump(losses_meters, open('{}/{}_{}_losses_meters.p'.format(current_model_dir, model_id, e), 'wb'))
-	pickle.dump(eval_losses_meters, open('{}/{}_{}_eval_losses_meters.p'.format(current_model_dir, model_id, e), 'wb'))
-	pickle.dump(accuracy_meters, open('{}/{}_{}_accuracy_meters.p'.format(current_model_dir, model_id, e), 'wb'))
-	pickle.dump(eval_accuracy_meters, open('{}/{}_{}_eval_accuracy_meters.p'.format(current_model_dir, model_id, e), 'wb'))
-	pickle.dump(entropy_meters, open('{}/{}_{}_entropy_meters.p'.format(current_model_dir, model_id, e), 'wb'))
-	pickle.dump(eval_entropy_meters, open('{}/{}_{}_eval_entropy_meters.p'.format(current_model_dir, model_id, e), 'wb'))
-	pickle.dump(distinctness_meters, open('{}/{}_{}_distinctness_meters.p'.format(current_model_dir, model_id, e), 'wb'))
-	pickle.dump(eval_distinctness_meters, open('{}/{}_{}_eval_distinctness_meters.p'.format(current_model_dir, model_id, e), 'wb'))
-	pickle.dump(rsa_sr_meters, open('{}/{}_{}_rsa_sr_meters.p'.format(current_model_dir, model_id, e), 'wb'))
-	pickle.dump(eval_rsa_sr_meters, open('{}/{}_{}_eval_rsa_sr_meters.p'.format(current_model_dir, model_id, e), 'wb'))
-	pickle.dump(rsa_si_meters, open('{}/{}_{}_rsa_si_meters.p'.format(current_model_dir, model_id, e), 'wb'))
-	pickle.dump(eval_rsa_si_meters, open('{}/{}_{}_eval_rsa_si_meters.p'.format(current_model_dir, model_id, e), 'wb'))
-	pickle.dump(rsa_ri_meters, open('{}/{}_{}_rsa_ri_meters.p'.format(current_model_dir, model_id, e), 'wb'))
-	pickle.dump(eval_rsa_ri_meters, open('{}/{}_{}_eval_rsa_ri_meters.p'.format(current_model_dir, model_id, e), 'wb'))
-	pickle.dump(topological_sim_meters, open('{}/{}_{}_topological_sim_meters.p'.format(current_model_dir, model_id, e), 'wb'))
-	pickle.dump(eval_topological_sim_meters, open('{}/{}_{}_eval_topological_sim_meters.p'.format(current_model_dir, model_id, e), 'wb'))
-	pickle.dump(language_entropy_meters, open('{}/{}_{}_language_entropy_meters.p'.format(current_model_dir, model_id, e), 'wb'))
-	pickle.dump(eval_language_entropy_meters, open('{}/{}_{}_eval_language_entropy_meters.p'.format(current_model_dir, model_id, e), 'wb'))
-
-
 # Evaluate best model on test data
 if should_evaluate_best:
 
@@ -372,20 +438,13 @@ if should_evaluate_best:
 		best_model = model
 		best_epoch = e
 	else:
-		# Actually pick the best
-		best_epoch = np.argmax([m.avg for m in eval_accuracy_meters])
-		best_model = Model(n_image_features, vocab_size,
-			EMBEDDING_DIM, HIDDEN_SIZE, 
-			bound_idx, max_sentence_length, 
-			vl_loss_weight, bound_weight, 
-			should_train_visual, rsa_sampling,
-			use_gpu)
-		best_model_name = '{}/{}_{}_model'.format(current_model_dir, model_id, best_epoch)
-		state = torch.load(best_model_name, map_location= lambda storage, location: storage)
-		best_model.load_state_dict(state)
-
-		print()
-		print('Best model is in file: {}'.format(best_model_name))
+		# Actually pick the best, kept in memory by the checkpoint manager
+		best_epoch = checkpoints.best_epoch
+		best_model = checkpoints.load_best(model)
+
+		if should_dump:
+			print()
+			print('Best model is in file: {}'.format(checkpoints.best_file_name))
 
 	if use_gpu:
 		best_model = best_model.cuda()
@@ -405,25 +464,32 @@ if should_evaluate_best:
 	test_rsa_si_meter,
 	test_rsa_ri_meter,
 	test_topological_sim_meter,
-	test_language_entropy_meter) = evaluate(best_model, test_data, test_word_counts, test_metadata, debugging)
+	test_language_entropy_meter) = evaluate(best_model, test_data, test_word_counts, test_metadata, debugging, metrics_worker, use_in_batch_negatives)
 
 	print()
 	print('Test accuracy: {}'.format(test_acc_meter.avg))
 
 	if should_dump:
-		pickle.dump(test_loss_meter, open('{}/{}_{}_test_losses_meter.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
-		pickle.dump(test_acc_meter, open('{}/{}_{}_test_accuracy_meter.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
-		pickle.dump(test_entropy_meter, open('{}/{}_{}_test_entropy_meter.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
-		pickle.dump(test_distinctness_meter, open('{}/{}_{}_test_distinctness_meter.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
-		pickle.dump(test_rsa_sr_meter, open('{}/{}_{}_test_rsa_sr_meter.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
-		pickle.dump(test_rsa_si_meter, open('{}/{}_{}_test_rsa_si_meter.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
-		pickle.dump(test_rsa_ri_meter, open('{}/{}_{}_test_rsa_ri_meter.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
-		pickle.dump(test_topological_sim_meter, open('{}/{}_{}_test_topological_sim_meter.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
-		pickle.dump(test_language_entropy_meter, open('{}/{}_{}_test_language_entropy_meter.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
-		pickle.dump(test_messages, open('{}/{}_{}_test_messages.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
+		dump_writer.submit(run_store.append_metrics, 'test', best_epoch,
+			loss=test_loss_meter,
+			accuracy=test_acc_meter,
+			entropy=test_entropy_meter,
+			distinctness=test_distinctness_meter,
+			rsa_sr=test_rsa_sr_meter,
+			rsa_si=test_rsa_si_meter,
+			rsa_ri=test_rsa_ri_meter,
+			topological_sim=test_topological_sim_meter,
+			language_entropy=test_language_entropy_meter)
+		dump_writer.submit(run_store.save_messages, 'test', best_epoch, test_messages)
 
 		if should_dump_indices:
-			pickle.dump(test_indices, open('{}/{}_{}_test_imageIndices.p'.format(current_model_dir, model_id, best_epoch), 'wb'))			
+			dump_writer.submit(run_store.save_arrays, 'test', best_epoch, indices=test_indices)
+
+		dump_writer.submit(run_store.set_attributes, best_epoch=int(best_epoch),
+			best_checkpoint=os.path.basename(checkpoints.file_name(best_epoch)))
+		dump_writer.submit(run_catalog.add, run_store)
+
+dump_writer.shutdown()
 
-		if should_covert_to_words:
-			dump_words(current_model_dir, test_messages, idx_to_word, '{}_{}_test_messages'.format(model_id, best_epoch))
\ No newline at end of file
+if metrics_worker is not None:
+	metrics_worker.shutdown()
@@ -1,4 +1,3 @@
-import pickle
 import numpy as np
 import random
 from datetime import datetime
@@ -14,15 +13,15 @@ from utils import EarlyStopping
 from dataloader import load_dictionaries, load_images, load_pretrained_features
 from build_shapes_dictionaries import *
 from metadata import does_shapes_onehot_metadata_exist, create_shapes_onehot_metadata, load_shapes_onehot_metadata
-from decode import dump_words
+from run_store import RunStore
+from run_catalog import RunCatalog
 from visual_module import CNN
-from dump_cnn_features import save_features
+from dump_cnn_features import save_features, do_features_exist
 import argparse
 
 use_gpu = torch.cuda.is_available()
 debugging = not use_gpu
 should_dump = True#not debugging
-should_covert_to_words = not debugging
 should_dump_indices = not debugging
 
 
@@ -125,7 +124,7 @@ if not should_train_visual and not use_symbolic_input and not shapes_dataset is
 	features_folder_name = 'data/shapes/{}_{}'.format(shapes_dataset, cnn_model_id)
 
 	# Check if the features were already extracted with this CNN
-	if not os.path.exists(features_folder_name):
+	if not do_features_exist(features_folder_name):
 		# Load CNN from dumped model
 		state = torch.load(cnn_model_file_name, map_location= lambda storage, location: storage)
 		cnn_state = {k[4:]:v for k,v in state.items() if 'cnn' in k}
@@ -184,6 +183,15 @@ current_model_dir = '{}/{}'.format(dumps_dir, model_id)
 if should_dump and not os.path.exists(current_model_dir):
 	os.mkdir(current_model_dir)
 
+if should_dump:
+	run_store = RunStore(current_model_dir)
+	run_store.set_attributes(model_id=model_id, vocab_size=vocab_size, bound_idx=bound_idx,
+		vocab_folder='shapes' if not shapes_dataset is None else 'mscoco',
+		max_sentence_length=max_sentence_length, vl_loss_weight=vl_loss_weight, bound_weight=bound_weight,
+		shapes_dataset=shapes_dataset, seed=seed)
+	run_catalog = RunCatalog(dumps_dir)
+	run_catalog.add(run_store)
+
 
 should_evaluate_best = True
 # Evaluate best model on test data
@@ -233,19 +241,20 @@ if should_evaluate_best:
 	print('Test accuracy: {}'.format(test_acc_meter.avg))
 
 	if should_dump:
-		pickle.dump(test_loss_meter, open('{}/{}_{}_test_losses_meter.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
-		pickle.dump(test_acc_meter, open('{}/{}_{}_test_accuracy_meter.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
-		pickle.dump(test_entropy_meter, open('{}/{}_{}_test_entropy_meter.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
-		pickle.dump(test_distinctness_meter, open('{}/{}_{}_test_distinctness_meter.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
-		pickle.dump(test_rsa_sr_meter, open('{}/{}_{}_test_rsa_sr_meter.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
-		pickle.dump(test_rsa_si_meter, open('{}/{}_{}_test_rsa_si_meter.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
-		pickle.dump(test_rsa_ri_meter, open('{}/{}_{}_test_rsa_ri_meter.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
-		pickle.dump(test_topological_sim_meter, open('{}/{}_{}_test_topological_sim_meter.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
-		pickle.dump(test_language_entropy_meter, open('{}/{}_{}_test_language_entropy_meter.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
-		pickle.dump(test_messages, open('{}/{}_{}_test_messages.p'.format(current_model_dir, model_id, best_epoch), 'wb'))
+		run_store.append_metrics('test', best_epoch,
+			loss=test_loss_meter,
+			accuracy=test_acc_meter,
+			entropy=test_entropy_meter,
+			distinctness=test_distinctness_meter,
+			rsa_sr=test_rsa_sr_meter,
+			rsa_si=test_rsa_si_meter,
+			rsa_ri=test_rsa_ri_meter,
+			topological_sim=test_topological_sim_meter,
+			language_entropy=test_language_entropy_meter)
+		run_store.save_messages('test', best_epoch, test_messages)
 
 		if should_dump_indices:
-			pickle.dump(test_indices, open('{}/{}_{}_test_imageIndices.p'.format(current_model_dir, model_id, best_epoch), 'wb'))			
+			run_store.save_arrays('test', best_epoch, indices=test_indices)
 
-		if should_covert_to_words:
-			dump_words(current_model_dir, test_messages, idx_to_word, '{}_{}_test_messages'.format(model_id, best_epoch))
\ No newline at end of file
+		run_store.set_attributes(best_epoch=int(best_epoch))
+		run_catalog.add(run_store)
\ No newline at end of file
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+import torch
+
+from checkpoint_manager import CheckpointManager
+from dump_writer import DumpWriter
+
+
+class TestCheckpointManager(unittest.TestCase):
+
+    def test_retention(self):
+        accuracies = [0.2, 0.5, 0.4, 0.5, 0.7, 0.1, 0.3, float('nan')]
+
+        for asynchronous in [False, True]:
+            with tempfile.TemporaryDirectory() as folder:
+                writer = DumpWriter(asynchronous=asynchronous)
+                checkpoints = CheckpointManager(folder, 'run', keep_best=2, every_n=3, dump_writer=writer)
+                model = torch.nn.Linear(4, 2)
+
+                for e, accuracy in enumerate(accuracies):
+                    with torch.no_grad():
+                        model.weight.fill_(e)
+                    checkpoints.step(e, accuracy, model.state_dict())
+
+                writer.shutdown()
+
+                # Best two (ties keep the earliest), every third and the latest
+                self.assertEqual(sorted(os.listdir(folder)),
+                    ['run_{}_model'.format(e) for e in [0, 1, 3, 4, 6, 7]])
+                self.assertEqual(checkpoints.best_epoch, 4)
+                self.assertTrue(torch.equal(torch.load(checkpoints.best_file_name)['weight'], torch.full((2, 4), 4.0)))
+
+                best_model = checkpoints.load_best(torch.nn.Linear(4, 2))
+                self.assertTrue(torch.equal(best_model.weight, torch.full((2, 4), 4.0)))
+
+    def test_only_best(self):
+        with tempfile.TemporaryDirectory() as folder:
+            checkpoints = CheckpointManager(folder, mode='min', keep_last=False)
+            model = torch.nn.Linear(4, 2)
+
+            for e, loss in enumerate([3.0, 2.0, 2.5, 1.0, 1.0]):
+                checkpoints.step(e, loss, model.state_dict())
+                self.assertEqual(os.listdir(folder), ['{}_model'.format(checkpoints.best_epoch)])
+
+            self.assertEqual(checkpoints.best_epoch, 3)
+
+    def test_in_memory(self):
+        checkpoints = CheckpointManager(None)
+        model = torch.nn.Linear(4, 2)
+
+        checkpoints.step(0, 0.5, model.state_dict())
+        expected_weight = model.weight.detach().clone()
+        with torch.no_grad():
+            model.weight.add_(1) # the kept state_dict is a copy
+        checkpoints.step(1, 0.4, model.state_dict())
+
+        self.assertIsNone(checkpoints.best_file_name)
+        self.assertTrue(torch.equal(checkpoints.load_best(model).weight, expected_weight))
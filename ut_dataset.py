@@ -0,0 +1,159 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from visual_module import ImageTransform
+
+from ImageDataset import compute_mean_std, load_mean_std, ImageDataset, ResizedImageDataset, RawImageDataset, ImageFeaturesDataset, ImageFeaturesDatasetZeroShot, ImagesSampler, collate_batch, DeviceFeaturesLoader
+
+
+class TestImageFeaturesDataset(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        np.random.seed(42)
+        self.features = np.random.rand(100, 16).astype(np.float32)
+
+    def test_compute_mean_std(self):
+        pixels = np.random.randint(256, size=(50, 8, 8, 3)).astype(np.uint8)
+
+        for data, axis in [(self.features, 0), (pixels, (0, 1, 2))]:
+            mean, std = compute_mean_std(data, axis=axis, chunk_size=7)
+
+            np.testing.assert_allclose(mean, np.mean(data, axis=axis, dtype=np.float64), rtol=1e-6)
+            np.testing.assert_allclose(std, np.std(data, axis=axis, dtype=np.float64), rtol=1e-6)
+
+    def test_load_mean_std_cache(self):
+        with tempfile.TemporaryDirectory() as folder:
+            file_name = os.path.join(folder, 'train_features.npy')
+            np.save(file_name, self.features)
+
+            mean, std = load_mean_std(file_name)
+            self.assertTrue(os.path.exists(os.path.join(folder, 'train_features.stats.npz')))
+            np.testing.assert_allclose(mean, self.features.mean(axis=0), rtol=1e-5)
+
+            cached_mean, cached_std = load_mean_std(file_name)
+            np.testing.assert_array_equal(cached_mean, mean)
+            np.testing.assert_array_equal(cached_std, std)
+
+            # A different array in the same file invalidates the cache
+            np.save(file_name, self.features[:50] + 1)
+            os.utime(file_name, ns=(0, 0))
+            mean, _ = load_mean_std(file_name)
+            np.testing.assert_allclose(mean, self.features[:50].mean(axis=0) + 1, rtol=1e-5)
+
+    def test_memmap(self):
+        with tempfile.TemporaryDirectory() as folder:
+            file_name = os.path.join(folder, 'features.npy')
+            np.save(file_name, self.features)
+
+            dataset = ImageFeaturesDataset(np.load(file_name, mmap_mode='r'))
+            in_memory_dataset = ImageFeaturesDataset(self.features)
+            indices = np.array([[0, 1, 2], [3, 4, 5]])
+
+            for x, y in zip(dataset.__getitems__(indices), in_memory_dataset.__getitems__(indices)):
+                self.assertEqual(x.dtype, y.dtype)
+                np.testing.assert_allclose(x.numpy(), y.numpy(), rtol=1e-5)
+
+    def test_getitems_matches_getitem(self):
+        dataset = ImageFeaturesDataset(self.features)
+        indices = np.concatenate(list(ImagesSampler(dataset, 3, True, 10, seed=0)))[:10]
+
+        target, distractors, idxs = dataset.__getitems__(indices)
+
+        self.assertEqual(target.shape, (10, 16))
+        self.assertEqual(distractors.shape, (10, 3, 16))
+        np.testing.assert_array_equal(idxs.numpy(), indices)
+
+        for i, row in enumerate(indices):
+            t, ds, _ = dataset[row]
+            np.testing.assert_array_equal(target[i].numpy(), t)
+            for j, d in enumerate(ds):
+                np.testing.assert_array_equal(distractors[i, j].numpy(), d)
+
+    def test_loader(self):
+        dataset = ImageFeaturesDataset(self.features)
+        data = DataLoader(dataset, collate_fn=collate_batch,
+            batch_sampler=ImagesSampler(dataset, 3, shuffle=False, batch_size=32, seed=0))
+
+        batches = list(data)
+        self.assertEqual(len(batches), 4)
+
+        target, distractors, idxs = batches[-1]
+        self.assertIsInstance(distractors, torch.Tensor)
+        self.assertEqual(distractors.shape, (4, 3, 16))
+        np.testing.assert_allclose(target.numpy(), dataset.normalize(self.features[idxs[:, 0].numpy()]))
+
+    def test_zero_shot(self):
+        dataset = ImageFeaturesDatasetZeroShot(self.features[:50], self.features[50:])
+        indices = np.array([[0, 1, 2], [3, 4, 5]])
+
+        target, distractors, _ = dataset.__getitems__(indices)
+
+        np.testing.assert_allclose(target.numpy(), dataset.normalize(self.features[[0, 3]]))
+        np.testing.assert_allclose(distractors.numpy(), dataset.normalize(self.features[50:][indices[:, 1:]]))
+
+    def test_device_loader_matches_loader(self):
+        dataset = ImageFeaturesDataset(self.features)
+        data = DataLoader(dataset, collate_fn=collate_batch,
+            batch_sampler=ImagesSampler(dataset, 3, shuffle=True, batch_size=32, seed=0))
+        features = dataset.normalize(self.features)
+        device_data = DeviceFeaturesLoader(features, features,
+            ImagesSampler(dataset, 3, shuffle=True, batch_size=32, seed=0), 'cpu')
+
+        self.assertEqual(len(device_data), len(data))
+        for batch, device_batch in zip(data, device_data):
+            for x, y in zip(batch, device_batch):
+                self.assertTrue(torch.equal(x, y))
+
+
+class TestResizedImageDataset(unittest.TestCase):
+
+    def test_matches_image_dataset(self):
+        np.random.seed(0)
+
+        for shape in [(10, 30, 30, 3), (10, 2, 30, 30, 3)]:
+            with tempfile.TemporaryDirectory() as folder:
+                file_name = os.path.join(folder, 'train.large.input.npy')
+                np.save(file_name, np.random.randint(256, size=shape).astype(np.uint8))
+
+                dataset = ImageDataset(file_name)
+                resized_dataset = ResizedImageDataset(file_name)
+                indices = np.array([[0, 1, 2], [3, 4, 5]])
+
+                target, distractors, _ = resized_dataset.__getitems__(indices)
+                self.assertEqual(distractors.shape[:2], (2, 2))
+
+                for i, row in enumerate(indices):
+                    t, ds, _ = dataset[row]
+                    np.testing.assert_allclose(target[i].numpy(), t.numpy(), atol=1e-5)
+                    for j, d in enumerate(ds):
+                        np.testing.assert_allclose(distractors[i, j].numpy(), d.numpy(), atol=1e-5)
+
+    def test_image_transform_matches_image_dataset(self):
+        np.random.seed(0)
+
+        with tempfile.TemporaryDirectory() as folder:
+            file_name = os.path.join(folder, 'train.large.input.npy')
+            np.save(file_name, np.random.randint(256, size=(10, 2, 30, 30, 3)).astype(np.uint8))
+
+            dataset = ImageDataset(file_name)
+            raw_dataset = RawImageDataset(file_name)
+            transform = ImageTransform((128, 128), raw_dataset.mean, raw_dataset.std)
+            indices = np.array([[0, 1, 2], [3, 4, 5]])
+
+            target, distractors, _ = raw_dataset.__getitems__(indices)
+            target = transform(target)
+            distractors = transform(distractors)
+            self.assertEqual(distractors.shape, (2, 2, 2, 3, 128, 128))
+
+            # PIL rounds the resized images to uint8, so they can differ by one step
+            atol = 1.0 / 255 / dataset.std.min() + 1e-6
+            for i, row in enumerate(indices):
+                t, ds, _ = dataset[row]
+                np.testing.assert_allclose(target[i].numpy(), t.numpy(), atol=atol)
+                for j, d in enumerate(ds):
+                    np.testing.assert_allclose(distractors[i, j].numpy(), d.numpy(), atol=atol)
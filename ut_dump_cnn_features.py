@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import torch
+
+from dump_cnn_features import ShapesDataset, get_features
+from visual_module import CNN
+
+
+class InterruptedCNN(torch.nn.Module):
+    def __init__(self, cnn, n_batches):
+        super().__init__()
+        self.cnn = cnn
+        self.n_batches = n_batches
+
+    def forward(self, x):
+        if self.n_batches == 0:
+            raise KeyboardInterrupt
+        self.n_batches -= 1
+        return self.cnn(x)
+
+
+class TestGetFeatures(unittest.TestCase):
+
+    def test_resume(self):
+        torch.manual_seed(0)
+        np.random.seed(0)
+        cnn = CNN(16).eval()
+
+        with tempfile.TemporaryDirectory() as folder:
+            images_file_name = os.path.join(folder, 'train.large.input.npy')
+            np.save(images_file_name, np.random.randint(256, size=(22, 30, 30, 3)).astype(np.uint8))
+            dataset = ShapesDataset(images_file_name)
+
+            expected_file_name = os.path.join(folder, 'expected_features.npy')
+            get_features(cnn, dataset, expected_file_name, batch_size=4, chunk_size=8)
+
+            # Stops during the second chunk, after the first one was recorded
+            output_file_name = os.path.join(folder, 'train_features.npy')
+            with self.assertRaises(KeyboardInterrupt):
+                get_features(InterruptedCNN(cnn, 3), dataset, output_file_name, batch_size=4, chunk_size=8)
+            self.assertFalse(os.path.exists(output_file_name))
+
+            # Only the remaining two chunks (4 batches) are extracted
+            get_features(InterruptedCNN(cnn, 4), dataset, output_file_name, batch_size=4, chunk_size=8)
+
+            np.testing.assert_array_equal(np.load(output_file_name), np.load(expected_file_name))
+            self.assertEqual(sorted(os.listdir(folder)),
+                ['expected_features.npy', 'train.large.input.npy', 'train.large.input.stats.npz', 'train_features.npy'])
@@ -0,0 +1,54 @@
+import os
+import time
+import tempfile
+import unittest
+import torch
+
+from dump_writer import DumpWriter
+
+
+class TestDumpWriter(unittest.TestCase):
+
+    def test_order_and_snapshots(self):
+        writer = DumpWriter(max_pending=2)
+        written = []
+
+        def write(i, state_dict):
+            time.sleep(0.01)
+            written.append((i, state_dict['w'].clone()))
+
+        w = torch.zeros(3)
+        for i in range(5):
+            writer.submit(write, i, {'w': w})
+            w += 1 # like an optimizer step while the dump is pending
+
+        writer.flush()
+        self.assertEqual([i for i, _ in written], list(range(5)))
+        for i, state in written:
+            self.assertTrue(torch.equal(state, torch.full((3,), float(i))))
+
+        writer.shutdown()
+
+    def test_save_state_dict(self):
+        with tempfile.TemporaryDirectory() as folder:
+            file_name = os.path.join(folder, 'model')
+            model = torch.nn.Linear(4, 2)
+
+            writer = DumpWriter()
+            writer.save_state_dict(model.state_dict(), file_name)
+            writer.shutdown()
+
+            self.assertEqual(os.listdir(folder), ['model'])
+            state = torch.load(file_name)
+            self.assertTrue(torch.equal(state['weight'], model.weight))
+
+    def test_error(self):
+        writer = DumpWriter()
+
+        def fail():
+            raise IOError('disk full')
+
+        writer.submit(fail)
+        with self.assertRaises(RuntimeError):
+            writer.flush()
+        writer.shutdown()
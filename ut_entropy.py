@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+import scipy.stats
+import torch
+
+from entropy import language_entropy
+
+
+def loop_language_entropy(generated_messages):
+    eos_token = generated_messages.max()
+    padded_messages = np.zeros(
+        (generated_messages.shape[0], generated_messages.shape[1] - 1)
+    )
+    for m in range(generated_messages.shape[0]):
+        run_entropy_on_full = True
+        for t in range(1, generated_messages.shape[1]):
+            if generated_messages[m][t] == eos_token:
+                padded_messages[m, : t - 1] = generated_messages[m, 1:t]
+                run_entropy_on_full = False
+        if run_entropy_on_full:
+            padded_messages[m] = generated_messages[m, 1:]
+
+    y = np.bincount(padded_messages.flatten().astype(int))
+    return scipy.stats.entropy(y)
+
+
+class TestEntropy(unittest.TestCase):
+
+    def test_matches_loop_random(self):
+        np.random.seed(42)
+        for vocab_size, length in [(3, 5), (10, 5), (100, 10), (10000, 25)]:
+            messages = np.random.randint(vocab_size, size=(500, length + 1))
+
+            self.assertAlmostEqual(
+                language_entropy(messages), loop_language_entropy(messages), places=10)
+
+    def test_matches_loop_padded(self):
+        messages = np.array([
+                [9, 1, 9, 9, 9, 9],
+                [9, 2, 3, 4, 9, 9],
+                [9, 0, 0, 0, 0, 0],
+                [9, 5, 9, 6, 9, 7],
+            ])
+
+        self.assertAlmostEqual(
+            language_entropy(messages), loop_language_entropy(messages), places=10)
+
+    def test_torch_input(self):
+        np.random.seed(0)
+        messages = np.random.randint(10, size=(100, 6))
+
+        self.assertAlmostEqual(
+            language_entropy(torch.from_numpy(messages)), loop_language_entropy(messages), places=10)
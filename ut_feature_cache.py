@@ -0,0 +1,84 @@
+import os
+import json
+import tempfile
+import unittest
+import numpy as np
+import torch
+
+import feature_cache
+from feature_cache import load_cached_features, features_key
+from visual_module import CNN
+
+
+class TestFeatureCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.folder = tempfile.TemporaryDirectory()
+        os.chdir(self.folder.name)
+
+        np.random.seed(0)
+        for dataset in ['a', 'b']:
+            os.makedirs('shapes/{}'.format(dataset))
+            for f in ['train.large.input.npy', 'val.input.npy', 'test.input.npy']:
+                np.save('shapes/{}/{}'.format(dataset, f), np.random.randint(256, size=(6, 30, 30, 3)).astype(np.uint8))
+
+        torch.manual_seed(0)
+        self.cnn = CNN(16).eval()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.folder.cleanup()
+
+    def test_reuse(self):
+        features_folder_name = load_cached_features(self.cnn, 'a')
+        features = np.load('{}/train_features.npy'.format(features_folder_name))
+        mtime = os.path.getmtime('{}/train_features.npy'.format(features_folder_name))
+
+        self.assertEqual(load_cached_features(self.cnn, 'a'), features_folder_name)
+        self.assertEqual(os.path.getmtime('{}/train_features.npy'.format(features_folder_name)), mtime)
+        self.assertEqual(features.shape, (6, 16))
+
+    def test_key(self):
+        key = features_key(self.cnn, 'a')
+        self.assertNotEqual(features_key(self.cnn, 'b'), key)
+
+        # Features truncated when debugging on cpu are never returned as full ones
+        use_gpu = feature_cache.use_gpu
+        feature_cache.use_gpu = not use_gpu
+        self.assertNotEqual(features_key(self.cnn, 'a'), key)
+        feature_cache.use_gpu = use_gpu
+
+        with torch.no_grad():
+            self.cnn.lin[0].bias[0] += 1
+        self.assertNotEqual(features_key(self.cnn, 'a'), key)
+
+    def test_lock_of_killed_job(self):
+        # The lock file of a killed job is left behind, but not its flock
+        key = features_key(self.cnn, 'a')
+        os.makedirs(feature_cache.CACHE_FOLDER)
+        open(os.path.join(feature_cache.CACHE_FOLDER, '{}.lock'.format(key)), 'w').close()
+
+        self.assertEqual(load_cached_features(self.cnn, 'a'), os.path.join(feature_cache.CACHE_FOLDER, key))
+
+    def test_eviction(self):
+        folder_a = load_cached_features(self.cnn, 'a')
+        size = feature_cache.folder_size(folder_a)
+
+        # Just used, it may not be loaded yet
+        folder_b = load_cached_features(self.cnn, 'b', max_bytes=size)
+        self.assertTrue(os.path.exists(folder_a))
+
+        index_file_name = os.path.join(feature_cache.CACHE_FOLDER, 'index.json')
+        with open(index_file_name) as f:
+            entries = json.load(f)
+        entries[os.path.basename(folder_a)]['last_used'] -= 2 * feature_cache.EVICTION_GRACE_SECONDS
+        with open(index_file_name, 'w') as f:
+            json.dump(entries, f)
+
+        folder_b = load_cached_features(self.cnn, 'b', max_bytes=size)
+
+        self.assertFalse(os.path.exists(folder_a))
+        self.assertTrue(os.path.exists(folder_b))
+        with open(index_file_name) as f:
+            self.assertEqual(list(json.load(f)), [os.path.basename(folder_b)])
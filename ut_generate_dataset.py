@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shapes'))
+from generate_dataset import *
+
+
+class TestGenerateDataset(unittest.TestCase):
+
+    def test_split_seeds(self):
+        np.random.seed(42)
+        f_get_dataset = get_dataset_uneven_different_targets_row_incomplete
+        f_args = get_uneven_probs(f_get_dataset)
+        split_seeds = get_split_seeds(42, ['train.large', 'val', 'test'])
+        self.assertEqual(len(set(split_seeds.values())), 3)
+
+        with tempfile.TemporaryDirectory() as folder, Pool(2) as pool:
+            inputs = []
+
+            # The seeds gen_shapes.py passes, and numpy integers
+            for seed in [split_seeds['val'], np.int64(split_seeds['val'])]:
+                file_name = os.path.join(folder, '{}.input.npy'.format(len(inputs)))
+                metadata = generate_dataset(file_name, 5, f_get_dataset, f_args, seed, pool, 'numpy')
+
+                self.assertEqual(len(metadata), 5)
+                inputs.append(np.load(file_name))
+
+            self.assertEqual(inputs[0].shape, (5, 2, WIDTH, HEIGHT, N_CHANNELS))
+            np.testing.assert_array_equal(inputs[0], inputs[1])
@@ -0,0 +1,36 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shapes'))
+from image_utils import *
+
+
+class TestRenderNumpy(unittest.TestCase):
+
+    def test_figures(self):
+        np.random.seed(0)
+
+        for shape, area in [(SHAPE_CIRCLE, np.pi), (SHAPE_SQUARE, 4), (SHAPE_TRIANGLE, 2)]:
+            image = get_image([Figure(shape, COLOR_RED, SIZE_BIG, r=1, c=2)])
+            pixels = render_images([image], 'numpy')[0]
+            _, _, _, radius, rgb = image.strokes[0]
+
+            # Drawn in its cell only, in the BGR order of cairo
+            rows, cols = np.nonzero(pixels.sum(axis=-1))
+            self.assertTrue(np.all((rows >= 10) & (rows < 20) & (cols >= 20) & (cols < 30)))
+            self.assertEqual(pixels[..., 2].max(), round(rgb[0] * 255))
+
+            # Antialiased coverage adds up to the area of the figure
+            self.assertAlmostEqual(pixels[..., 2].sum() / 255. / rgb[0], area * radius**2, delta=0.05 * area * radius**2)
+
+    def test_batch(self):
+        np.random.seed(0)
+        images = [get_image([Figure(-1, -1, -1, r=-1, c=-1) for _ in range(3)]) for _ in range(10)]
+
+        pixels = render_images(images, 'numpy')
+
+        self.assertEqual(pixels.shape, (10, WIDTH, HEIGHT, N_CHANNELS))
+        for i, image in enumerate(images):
+            np.testing.assert_array_equal(pixels[i], render_images([image], 'numpy')[0])
@@ -0,0 +1,24 @@
+import unittest
+import torch
+
+from metrics import MetricsWorker, calculate_metrics
+from utils import AverageMeter
+
+
+class TestMetricsWorker(unittest.TestCase):
+
+    def test_matches_calculate_metrics(self):
+        torch.manual_seed(0)
+        snapshots = [(None, None, torch.randint(5, size=(16, 6)), None, None) for _ in range(10)]
+        worker = MetricsWorker(0, max_pending=2)
+
+        for snapshot in snapshots:
+            worker.submit(snapshot)
+            self.assertLessEqual(len(worker.pending), 2)
+
+        meters = [AverageMeter() for _ in range(5)]
+        worker.collect(*meters)
+        worker.shutdown()
+
+        expected_entropies = [calculate_metrics(snapshot, 0)[4] for snapshot in snapshots]
+        self.assertEqual(meters[4].all_values, expected_entropies)
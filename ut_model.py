@@ -1,7 +1,9 @@
 import unittest
+import copy
 import torch
 
 from model import Model
+from benchmark import loop_scores
 
 
 class TestModel(unittest.TestCase):
@@ -9,10 +11,10 @@ class TestModel(unittest.TestCase):
     @classmethod
     def setUpClass(self):
         self.model = Model(n_image_features=4096, vocab_size=3,
-            embedding_dim=256, hidden_size=512, batch_size=2, 
+            embedding_dim=256, hidden_size=512,
             bound_idx=2, max_sentence_length=5,
-            vl_loss_weight=0, bound_weight=1, should_train_visual=True, 
-            use_gpu=False)
+            vl_loss_weight=0, bound_weight=1, should_train_cnn=True,
+            n_rsa_samples=0, use_gpu=False)
 
     def test_get_word_counts_train(self):
         self.model.train()
@@ -124,4 +126,97 @@ class TestModel(unittest.TestCase):
 
 
 
-    
\ No newline at end of file
+    
+    def _forward(self, model, seed):
+        torch.manual_seed(0)
+        target = torch.randn((4, 64))
+        distractors = [torch.randn((4, 64)) for _ in range(3)]
+        word_counts = torch.tensor([2.0, 1.0, 1.0])
+
+        torch.manual_seed(seed)
+        return model(target, distractors, word_counts, None)
+
+    def test_compiled_agents_parity(self):
+        torch.manual_seed(1)
+        model = Model(n_image_features=64, vocab_size=3,
+            embedding_dim=16, hidden_size=32,
+            bound_idx=2, max_sentence_length=5,
+            vl_loss_weight=0.5, bound_weight=1, should_train_cnn=False,
+            n_rsa_samples=0, use_gpu=False)
+        torch.nn.init.normal_(model.sender.linear_probs.weight, 0, 0.5)
+
+        compiled_model = copy.deepcopy(model)
+        compiled_model.compile_agents()
+
+        for train in [True, False]:
+            model.train(train)
+            compiled_model.train(train)
+
+            loss, acc, m, _w_counts, entropy, _distinctness, _snapshot = self._forward(model, 42)
+            c_loss, c_acc, c_m, _w_counts, c_entropy, _distinctness, _snapshot = self._forward(compiled_model, 42)
+
+            self.assertTrue(torch.equal(m, c_m))
+            self.assertTrue(torch.allclose(loss, c_loss))
+            self.assertTrue(torch.allclose(acc, c_acc))
+            self.assertTrue(torch.allclose(entropy, c_entropy))
+
+    def test_score_matches_loop(self):
+        torch.manual_seed(0)
+        target = torch.randn((4, 64))
+        distractors = [torch.randn((4, 64)) for _ in range(5)]
+        r_transform = torch.randn((1, 4, 64))
+
+        loss, acc = self.model._score(target, distractors, r_transform)
+        expected_loss, expected_acc = loop_scores(target, distractors, r_transform)
+
+        self.assertTrue(torch.allclose(loss, expected_loss))
+        self.assertTrue(torch.equal(acc, expected_acc))
+
+        # batch_size x K x n_features, as delivered by the batched datasets
+        loss, acc = self.model._score(target, torch.stack(distractors, dim=1), r_transform)
+        self.assertTrue(torch.allclose(loss, expected_loss))
+        self.assertTrue(torch.equal(acc, expected_acc))
+
+    def test_score_in_batch(self):
+        torch.manual_seed(0)
+        target = torch.randn((4, 64))
+        r_transform = torch.randn((1, 4, 64))
+
+        loss, acc = self.model._score_in_batch(target, r_transform)
+
+        for i in range(4):
+            distractors = [target[j:j+1] for j in range(4) if j != i]
+            expected_loss, _ = self.model._score(target[i:i+1], distractors, r_transform[:, i:i+1])
+            self.assertAlmostEqual(loss[i].item(), expected_loss.item(), places=4)
+
+            scores = r_transform[0, i] @ target.t()
+            self.assertEqual(acc[i].item(), float(torch.argmax(scores).item() == i))
+
+    def test_score_in_batch_duplicates(self):
+        torch.manual_seed(0)
+        target = torch.randn((4, 64))
+        target[2] = target[0] # same image in two rows
+        r_transform = torch.randn((1, 4, 64))
+        r_transform[0, 0] = target[0] # row 0 is right
+
+        loss, acc = self.model._score_in_batch(target, r_transform)
+
+        # Row 0 is only compared with rows 1 and 3
+        distractors = [target[1:2], target[3:4]]
+        expected_loss, _ = self.model._score(target[0:1], distractors, r_transform[:, 0:1])
+        self.assertAlmostEqual(loss[0].item(), expected_loss.item(), places=4)
+        self.assertEqual(acc[0].item(), 1.0)
+
+    def test_forward_in_batch_negatives_train_visual(self):
+        torch.manual_seed(0)
+        model = Model(n_image_features=64, vocab_size=3, embedding_dim=16, hidden_size=32, bound_idx=2,
+            max_sentence_length=5, vl_loss_weight=0, bound_weight=1, should_train_cnn=True,
+            n_rsa_samples=0, use_gpu=False)
+        word_counts = torch.zeros(3)
+
+        # Images, with no distractors (K=0) from the batched datasets
+        for target, distractors in [(torch.randn((4, 3, 128, 128)), torch.empty((4, 0, 3, 128, 128))),
+                (torch.randn((4, 2, 3, 128, 128)), torch.empty((4, 0, 2, 3, 128, 128)))]:
+            loss, acc = model(target, distractors, word_counts, None, use_in_batch_negatives=True)[:2]
+            self.assertTrue(torch.isfinite(loss).all())
+            self.assertTrue(0 <= acc.item() <= 1)
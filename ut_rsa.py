@@ -0,0 +1,63 @@
+import unittest
+import numpy as np
+import scipy.spatial
+import scipy.stats
+
+from rsa import one_hot, sample_pairs, cosine_distances, message_cosine_distances
+
+
+class TestRSA(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        np.random.seed(42)
+        self.n = 64
+        self.images = np.random.rand(self.n, 2048).astype(np.float32)
+        self.metadata = one_hot(np.random.randint(3, size=(self.n, 5))).reshape(self.n, -1)
+        self.messages = np.random.randint(10, size=(self.n, 6))
+        self.hidden = np.random.randn(self.n, 5, 256).astype(np.float32)
+
+    def _scipy_distances(self, x, s1, s2):
+        return np.array([scipy.spatial.distance.cosine(x[i].flatten(), x[j].flatten())
+            for i, j in zip(s1, s2)])
+
+    def test_sample_pairs_distinct(self):
+        s1, s2 = sample_pairs(1000, 5000)
+
+        self.assertEqual(len(s1), 5000)
+        self.assertFalse(np.any(s1 == s2))
+        self.assertTrue(np.all((s2 >= 0) & (s2 < 1000)))
+
+    def test_sample_pairs_upper_triangle(self):
+        s1, s2 = sample_pairs(4, 50)
+
+        self.assertEqual(len(s1), 6)
+        self.assertTrue(np.all(s1 < s2))
+
+    def test_cosine_distances(self):
+        for samples in [50, 5000]:
+            s1, s2 = sample_pairs(self.n, samples)
+
+            for x in [self.images, self.metadata, self.hidden]:
+                np.testing.assert_allclose(
+                    cosine_distances(x, s1, s2), self._scipy_distances(x, s1, s2), atol=1e-6)
+
+    def test_message_cosine_distances(self):
+        s1, s2 = sample_pairs(self.n, 500)
+
+        np.testing.assert_allclose(
+            message_cosine_distances(self.messages, s1, s2),
+            self._scipy_distances(one_hot(self.messages), s1, s2),
+            atol=1e-12)
+
+    def test_pearson_matches(self):
+        s1, s2 = sample_pairs(self.n, 500)
+
+        expected = scipy.stats.pearsonr(
+            self._scipy_distances(one_hot(self.messages), s1, s2),
+            self._scipy_distances(self.metadata, s1, s2))[0]
+        res = scipy.stats.pearsonr(
+            message_cosine_distances(self.messages, s1, s2),
+            cosine_distances(self.metadata, s1, s2))[0]
+
+        self.assertAlmostEqual(res, expected, places=9)
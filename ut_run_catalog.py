@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+
+from run_catalog import RunCatalog
+from run_store import RunStore
+
+
+def add_run(dumps_dir, folder_name, model_id, vocab_size, seed):
+    run_store = RunStore(os.path.join(dumps_dir, folder_name))
+    run_store.set_attributes(model_id=model_id, vocab_size=vocab_size, max_sentence_length=5,
+        vl_loss_weight=0.0, bound_weight=1.0, shapes_dataset='balanced', seed=seed)
+    run_store.save_arrays('test', 3, indices=np.arange(seed, seed + 4))
+    run_store.set_attributes(best_epoch=3)
+    return run_store
+
+
+class TestRunCatalog(unittest.TestCase):
+
+    def test_query(self):
+        with tempfile.TemporaryDirectory() as dumps_dir:
+            catalog = RunCatalog(dumps_dir)
+            catalog.add(add_run(dumps_dir, 'a_10_5', 'a', 10, 1))
+
+            # Another job adds its run to the same catalog
+            RunCatalog(dumps_dir).add(add_run(dumps_dir, 'b', 'b', 10, 2), add_run(dumps_dir, 'c', 'c', 25, 1))
+            catalog.add(add_run(dumps_dir, 'a_10_5', 'a', 10, 3))
+
+            catalog = RunCatalog(dumps_dir)
+            self.assertEqual(sorted(catalog.runs()), ['a', 'b', 'c'])
+            self.assertEqual(sorted(catalog.runs(vocab_size=10)), ['a', 'b'])
+            self.assertEqual(catalog.runs(vocab_size=10, seed=2), ['b'])
+            self.assertEqual(catalog.runs(shapes_dataset='mscoco'), [])
+
+            self.assertEqual(catalog.attributes('a')['seed'], 3)
+            np.testing.assert_array_equal(catalog.run_store('a').array('test', 'indices'), np.arange(3, 7))
+            self.assertEqual(catalog.array_file_name('a', 'test', 'indices'),
+                os.path.join(dumps_dir, 'a_10_5', 'test.indices.3.npy'))
+
+            with self.assertRaises(KeyError):
+                catalog.get('d')
+
+    def test_add_existing_runs(self):
+        with tempfile.TemporaryDirectory() as dumps_dir:
+            add_run(dumps_dir, 'a', 'a', 10, 1)
+            add_run(dumps_dir, 'b_25_5', 'b', 25, 1)
+            os.mkdir(os.path.join(dumps_dir, 'empty'))
+
+            RunCatalog(dumps_dir).add_existing_runs()
+            self.assertEqual(RunCatalog(dumps_dir).runs(vocab_size=25), ['b'])
@@ -0,0 +1,71 @@
+import tempfile
+import unittest
+import numpy as np
+import torch
+
+from run_store import RunStore
+from utils import AverageMeter
+
+
+def get_meter(values):
+    meter = AverageMeter()
+    for v in values:
+        meter.update(v)
+    return meter
+
+
+class TestRunStore(unittest.TestCase):
+
+    def test_metrics(self):
+        with tempfile.TemporaryDirectory() as folder:
+            run_store = RunStore(folder)
+            run_store.append_metrics('train', 0, loss=get_meter([1., 2.]), rsa_sr=get_meter([]))
+            run_store.append_metrics('train', 1, loss=get_meter([3.]), rsa_sr=get_meter([]))
+
+            run_store = RunStore(folder)
+            np.testing.assert_array_equal(run_store.metric('train', 'loss'), [1.5, 3.])
+            self.assertEqual(run_store.metric_epochs('train', 'loss'), [0, 1])
+
+            values = run_store.metric_values('train', 'loss')
+            np.testing.assert_array_equal(values[0], [1., 2.])
+            np.testing.assert_array_equal(values[1], [3.])
+            self.assertEqual([len(v) for v in run_store.metric_values('train', 'rsa_sr')], [0, 0])
+
+            run_store.set_metric('train', 'loss', {1: get_meter([5.]), 0: get_meter([4.])})
+            np.testing.assert_array_equal(np.concatenate(RunStore(folder).metric_values('train', 'loss')), [4., 5.])
+
+    def test_arrays(self):
+        with tempfile.TemporaryDirectory() as folder:
+            messages = torch.randint(25, size=(10, 6))
+            indices = torch.arange(40).view(10, 4) * 1000
+
+            run_store = RunStore(folder)
+            run_store.save_arrays('test', 3, messages=messages, indices=indices)
+            run_store.set_attributes(best_epoch=3)
+
+            run_store = RunStore(folder)
+            self.assertEqual(run_store.array('test', 'messages').dtype, np.int8)
+            self.assertEqual(run_store.array('test', 'indices').dtype, np.int32)
+            np.testing.assert_array_equal(run_store.array('test', 'messages', 3), messages.numpy())
+            np.testing.assert_array_equal(run_store.array('test', 'indices'), indices.numpy())
+            self.assertEqual(run_store.array_epochs('test', 'messages'), [3])
+
+    def test_messages(self):
+        bound_idx = 9
+        messages = torch.tensor([
+            [9, 1, 2, 9, 9],
+            [9, 3, 4, 5, 6],
+            [9, 9, 9, 9, 9]])
+
+        with tempfile.TemporaryDirectory() as folder:
+            run_store = RunStore(folder)
+            run_store.set_attributes(vocab_size=10, bound_idx=bound_idx)
+            run_store.save_messages('train', 0, messages)
+
+            run_store = RunStore(folder)
+            self.assertEqual(run_store.array('train', 'messages', 0).dtype, np.uint8)
+            np.testing.assert_array_equal(run_store.array('train', 'messages', 0), messages.numpy())
+            np.testing.assert_array_equal(run_store.array('train', 'lengths', 0), [2, 4, 0])
+
+            idx_to_word = [str(i) for i in range(9)] + ['<S>']
+            self.assertEqual(run_store.words('train', idx_to_word, 0), [['1', '2'], ['3', '4', '5', '6'], []])
@@ -0,0 +1,51 @@
+import unittest
+import numpy as np
+
+from ImageDataset import ImagesSampler, ImagesSamplerZeroShot
+
+
+class TestImagesSampler(unittest.TestCase):
+
+    def test_batches(self):
+        n, k, batch_size = 1000, 5, 128
+        sampler = ImagesSampler(range(n), k, shuffle=True, batch_size=batch_size, seed=42)
+        batches = list(sampler)
+
+        self.assertEqual(len(batches), len(sampler))
+        self.assertEqual(batches[0].shape, (batch_size, k + 1))
+        self.assertEqual(batches[-1].shape, (n % batch_size, k + 1))
+
+        indices = np.concatenate(batches)
+        self.assertEqual(sorted(indices[:, 0]), list(range(n)))
+
+        for row in indices:
+            self.assertEqual(len(set(row)), k + 1) # distinct and not the target
+
+    def test_drop_last(self):
+        sampler = ImagesSampler(range(1000), 3, shuffle=False, batch_size=128, drop_last=True, seed=0)
+        batches = list(sampler)
+
+        self.assertEqual(len(batches), 1000 // 128)
+        self.assertTrue(all(b.shape == (128, 4) for b in batches))
+        np.testing.assert_array_equal(batches[0][:, 0], np.arange(128))
+
+    def test_k_close_to_n(self):
+        n = 10
+        sampler = ImagesSampler(range(n), n - 1, shuffle=True, batch_size=4, seed=1)
+
+        for row in np.concatenate(list(sampler)):
+            self.assertEqual(sorted(row), list(range(n)))
+
+    def test_seed(self):
+        a = np.concatenate(list(ImagesSampler(range(100), 3, True, 16, seed=7)))
+        b = np.concatenate(list(ImagesSampler(range(100), 3, True, 16, seed=7)))
+
+        np.testing.assert_array_equal(a, b)
+
+    def test_zero_shot(self):
+        n, k = 50, 10
+        indices = np.concatenate(list(ImagesSamplerZeroShot(range(n), k, True, 8, seed=3)))
+
+        self.assertTrue(np.all((indices >= 0) & (indices < n)))
+        for row in indices:
+            self.assertEqual(len(set(row[1:])), k)
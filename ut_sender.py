@@ -2,22 +2,25 @@ import unittest
 import torch
 
 from model import Sender
+from benchmark import loop_sender_forward
 
 
 class TestSender(unittest.TestCase):
 
     @classmethod
     def setUpClass(self):
+        self.batch_size = 2
         self.sender = Sender(n_image_features=4096, vocab_size=3, 
-            embedding_dim=256, hidden_size=512, batch_size=2, 
+            embedding_dim=256, hidden_size=512,
             bound_idx=2, max_sentence_length=3,
+            vl_loss_weight=0.5, bound_weight=1.0,
             use_gpu=False, greedy=True)
 
     def test_calculate_seq_len_train(self):
         self.sender.train()
 
         initial_length = self.sender.max_sentence_length + 1
-        seq_lengths = torch.ones([self.sender.batch_size], dtype=torch.int64) * initial_length
+        seq_lengths = torch.ones([self.batch_size], dtype=torch.int64) * initial_length
 
         timestep = 1
         token = torch.tensor([
@@ -51,7 +54,7 @@ class TestSender(unittest.TestCase):
         self.sender.eval()
 
         initial_length = self.sender.max_sentence_length + 1
-        seq_lengths = torch.ones([self.sender.batch_size], dtype=torch.int64) * initial_length
+        seq_lengths = torch.ones([self.batch_size], dtype=torch.int64) * initial_length
 
         timestep = 1
         token = torch.tensor([1, 2])
@@ -71,6 +74,26 @@ class TestSender(unittest.TestCase):
         self.sender._calculate_seq_len(seq_lengths, token, initial_length, timestep)
         self.assertTrue(torch.all(torch.eq(seq_lengths, torch.tensor([3, 2]))))
 
-    
+    def _assert_forward_matches_loop(self):
+        t = torch.randn((self.batch_size, 4096))
+        word_counts = torch.tensor([3.0, 1.0, 2.0])
 
-    
\ No newline at end of file
+        torch.manual_seed(7)
+        res = self.sender(t, word_counts)
+        torch.manual_seed(7)
+        expected = loop_sender_forward(self.sender, t, word_counts)
+
+        for r, e in zip(res, expected):
+            self.assertTrue(torch.allclose(r, e, atol=1e-5))
+
+    def test_forward_matches_loop_train(self):
+        self.sender.train()
+        torch.nn.init.normal_(self.sender.linear_probs.weight, 0, 0.1)
+        self._assert_forward_matches_loop()
+
+    def test_forward_matches_loop_eval(self):
+        self.sender.eval()
+        self.sender.greedy = False
+        self._assert_forward_matches_loop()
+        self.sender.greedy = True
+        self._assert_forward_matches_loop()
@@ -1,5 +1,6 @@
 import torch
 import torch.nn as nn
+from torch.nn import functional as F
 import torchvision.models as models
 
 #Obverter's
@@ -60,6 +61,29 @@ class CNN(nn.Module):
 		return output
 
 
+class ImageTransform(nn.Module):
+	"""
+	Batched ToPILImage, Resize, ToTensor and Normalize from torchvision.transforms,
+	run on the device of the module and the images.
+	Takes uint8 images of shape ... x height x width x channels
+	and returns float images of shape ... x channels x size[0] x size[1]
+	"""
+	def __init__(self, size, mean, std):
+		super().__init__()
+		self.size = size
+		self.register_buffer('mean', torch.tensor(mean, dtype=torch.float32).view(1, -1, 1, 1))
+		self.register_buffer('std', torch.tensor(std, dtype=torch.float32).view(1, -1, 1, 1))
+
+	def forward(self, images):
+		leading_shape = images.shape[:-3]
+
+		x = images.reshape(-1, *images.shape[-3:]).permute(0, 3, 1, 2).contiguous().float()
+		x = F.interpolate(x, size=self.size, mode='bilinear', align_corners=False)
+		x = (x / 255 - self.mean) / self.std
+
+		return x.view(*leading_shape, *x.shape[1:])
+
+
 
 
 